@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Synthetic system tree for benchmarks.
+
+Builds <root>/sys, <root>/proc and <root>/lib/modules laid out the way
+libmontecarlo reads them, so MONTECARLO_ROOT=<root> exercises the real code
+paths against 100 or 10,000 devices without touching the host.
+
+Usage: fakesys.py <root> [--devices N] [--modules N] [--kernel VER]
+"""
+import argparse
+import os
+import shutil
+import struct
+
+KERNEL = "6.1.0-mcbench"
+
+# Share of PCI functions that are bridges / SMBus (filtered as infrastructure)
+PCI_CLASSES = ["0x020000", "0x030000", "0x040300", "0x060400", "0x0c0500", "0x010802"]
+USB_PRODUCTS = ["Optical Mouse", "USB Keyboard", "HD Webcam", "Audio Adapter",
+                "Flash Drive", "Bluetooth Radio", "Wireless LAN"]
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def _link(target, path):
+    """Relative symlink path -> target, like sysfs uses."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.symlink(os.path.relpath(target, os.path.dirname(path)), path)
+
+
+def _attrs(dev, **attrs):
+    os.makedirs(dev, exist_ok=True)
+    for name, value in attrs.items():
+        with open(os.path.join(dev, name), "w") as f:
+            f.write(f"{value}\n")
+
+
+def _ko(path, modinfo):
+    """Minimal ELF64 relocatable object carrying only a .modinfo section."""
+    info = b"".join(f"{k}={v}".encode() + b"\0" for k, v in modinfo)
+    shstrtab = b"\0.modinfo\0.shstrtab\0"
+
+    ehsize, shentsize = 64, 64
+    info_off = ehsize
+    shstr_off = info_off + len(info)
+    sh_off = (shstr_off + len(shstrtab) + 7) & ~7
+
+    ident = b"\x7fELF" + bytes([2, 1, 1]) + bytes(9)
+    header = ident + struct.pack("<HHIQQQIHHHHHH", 1, 62, 1, 0, 0, sh_off, 0,
+                                 ehsize, 0, 0, shentsize, 3, 2)
+
+    def shdr(name, type_, off, size):
+        return struct.pack("<IIQQQQIIQQ", name, type_, 0, 0, off, size, 0, 0, 1, 0)
+
+    body = header + info + shstrtab
+    body += bytes(sh_off - len(body))
+    body += shdr(0, 0, 0, 0)
+    body += shdr(1, 1, info_off, len(info))       # .modinfo, SHT_PROGBITS
+    body += shdr(10, 3, shstr_off, len(shstrtab))  # .shstrtab, SHT_STRTAB
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(body)
+
+
+class Tree:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.sys = os.path.join(self.root, "sys")
+
+    def path(self, *parts):
+        return os.path.join(self.root, *[p.lstrip("/") for p in parts])
+
+    def bus(self, bus):
+        """Create /sys/bus/<bus>/{devices,drivers} and return its path."""
+        base = self.path("sys/bus", bus)
+        os.makedirs(os.path.join(base, "devices"), exist_ok=True)
+        os.makedirs(os.path.join(base, "drivers"), exist_ok=True)
+        return base
+
+    def driver(self, bus, name):
+        d = os.path.join(self.bus(bus), "drivers", name)
+        if not os.path.isdir(d):
+            _attrs(d, bind="", unbind="", new_id="", remove_id="", uevent="")
+            _link(self.path("sys/module", name), os.path.join(d, "module"))
+            _link(d, self.path("sys/module", name, "drivers", f"{bus}:{name}"))
+        return d
+
+    def device(self, devpath, bus, devtype=None, driver=None, **attrs):
+        """A device directory under /sys/devices, registered on `bus`."""
+        dev = self.path("sys/devices", devpath)
+        uevent = f"DEVTYPE={devtype}" if devtype else ""
+        _attrs(dev, uevent=uevent, **attrs)
+        _link(self.bus(bus), os.path.join(dev, "subsystem"))
+        _link(dev, os.path.join(self.bus(bus), "devices", os.path.basename(dev)))
+        if driver:
+            drv = self.driver(bus, driver)
+            _link(drv, os.path.join(dev, "driver"))
+            _link(dev, os.path.join(drv, os.path.basename(dev)))
+        return dev
+
+
+def module_names(count):
+    return [f"mcbench_{i:05d}" for i in range(count)]
+
+
+def build(root, devices=100, modules=200, kernel=KERNEL):
+    """Build the tree. Returns a dict describing what was generated."""
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    t = Tree(root)
+
+    _write(t.path("proc/sys/kernel/osrelease"), kernel + "\n")
+
+    names = module_names(max(modules, 1))
+    loaded = names[: max(1, len(names) // 2)]
+    drivers = loaded[: max(1, len(loaded) // 2)]
+
+    # PCI root complex and the USB host controller every USB device hangs off
+    t.device("pci0000:00/0000:00:14.0", "pci", driver="xhci_hcd",
+             vendor="0x8086", device="0xa36d", **{"class": "0x0c0330"})
+    t.device("pci0000:00/0000:00:14.0/usb1", "usb", devtype="usb_device", driver="usb",
+             idVendor="1d6b", idProduct="0002", bDeviceClass="09", product="xHCI Host Controller")
+
+    n_pci = devices // 2
+    n_usb = devices - n_pci
+    bound = {}
+
+    for i in range(n_pci):
+        slot = f"0000:{1 + i // 256:02x}:{(i // 8) % 32:02x}.{i % 8}"
+        driver = drivers[i % len(drivers)] if i % 3 else None
+        pci_class = PCI_CLASSES[i % len(PCI_CLASSES)]
+        t.device(f"pci0000:00/{slot}", "pci", driver=driver,
+                 vendor="0x8086", device=f"0x{i & 0xffff:04x}",
+                 modalias=(f"pci:v00008086d{i & 0xffff:08X}sv00000000sd00000000"
+                           f"bc{pci_class[2:4].upper()}sc{pci_class[4:6].upper()}i{pci_class[6:8].upper()}"),
+                 **{"class": pci_class})
+        if driver:
+            bound.setdefault(driver, []).append(slot)
+
+    for i in range(n_usb):
+        port = f"1-{i + 1}"
+        usbdev = t.device(f"pci0000:00/0000:00:14.0/usb1/{port}", "usb",
+                          devtype="usb_device", driver="usb",
+                          idVendor=f"{0x1000 + i % 0x800:04x}", idProduct=f"{i & 0xffff:04x}",
+                          bDeviceClass="00", manufacturer="Bench",
+                          product=USB_PRODUCTS[i % len(USB_PRODUCTS)])
+        driver = drivers[(i + 1) % len(drivers)] if i % 4 else None
+        intf = f"{port}:1.0"
+        t.device(os.path.relpath(os.path.join(usbdev, intf), t.path("sys/devices")), "usb",
+                 devtype="usb_interface", driver=driver,
+                 bInterfaceClass="03", bInterfaceNumber="00",
+                 modalias=(f"usb:v{0x1000 + i % 0x800:04X}p{i & 0xffff:04X}d0100"
+                           "dc00dsc00dp00ic03isc00ip00in00"))
+        if driver:
+            bound.setdefault(driver, []).append(intf)
+
+    # Other buses the candidate-driver scan walks
+    for bus in ("usb-serial", "hid", "i2c", "sdio", "scsi", "pcmcia"):
+        t.bus(bus)
+    for i, name in enumerate(loaded):
+        t.driver(("pci", "usb", "hid", "i2c")[i % 4], name)
+
+    # Loaded modules: every 5th one depends on its predecessor
+    holders = {}
+    for i, name in enumerate(loaded):
+        if i % 5 == 4:
+            holders.setdefault(loaded[i - 1], []).append(name)
+
+    lines = []
+    for name in loaded:
+        users = holders.get(name, [])
+        refcnt = len(users) + len(bound.get(name, []))
+        used_by = "".join(u + "," for u in users) or "-"
+        lines.append(f"{name} 16384 {refcnt} {used_by} Live 0x0000000000000000")
+        mod = t.path("sys/module", name)
+        _attrs(mod, refcnt=str(refcnt), initstate="live", coresize="16384")
+        os.makedirs(os.path.join(mod, "holders"), exist_ok=True)
+        for u in users:
+            _link(t.path("sys/module", u), os.path.join(mod, "holders", u))
+    _write(t.path("proc/modules"), "\n".join(lines) + "\n")
+
+    # Installed modules: loaded and not-yet-loaded ones, with real .modinfo
+    kdir = t.path("lib/modules", kernel)
+    dep_lines, alias_lines = [], []
+    for i, name in enumerate(names):
+        subdir = ("usb", "pci", "hid", "net", "i2c")[i % 5]
+        rel = f"kernel/drivers/{subdir}/{name.replace('_', '-')}.ko"
+        alias = (f"pci:v00008086d{i & 0xffff:08X}sv*sd*bc*sc*i*" if subdir in ("pci", "net")
+                 else f"usb:v{0x1000 + i % 0x800:04X}p{i & 0xffff:04X}d*dc*dsc*dp*ic*isc*ip*in*")
+        depends = loaded[i - 1] if name in loaded and i % 5 == 4 else ""
+        _ko(os.path.join(kdir, rel), [("license", "GPL"), ("alias", alias),
+                                      ("depends", depends), ("name", name),
+                                      ("vermagic", f"{kernel} SMP mod_unload")])
+        dep = f"kernel/drivers/{subdir}/{depends.replace('_', '-')}.ko" if depends else ""
+        dep_lines.append(f"{rel}: {dep}".rstrip())
+        alias_lines.append(f"alias {alias} {name}")
+    _write(os.path.join(kdir, "modules.dep"), "\n".join(dep_lines) + "\n")
+    _write(os.path.join(kdir, "modules.alias"), "\n".join(alias_lines) + "\n")
+
+    return {"root": t.root, "kernel": kernel, "devices": devices,
+            "modules": len(names), "loaded": len(loaded)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("root")
+    ap.add_argument("--devices", type=int, default=100)
+    ap.add_argument("--modules", type=int, default=200)
+    ap.add_argument("--kernel", default=KERNEL)
+    args = ap.parse_args()
+
+    info = build(args.root, args.devices, args.modules, args.kernel)
+    print(f"[+] {info['root']}: {info['devices']} devices, "
+          f"{info['modules']} modules ({info['loaded']} loaded), kernel {info['kernel']}")
+
+
+if __name__ == "__main__":
+    main()
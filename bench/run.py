@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Montecarlo benchmark suite.
+
+Generates synthetic trees (bench/fakesys.py), points libmontecarlo and the
+Python package at them through MONTECARLO_ROOT and times the hot paths:
+
+  list_all_devices   mc_list_all_devices
+  scan_thread        dashboard scan (MontecarloUI._scan_thread)
+  refresh_repo       repository scan (MontecarloUI._refresh_repo_thread)
+  candidate_drivers  mc_list_candidate_drivers
+  autofind_sim       Auto-Find loop with load/unload/sleep left out
+
+Results go to bench/results/<version>.json; the previous results file (or
+--baseline) is printed alongside for regression comparison.
+
+Usage: MONTECARLO_DEV=1 bench/run.py [--sizes 100,1000,10000] [--repeat 5]
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, "desktop"))
+
+import fakesys  # noqa: E402
+import montecarlo  # noqa: E402
+from montecarlo import dashboard, repository  # noqa: E402
+from montecarlo._binding import MCDeviceInfo, DriverName  # noqa: E402
+
+
+def version_label():
+    """git describe of the checkout, else 'unknown'."""
+    try:
+        out = subprocess.run(["git", "-C", BASE_DIR, "describe", "--always", "--dirty"],
+                             capture_output=True, text=True, timeout=5)
+        if out.returncode == 0 and out.stdout.strip():
+            return out.stdout.strip()
+    except (OSError, subprocess.TimeoutExpired):
+        pass
+    return "unknown"
+
+
+# --- BENCHMARKED OPERATIONS ---
+
+def bench_list_all_devices(size):
+    buf = (MCDeviceInfo * (size + 64))()
+    return montecarlo.lib().mc_list_all_devices(buf, len(buf))
+
+
+def bench_scan_thread(size):
+    return len(dashboard.scan_rows())
+
+
+def bench_refresh_repo(size):
+    return len(repository.scan_repository(montecarlo.loaded_modules()))
+
+
+def bench_candidate_drivers(size):
+    buf = (DriverName * 4096)()
+    return montecarlo.lib().mc_list_candidate_drivers(buf, len(buf))
+
+
+def bench_autofind_sim(size):
+    """Per-candidate checks of run_montecarlo_logic, nothing loaded or slept."""
+    libmc = montecarlo.lib()
+    target = next((d for d in montecarlo.iter_devices() if not d.bound), None)
+    if target is None:
+        return 0
+
+    enc_syspath = target.syspath.encode("utf-8")
+    checked = 0
+    for name in montecarlo.iter_candidate_drivers():
+        name_bytes = name.encode("utf-8")
+        libmc.mc_dev_has_driver(enc_syspath)
+        libmc.mc_get_module_refcount(name_bytes)
+        libmc.mc_driver_is_in_use(name_bytes)
+        checked += 1
+    return checked
+
+
+BENCHMARKS = [
+    ("list_all_devices", bench_list_all_devices),
+    ("scan_thread", bench_scan_thread),
+    ("refresh_repo", bench_refresh_repo),
+    ("candidate_drivers", bench_candidate_drivers),
+    ("autofind_sim", bench_autofind_sim),
+]
+
+
+def time_it(fn, size, repeat):
+    samples = []
+    items = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = fn(size)
+        samples.append(time.perf_counter() - start)
+    return {
+        "items": items,
+        "min_ms": min(samples) * 1000,
+        "median_ms": statistics.median(samples) * 1000,
+    }
+
+
+def run(sizes, repeat, only, workdir):
+    results = {}
+    for size in sizes:
+        root = os.path.join(workdir, f"root-{size}")
+        fakesys.build(root, devices=size, modules=size)
+        montecarlo.set_root(root)
+
+        results[str(size)] = {}
+        for name, fn in BENCHMARKS:
+            if only and name not in only:
+                continue
+            r = time_it(fn, size, repeat)
+            results[str(size)][name] = r
+            print(f"  {size:>6} {name:<18} {r['median_ms']:10.2f} ms  ({r['items']} items)")
+    montecarlo.set_root("")
+    return results
+
+
+# --- RESULTS ---
+
+def previous_results(current):
+    files = sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")), key=os.path.getmtime)
+    files = [f for f in files if os.path.abspath(f) != os.path.abspath(current)]
+    return files[-1] if files else None
+
+
+def compare(results, baseline_file):
+    with open(baseline_file) as f:
+        baseline = json.load(f)["results"]
+
+    print(f"\nComparison with {os.path.basename(baseline_file)} (median):")
+    for size, benches in results.items():
+        for name, r in benches.items():
+            old = baseline.get(size, {}).get(name)
+            if not old:
+                continue
+            delta = (r["median_ms"] - old["median_ms"]) / old["median_ms"] * 100 if old["median_ms"] else 0.0
+            print(f"  {size:>6} {name:<18} {old['median_ms']:10.2f} -> {r['median_ms']:10.2f} ms  ({delta:+.1f}%)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Montecarlo benchmark suite")
+    ap.add_argument("--sizes", default="100,1000,10000",
+                    help="comma-separated device/module counts (default: %(default)s)")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--only", default="", help="comma-separated benchmark names")
+    ap.add_argument("--version", default=None, help="results label (default: git describe)")
+    ap.add_argument("--baseline", default=None, help="results file to compare against")
+    ap.add_argument("--no-save", action="store_true")
+    args = ap.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    only = {s for s in args.only.split(",") if s}
+    label = args.version or version_label()
+
+    print(f"[*] Montecarlo bench {label} ({montecarlo.lib_path()})")
+    with tempfile.TemporaryDirectory(prefix="montecarlo-bench-") as workdir:
+        results = run(sizes, args.repeat, only, workdir)
+
+    out_file = os.path.join(RESULTS_DIR, f"{label}.json")
+    baseline = args.baseline or previous_results(out_file)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        with open(out_file, "w") as f:
+            json.dump({
+                "version": label,
+                "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "host": platform.node(),
+                "python": platform.python_version(),
+                "repeat": args.repeat,
+                "results": results,
+            }, f, indent=2)
+        print(f"\n[+] Results saved to {out_file}")
+
+    if baseline and os.path.exists(baseline):
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
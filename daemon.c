@@ -1,3 +1,4 @@
+#define _GNU_SOURCE
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
@@ -6,10 +7,13 @@
 #include <libudev.h>
 #include <sys/socket.h>
 #include <sys/un.h>
+#include <sys/epoll.h>
+#include <sys/wait.h>
 #include <sys/stat.h>
 #include <fcntl.h>
 #include <signal.h>
 #include <errno.h>
+#include <time.h>
 
 #include "heads/libmontecarlo.h"
 #include "heads/version.h"
@@ -18,7 +22,24 @@ static int server_fd = -1;
 static char current_syspath[1024] = {0};
 static char socket_path[256] = {0};
 
-static void launch_ui(void)
+static void broadcast_event(const char *event, const char *syspath);
+
+static int activate_ui_clients(const char *syspath);
+
+/* UI we forked and haven't heard from yet */
+#define UI_STARTUP_MS 20000
+static pid_t ui_pid = 0;
+static long long ui_launched_ms = 0;
+
+static long long now_ms(void)
+{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (long long)ts.tv_sec * 1000 + ts.tv_nsec / 1000000;
+}
+
+/* Cold start: only when no UI is connected or starting */
+static void launch_ui(const char *syspath)
 {
     pid_t pid = fork();
     if (pid < 0)
@@ -33,17 +54,36 @@ static void launch_ui(void)
 
         if (!getenv("MONTECARLO_DEV"))
         {
-            execlp("python3", "python3", "/usr/share/montecarlo/ui.py", NULL);
+            execlp("python3", "python3", "/usr/share/montecarlo/ui.py", syspath, NULL);
             perror("[daemon] execlp failed");
             exit(1);
             return;
         }
 
         printf("[daemon] Launching UI in DEV mode (cwd/desktop)\n");
-        execlp("python3", "python3", "desktop/ui.py", NULL);
+        execlp("python3", "python3", "desktop/ui.py", syspath, NULL);
+        perror("[daemon] execlp failed");
+        exit(1);
+    }
+
+    ui_pid = pid;
+    ui_launched_ms = now_ms();
+}
+
+/* Reap exited UIs; true while a launched UI is still coming up */
+static bool ui_starting(void)
+{
+    pid_t pid;
+    while ((pid = waitpid(-1, NULL, WNOHANG)) > 0)
+    {
+        if (pid == ui_pid)
+            ui_pid = 0;
     }
+
+    return ui_pid > 0 && now_ms() - ui_launched_ms < UI_STARTUP_MS;
 }
 
+/* UIs that predate the hello handshake only leave a PID file */
 static bool ui_already_running(void)
 {
     FILE *pf = fopen("/tmp/montecarlo_ui.pid", "r");
@@ -51,91 +91,705 @@ static bool ui_already_running(void)
     if (!pf)
         return false;
 
-    int pid;
-    bool is_running = true;
+    int pid = 0;
+    bool is_running = false;
 
-    if (fscanf(pf, "%d", &pid) == true)
-    {
-        if (kill(pid, 0) == false)
-            is_running = true;
-    }
+    if (fscanf(pf, "%d", &pid) == 1 && pid > 0)
+        is_running = (kill(pid, 0) == 0 || errno == EPERM);
 
     fclose(pf);
-    return is_running = true;
+    return is_running;
 }
 
+/* A classified device needs a driver: remember it and bring up the UI */
 static void handle_device_add(const char *syspath)
 {
-    printf("[daemon] add: %s\n", syspath);
+    strncpy(current_syspath, syspath, sizeof(current_syspath) - 1);
+    broadcast_event("add", syspath);
 
-    if (mc_is_excluded_device(syspath))
+    /* A running UI only needs to be told which device to show */
+    if (activate_ui_clients(syspath) > 0)
     {
-        printf("[daemon] Ignoring Mass Storage device: %s\n", syspath);
+        printf("[daemon] UI activated for %s\n", syspath);
         return;
     }
 
-    if (mc_dev_has_driver(syspath))
+    if (ui_starting())
     {
-        printf("[daemon] Driver already present. Ignoring.\n");
-        current_syspath[0] = '\0';
+        printf("[daemon] UI is starting; it gets the device on connect.\n");
         return;
     }
 
-    printf("[daemon] No driver found. Triggering UI.\n");
-
-    strncpy(current_syspath, syspath, sizeof(current_syspath) - 1);
-
     if (ui_already_running())
     {
         printf("[daemon] UI already running (PID found). Skipping launch.\n");
         return;
     }
 
-    launch_ui();
+    launch_ui(syspath);
+}
+
+/*
+ * EVENT PIPELINE
+ * A single attach produces a burst of events (usb_device, every interface,
+ * hid/scsi children). Events are grouped by their parent device and held
+ * for a short quiet window; the group is then classified once.
+ */
+#define DEBOUNCE_MS 250      // quiet time before a group is classified
+#define MAX_HOLD_MS 1500     // never hold a group longer than this
+#define MAX_PENDING 64       // parent devices in flight
+#define MAX_MEMBERS 16       // syspaths remembered per parent
+#define RCVBUF_SIZE (8 * 1024 * 1024)
+
+struct pending
+{
+    bool used;
+    char key[512];                       // parent device syspath
+    char members[MAX_MEMBERS][512];      // child syspaths that saw "add"
+    int member_count;
+    int events;
+    long long first_ms;
+    long long deadline_ms;
+};
+
+static struct pending pending[MAX_PENDING];
+
+static struct
+{
+    unsigned long received;
+    unsigned long coalesced;
+    unsigned long classified;
+    unsigned long dropped;      // ENOBUFS on the netlink socket
+    unsigned long overflowed;   // pending table full
+} stats;
+
+/* Parent used for grouping: the USB device, else the PCI function, else itself */
+static const char *event_key(struct udev_device *dev)
+{
+    struct udev_device *parent;
+
+    parent = udev_device_get_parent_with_subsystem_devtype(dev, "usb", "usb_device");
+    if (parent)
+        return udev_device_get_syspath(parent);
+
+    const char *devtype = udev_device_get_devtype(dev);
+    const char *subsystem = udev_device_get_subsystem(dev);
+    if (subsystem && devtype && strcmp(subsystem, "usb") == 0 && strcmp(devtype, "usb_device") == 0)
+        return udev_device_get_syspath(dev);
+
+    parent = udev_device_get_parent_with_subsystem_devtype(dev, "pci", NULL);
+    if (parent)
+        return udev_device_get_syspath(parent);
+
+    return udev_device_get_syspath(dev);
+}
+
+static struct pending *pending_find(const char *key)
+{
+    for (int i = 0; i < MAX_PENDING; i++)
+    {
+        if (pending[i].used && strcmp(pending[i].key, key) == 0)
+            return &pending[i];
+    }
+    return NULL;
+}
+
+static void pending_queue(const char *key, const char *syspath)
+{
+    long long now = now_ms();
+    struct pending *p = pending_find(key);
+
+    if (!p)
+    {
+        for (int i = 0; i < MAX_PENDING && !p; i++)
+        {
+            if (!pending[i].used)
+                p = &pending[i];
+        }
+        if (!p)
+        {
+            stats.overflowed++;
+            fprintf(stderr, "[daemon] Event queue full, dropping %s\n", syspath);
+            return;
+        }
+        memset(p, 0, sizeof(*p));
+        p->used = true;
+        snprintf(p->key, sizeof(p->key), "%s", key);
+        p->first_ms = now;
+    }
+    else
+    {
+        stats.coalesced++;
+    }
+
+    p->events++;
+
+    bool known = false;
+    for (int i = 0; i < p->member_count; i++)
+    {
+        if (strcmp(p->members[i], syspath) == 0)
+            known = true;
+    }
+    if (!known && p->member_count < MAX_MEMBERS)
+        snprintf(p->members[p->member_count++], sizeof(p->members[0]), "%s", syspath);
+
+    p->deadline_ms = now + DEBOUNCE_MS;
+    if (p->deadline_ms > p->first_ms + MAX_HOLD_MS)
+        p->deadline_ms = p->first_ms + MAX_HOLD_MS;
+}
+
+/* Returns true if path is key itself or lives below it */
+static bool path_under(const char *path, const char *key)
+{
+    size_t n = strlen(key);
+    return strncmp(path, key, n) == 0 && (path[n] == '\0' || path[n] == '/');
 }
 
-void handle_device_remove(const char *syspath)
+/* Classify a settled group once; trigger the UI for the first unbound member */
+static void classify(struct pending *p)
 {
-    if(!syspath)
+    stats.classified++;
+    printf("[daemon] add: %s (%d events)\n", p->key, p->events);
+
+    const char *target = NULL;
+    for (int i = 0; i < p->member_count; i++)
+    {
+        const char *syspath = p->members[i];
+
+        if (mc_is_excluded_device(syspath))
+        {
+            printf("[daemon] Ignoring Mass Storage device: %s\n", syspath);
+            return;
+        }
+
+        // The usb_device itself always has the "usb" driver; its interfaces matter
+        if (strcmp(syspath, p->key) == 0 && p->member_count > 1)
+            continue;
+
+        if (!target && !mc_dev_has_driver(syspath))
+            target = syspath;
+    }
+
+    if (!target)
+    {
+        printf("[daemon] Driver already present. Ignoring.\n");
+        if (path_under(current_syspath, p->key))
+            current_syspath[0] = '\0';
         return;
-    
-    if(strcmp(syspath, current_syspath) == 0)
+    }
+
+    printf("[daemon] No driver found for %s. Triggering UI.\n", target);
+    handle_device_add(target);
+}
+
+/* Classify every group whose window has closed */
+static void pending_flush(bool all)
+{
+    long long now = now_ms();
+    for (int i = 0; i < MAX_PENDING; i++)
+    {
+        if (pending[i].used && (all || pending[i].deadline_ms <= now))
+        {
+            classify(&pending[i]);
+            pending[i].used = false;
+        }
+    }
+}
+
+/* Milliseconds until the next group is due, -1 if none */
+static int pending_timeout(void)
+{
+    long long next = -1;
+    for (int i = 0; i < MAX_PENDING; i++)
+    {
+        if (pending[i].used && (next < 0 || pending[i].deadline_ms < next))
+            next = pending[i].deadline_ms;
+    }
+    if (next < 0)
+        return -1;
+
+    long long wait = next - now_ms();
+    return wait > 0 ? (int)wait : 0;
+}
+
+/* After lost events, queue every unbound device we'd have heard about */
+static int resync_cb(const mc_device_info_t *info, void *user)
+{
+    (void)user;
+    if (strcmp(info->driver, "None") == 0)
+        pending_queue(info->syspath, info->syspath);
+    return 0;
+}
+
+static void handle_device_remove(const char *key, const char *syspath)
+{
+    struct pending *p = pending_find(key);
+
+    // The parent went away: forget the whole group
+    if (p && strcmp(key, syspath) == 0)
+        p->used = false;
+
+    if (current_syspath[0] != '\0' && path_under(current_syspath, syspath))
+    {
         current_syspath[0] = '\0';
+        broadcast_event("remove", syspath);
+    }
 }
 
-/* Get secure socket path for current user */
-void get_socket_path(char *buf, size_t bufsize)
+static void handle_udev_events(struct udev_monitor *mon)
+{
+    /* Drain everything queued on the netlink socket */
+    for (;;)
+    {
+        errno = 0;
+        struct udev_device *dev = udev_monitor_receive_device(mon);
+
+        if (!dev)
+        {
+            if (errno == ENOBUFS)
+            {
+                stats.dropped++;
+                fprintf(stderr, "[daemon] udev receive buffer overrun (%lu so far), resyncing\n",
+                        stats.dropped);
+                mc_foreach_device(resync_cb, NULL);
+                continue;
+            }
+            break;
+        }
+
+        stats.received++;
+
+        const char *action = udev_device_get_action(dev);
+        const char *syspath = udev_device_get_syspath(dev);
+
+        if (action && syspath)
+        {
+            const char *key = event_key(dev);
+
+            if (strcmp(action, "add") == 0 || strcmp(action, "bind") == 0)
+                pending_queue(key, syspath);
+            else if (strcmp(action, "remove") == 0)
+                handle_device_remove(key, syspath);
+        }
+
+        udev_device_unref(dev);
+    }
+}
+
+/*
+ * CLIENTS
+ * Every connection is a subscriber: it gets the current target on connect
+ * and every event after that, one JSON object per line. Sockets are
+ * non-blocking and each client has a bounded outbound queue, so a client
+ * that stops reading only ever hurts itself.
+ */
+#define MAX_CLIENTS 256
+#define CLIENT_QUEUE_MAX (64 * 1024)   // bytes queued per client
+#define CLIENT_LINE_MAX 1024           // longest request line accepted
+#define SLOW_CLIENT_MS 10000           // full queue for this long = disconnect
+
+struct client
 {
-    const char *runtime_dir = getenv("XDG_RUNTIME_DIR");
-    uid_t uid = getuid();
+    int fd;
+    char out[CLIENT_QUEUE_MAX];
+    size_t out_head;            // first unsent byte
+    size_t out_len;             // end of queued data
+    char in[CLIENT_LINE_MAX];
+    size_t in_len;
+    unsigned long dropped;      // messages dropped since the queue last drained
+    long long stalled_since;    // when the first message was dropped, 0 = not stalled
+    bool want_write;            // EPOLLOUT armed
+    bool is_ui;                 // said {"cmd": "hello", "role": "ui"}
+    bool closed;
+    struct client *next_closed; // graveyard link
+};
+
+static int epoll_fd = -1;
+static struct client *clients[MAX_CLIENTS];
+static int client_count;
 
-    /* Prefer XDG_RUNTIME_DIR, fallback to /run/user/$UID, then /tmp */
-    if (runtime_dir && runtime_dir[0] != '\0')
+/*
+ * Closed clients are freed after the current batch of epoll events (later
+ * events of the batch may still point at them). A list, not an array: one
+ * batch can accept and close more than MAX_CLIENTS clients.
+ */
+static struct client *graveyard;
+
+static void client_close(struct client *c)
+{
+    if (c->closed)
+        return;
+
+    for (int i = 0; i < client_count; i++)
     {
-        snprintf(buf, bufsize, "%s/montecarlo.sock", runtime_dir);
+        if (clients[i] == c)
+        {
+            clients[i] = clients[--client_count];
+            break;
+        }
     }
-    else
+    epoll_ctl(epoll_fd, EPOLL_CTL_DEL, c->fd, NULL);
+    close(c->fd);
+    c->closed = true;
+    c->next_closed = graveyard;
+    graveyard = c;
+}
+
+static bool client_alive(const struct client *c)
+{
+    return !c->closed;
+}
+
+static void free_closed_clients(void)
+{
+    while (graveyard)
+    {
+        struct client *c = graveyard;
+        graveyard = c->next_closed;
+        free(c);
+    }
+}
+
+static void client_want_write(struct client *c, bool on)
+{
+    if (c->want_write == on)
+        return;
+
+    struct epoll_event ev = { .events = EPOLLIN | (on ? EPOLLOUT : 0), .data.ptr = c };
+    if (epoll_ctl(epoll_fd, EPOLL_CTL_MOD, c->fd, &ev) == 0)
+        c->want_write = on;
+}
+
+static bool client_queue_raw(struct client *c, const char *msg, size_t len)
+{
+    /* Reclaim space already sent */
+    if (c->out_head > 0 && c->out_len + len > CLIENT_QUEUE_MAX)
+    {
+        memmove(c->out, c->out + c->out_head, c->out_len - c->out_head);
+        c->out_len -= c->out_head;
+        c->out_head = 0;
+    }
+
+    if (c->out_len + len > CLIENT_QUEUE_MAX)
+        return false;
+
+    memcpy(c->out + c->out_len, msg, len);
+    c->out_len += len;
+    return true;
+}
+
+/* Send what the socket takes. Returns -1 if the client is gone. */
+static int client_flush(struct client *c)
+{
+    while (c->out_head < c->out_len)
+    {
+        ssize_t n = send(c->fd, c->out + c->out_head, c->out_len - c->out_head,
+                         MSG_NOSIGNAL | MSG_DONTWAIT);
+        if (n < 0)
+        {
+            if (errno == EINTR)
+                continue;
+            if (errno == EAGAIN || errno == EWOULDBLOCK)
+                break;
+            return -1;
+        }
+        c->out_head += n;
+    }
+
+    if (c->out_head == c->out_len)
+    {
+        c->out_head = c->out_len = 0;
+
+        /* Caught up after dropping: tell it to resync */
+        if (c->dropped)
+        {
+            char msg[96];
+            int len = snprintf(msg, sizeof(msg), "{\"event\": \"lagged\", \"dropped\": %lu}\n", c->dropped);
+            c->dropped = 0;
+            c->stalled_since = 0;
+            client_queue_raw(c, msg, len);
+            return client_flush(c);
+        }
+    }
+
+    client_want_write(c, c->out_head < c->out_len);
+    return 0;
+}
+
+/* Queue msg and flush; false when it was dropped (queue full) or the client was closed */
+static bool client_send(struct client *c, const char *msg)
+{
+    if (!client_queue_raw(c, msg, strlen(msg)))
+    {
+        if (c->dropped++ == 0)
+            c->stalled_since = now_ms();
+        return false;
+    }
+    if (client_flush(c) < 0)
     {
-        /* Check if /run/user/$UID exists */
-        char runtime_path[256];
-        snprintf(runtime_path, sizeof(runtime_path), "/run/user/%d", uid);
+        client_close(c);
+        return false;
+    }
+    return true;
+}
 
-        if (access(runtime_path, W_OK) == 0)
+/* Append s to buf as a JSON string literal */
+static void json_append(char *buf, size_t len, const char *s)
+{
+    size_t n = strlen(buf);
+    if (n + 1 < len)
+        buf[n++] = '"';
+    for (; *s && n + 7 < len; s++)
+    {
+        unsigned char ch = (unsigned char)*s;
+        if (ch == '"' || ch == '\\')
         {
-            snprintf(buf, bufsize, "%s/montecarlo.sock", runtime_path);
+            buf[n++] = '\\';
+            buf[n++] = ch;
         }
+        else if (ch < 0x20)
+            n += snprintf(buf + n, len - n, "\\u%04x", ch);
         else
+            buf[n++] = ch;
+    }
+    if (n + 1 < len)
+        buf[n++] = '"';
+    buf[n] = '\0';
+}
+
+static void format_event(char *buf, size_t len, const char *event, const char *syspath)
+{
+    snprintf(buf, len, "{\"event\": \"%s\"", event);
+    if (syspath)
+    {
+        strncat(buf, ", \"syspath\": ", len - strlen(buf) - 1);
+        json_append(buf, len - 3, syspath);
+    }
+    strncat(buf, "}\n", len - strlen(buf) - 1);
+}
+
+static void broadcast_event(const char *event, const char *syspath)
+{
+    char msg[1200];
+    format_event(msg, sizeof(msg), event, syspath);
+
+    /* client_send may close (and swap out) the current entry */
+    for (int i = client_count - 1; i >= 0; i--)
+    {
+        if (i < client_count)
+            client_send(clients[i], msg);
+    }
+}
+
+static int ui_client_count(void)
+{
+    int n = 0;
+    for (int i = 0; i < client_count; i++)
+        n += clients[i]->is_ui;
+    return n;
+}
+
+/* Send {"event": "activate"} to every UI client. Returns how many it was queued for. */
+static int activate_ui_clients(const char *syspath)
+{
+    char msg[1200];
+    format_event(msg, sizeof(msg), "activate", syspath);
+
+    int sent = 0;
+    for (int i = client_count - 1; i >= 0; i--)
+    {
+        if (i < client_count && clients[i]->is_ui && client_send(clients[i], msg))
+            sent++;
+    }
+    return sent;
+}
+
+static void send_status(struct client *c)
+{
+    char msg[1600];
+    snprintf(msg, sizeof(msg),
+             "{\"event\": \"status\", \"clients\": %d, \"ui\": %d, \"received\": %lu, \"coalesced\": %lu, "
+             "\"classified\": %lu, \"dropped\": %lu, \"overflowed\": %lu, \"target\": ",
+             client_count, ui_client_count(), stats.received, stats.coalesced, stats.classified,
+             stats.dropped, stats.overflowed);
+    if (current_syspath[0] != '\0')
+        json_append(msg, sizeof(msg) - 3, current_syspath);
+    else
+        strncat(msg, "null", sizeof(msg) - strlen(msg) - 1);
+    strncat(msg, "}\n", sizeof(msg) - strlen(msg) - 1);
+    client_send(c, msg);
+}
+
+/* Extract a string member from a flat JSON object. Returns 0 if found. */
+static int json_get_string(const char *line, const char *key, char *out, size_t len)
+{
+    char pattern[64];
+    snprintf(pattern, sizeof(pattern), "\"%s\"", key);
+
+    const char *p = strstr(line, pattern);
+    if (!p)
+        return -1;
+    p += strlen(pattern);
+    while (*p == ' ' || *p == '\t')
+        p++;
+    if (*p++ != ':')
+        return -1;
+    while (*p == ' ' || *p == '\t')
+        p++;
+    if (*p++ != '"')
+        return -1;
+
+    size_t n = 0;
+    for (; *p && *p != '"'; p++)
+    {
+        if (*p == '\\' && p[1])
+            p++;
+        if (n + 1 < len)
+            out[n++] = *p;
+    }
+    out[n] = '\0';
+    return *p == '"' ? 0 : -1;
+}
+
+/* One request line from a client */
+static void handle_request(struct client *c, const char *line)
+{
+    char cmd[32], value[1024];
+    if (json_get_string(line, "cmd", cmd, sizeof(cmd)) != 0)
+        return;
+
+    if (strcmp(cmd, "status") == 0)
+    {
+        send_status(c);
+    }
+    else if (strcmp(cmd, "hello") == 0)
+    {
+        if (json_get_string(line, "role", value, sizeof(value)) == 0 && strcmp(value, "ui") == 0)
         {
-            /* Fallback to /tmp with UID for uniqueness */
-            snprintf(buf, bufsize, "/tmp/montecarlo-%d.sock", uid);
+            c->is_ui = true;
+            ui_pid = 0;   // whatever we launched is up (or someone else's is)
         }
     }
+    else if (strcmp(cmd, "activate") == 0)
+    {
+        /* A second UI instance hands its device to the running one */
+        const char *syspath = NULL;
+        if (json_get_string(line, "syspath", value, sizeof(value)) == 0 && value[0] != '\0')
+            syspath = value;
+
+        char msg[64];
+        snprintf(msg, sizeof(msg), "{\"event\": \"activated\", \"ui\": %d}\n",
+                 activate_ui_clients(syspath));
+        client_send(c, msg);
+    }
+}
+
+static void handle_client_input(struct client *c)
+{
+    for (;;)
+    {
+        ssize_t n = recv(c->fd, c->in + c->in_len, sizeof(c->in) - c->in_len, MSG_DONTWAIT);
+        if (n == 0 || (n < 0 && errno != EAGAIN && errno != EWOULDBLOCK && errno != EINTR))
+        {
+            client_close(c);
+            return;
+        }
+        if (n < 0)
+        {
+            if (errno == EINTR)
+                continue;
+            return;
+        }
+        c->in_len += n;
+
+        char *start = c->in, *nl;
+        while ((nl = memchr(start, '\n', c->in + c->in_len - start)))
+        {
+            *nl = '\0';
+            handle_request(c, start);
+            if (c->closed)
+                return;
+            start = nl + 1;
+        }
+        c->in_len -= start - c->in;
+        memmove(c->in, start, c->in_len);
+
+        if (c->in_len == sizeof(c->in))
+        {
+            fprintf(stderr, "[daemon] Client request too long, disconnecting\n");
+            client_close(c);
+            return;
+        }
+    }
+}
+
+static void accept_clients(void)
+{
+    for (;;)
+    {
+        int fd = accept4(server_fd, NULL, NULL, SOCK_NONBLOCK | SOCK_CLOEXEC);
+        if (fd == -1)
+            return;
+
+        struct client *c = calloc(1, sizeof(*c));
+        if (!c || client_count == MAX_CLIENTS)
+        {
+            fprintf(stderr, "[daemon] Too many clients, refusing connection\n");
+            free(c);
+            close(fd);
+            continue;
+        }
+        c->fd = fd;
+
+        struct epoll_event ev = { .events = EPOLLIN, .data.ptr = c };
+        if (epoll_ctl(epoll_fd, EPOLL_CTL_ADD, fd, &ev) == -1)
+        {
+            free(c);
+            close(fd);
+            continue;
+        }
+        clients[client_count++] = c;
+
+        /* Current target first, as the old one-shot protocol did */
+        char msg[1200];
+        format_event(msg, sizeof(msg), current_syspath[0] ? "add" : "none",
+                     current_syspath[0] ? current_syspath : NULL);
+        client_send(c, msg);
+    }
+}
+
+/* Disconnect clients whose queue has been full for too long */
+static void reap_slow_clients(void)
+{
+    long long now = now_ms();
+    for (int i = client_count - 1; i >= 0; i--)
+    {
+        struct client *c = clients[i];
+        if (c->stalled_since && now - c->stalled_since > SLOW_CLIENT_MS)
+        {
+            fprintf(stderr, "[daemon] Slow client dropped (%lu messages lost)\n", c->dropped);
+            client_close(c);
+        }
+    }
+}
+
+static bool clients_stalled(void)
+{
+    for (int i = 0; i < client_count; i++)
+    {
+        if (clients[i]->stalled_since)
+            return true;
+    }
+    return false;
 }
 
 /* Cleanup resources on exit */
 void cleanup(int signum)
 {
     (void)signum;
+    printf("[daemon] events: %lu received, %lu coalesced, %lu classified, %lu dropped, %lu overflowed\n",
+           stats.received, stats.coalesced, stats.classified, stats.dropped, stats.overflowed);
+
     if (server_fd != -1)
         close(server_fd);
 
@@ -151,9 +805,9 @@ int init_socket()
     struct sockaddr_un addr;
 
     /* Get secure socket path */
-    get_socket_path(socket_path, sizeof(socket_path));
+    mc_get_socket_path(socket_path, sizeof(socket_path));
 
-    if ((server_fd = socket(AF_UNIX, SOCK_STREAM, 0)) == -1)
+    if ((server_fd = socket(AF_UNIX, SOCK_STREAM | SOCK_NONBLOCK | SOCK_CLOEXEC, 0)) == -1)
     {
         perror("[daemon] socket error");
         return -1;
@@ -171,7 +825,7 @@ int init_socket()
         return -1;
     }
 
-    if (listen(server_fd, 5) == -1)
+    if (listen(server_fd, SOMAXCONN) == -1)
     {
         perror("[daemon] listen error");
         return -1;
@@ -183,70 +837,44 @@ int init_socket()
     return 0;
 }
 
-static void handle_udev_event(struct udev_monitor *mon)
+/*
+ * Rebuild the module index if the kernel changed or depmod ran since it was
+ * built. A rebuild reads (and decompresses) every module file, so it runs in
+ * a child once the socket and the udev monitor are up; a module file that
+ * breaks the build takes down the child, not the daemon. The main loop
+ * reaps it with the UIs (ui_starting).
+ */
+static void ensure_modindex(void)
 {
-    struct udev_device *dev = udev_monitor_receive_device(mon);
-
-    if (!dev)
-        return;
-
-    const char *action = udev_device_get_action(dev);
-    const char *syspath = udev_device_get_syspath(dev);
-
-    if (!action)
+    mc_modindex_t *idx = mc_ctx_modindex_open(NULL);
+    if (idx)
     {
-        udev_device_unref(dev);
+        mc_modindex_close(idx);
         return;
     }
 
-    if (!syspath)
+    fflush(stdout);    // or the child prints our buffered lines again
+    pid_t pid = fork();
+    if (pid < 0)
     {
-        udev_device_unref(dev);
+        perror("[daemon] fork failed");
         return;
     }
 
-    if (strcmp(action, "add") == true)
-    {
-        handle_device_add(syspath);
-    }
-
-    if (strcmp(action, "remove") == true)
-    {
-        handle_device_remove(syspath);
-    }
-
-    udev_device_unref(dev);
-}
-
-/*
- * Handle client connection.
- * Simplified Protocol: Accept -> Send Target Syspath -> Close.
- */
-void handle_client()
-{
-    struct sockaddr_un client_addr;
-
-    socklen_t len = sizeof(client_addr);
-
-    int client_fd = accept(server_fd, (struct sockaddr *)&client_addr, &len);
-
-    if (client_fd == -1)
-        return;
-
-    /* Send the current target syspath if available */
-    if (current_syspath[0] != '\0')
-    {
-        char buf[1024];
-        snprintf(buf, sizeof(buf), "{\"event\": \"add\", \"syspath\": \"%.900s\"}", current_syspath);
-        send(client_fd, buf, strlen(buf), 0);
-    }
-    else
+    if (pid == 0)
     {
-        const char *msg = "{\"event\": \"none\"}";
-        send(client_fd, msg, strlen(msg), 0);
+        signal(SIGINT, SIG_DFL);    // cleanup() would unlink the daemon's socket
+        signal(SIGTERM, SIG_DFL);
+        int count = mc_ctx_modindex_build(NULL, NULL, NULL);
+        if (count < 0)
+            fprintf(stderr, "[daemon] Could not build module index: %s\n", strerror(errno));
+        else
+            printf("[daemon] Module index rebuilt (%d modules)\n", count);
+        fflush(stdout);
+        _exit(count < 0);
     }
 
-    close(client_fd);
+    printf("[daemon] Rebuilding module index in the background (pid %d)\n", (int)pid);
 }
 
 int main(int argc, char *argv[])
@@ -299,29 +927,88 @@ int main(int argc, char *argv[])
     udev_monitor_filter_add_match_subsystem_devtype(mon, "hid", NULL);
     udev_monitor_filter_add_match_subsystem_devtype(mon, "scsi", NULL);
     udev_monitor_filter_add_match_subsystem_devtype(mon, "i2c", NULL);
+
+    /* Room for a dock's worth of events while we're busy */
+    if (udev_monitor_set_receive_buffer_size(mon, RCVBUF_SIZE) < 0)
+        fprintf(stderr, "[daemon] Could not enlarge udev receive buffer\n");
+
     udev_monitor_enable_receiving(mon);
 
     int udev_fd = udev_monitor_get_fd(mon);
 
+    epoll_fd = epoll_create1(EPOLL_CLOEXEC);
+    if (epoll_fd == -1)
+    {
+        perror("[daemon] epoll_create1");
+        return 1;
+    }
+
+    /* data.ptr NULL = listening socket, &udev_fd = udev, anything else = client */
+    struct epoll_event ev = { .events = EPOLLIN, .data.ptr = NULL };
+    epoll_ctl(epoll_fd, EPOLL_CTL_ADD, server_fd, &ev);
+    ev.data.ptr = &udev_fd;
+    epoll_ctl(epoll_fd, EPOLL_CTL_ADD, udev_fd, &ev);
+
     printf("[daemon] Listening on %s and UDev...\n", socket_path);
 
+    ensure_modindex();
+
+    struct epoll_event events[64];
     for (;;)
     {
-        fd_set fds;
-        FD_ZERO(&fds);
-        FD_SET(server_fd, &fds);
-        FD_SET(udev_fd, &fds);
+        /* Wake up when the next event group is due, or to police slow clients */
+        int wait_ms = pending_timeout();
+        if (clients_stalled() && (wait_ms < 0 || wait_ms > 1000))
+            wait_ms = 1000;
 
-        int max_fd = (server_fd > udev_fd) ? server_fd : udev_fd;
+        int n = epoll_wait(epoll_fd, events, 64, wait_ms);
+        if (n < 0 && errno != EINTR)
+        {
+            perror("[daemon] epoll_wait");
+            break;
+        }
 
-        if (select(max_fd + 1, &fds, NULL, NULL, NULL) <= 0)
-            continue;
+        /* udev first so event latency never waits behind clients */
+        for (int i = 0; i < n; i++)
+        {
+            if (events[i].data.ptr == &udev_fd)
+                handle_udev_events(mon);
+        }
 
-        if (FD_ISSET(server_fd, &fds))
-            handle_client();
+        for (int i = 0; i < n; i++)
+        {
+            void *ptr = events[i].data.ptr;
+            if (ptr == &udev_fd)
+                continue;
+            if (ptr == NULL)
+            {
+                accept_clients();
+                continue;
+            }
+
+            struct client *c = ptr;
+            if (!client_alive(c))
+                continue;
+            if (events[i].events & (EPOLLERR | EPOLLHUP))
+            {
+                client_close(c);
+                continue;
+            }
+            if ((events[i].events & EPOLLOUT) && client_flush(c) < 0)
+            {
+                client_close(c);
+                continue;
+            }
+            if (events[i].events & EPOLLIN)
+                handle_client_input(c);
+        }
 
-        if (FD_ISSET(udev_fd, &fds))
-            handle_udev_event(mon);
+        pending_flush(false);
+        reap_slow_clients();
+        ui_starting();
+        free_closed_clients();
     }
 
+    cleanup(0);
+    return 1;
 }
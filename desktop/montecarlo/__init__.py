@@ -0,0 +1,23 @@
+"""
+Python access to libmontecarlo.
+
+One shared ctypes binding for the UI and the tools in utils/. Records are
+views over the C buffers and decode their text fields on first access.
+"""
+from ._binding import lib, libsd, lib_path, MCDeviceInfo, ServiceInfo, MC_MODULE_NAME_MAX
+from .devices import (Device, ExplainedDevice, iter_devices, iter_explained, list_devices,
+                      iter_candidate_drivers, device_name, hwdb_name)
+from .modules import ModuleGraph, loaded_modules
+from .services import Service, iter_services
+from .changes import Change, diff
+from .root import get_root, set_root, host_path, kernel_release, snapshot, snapshot_info
+
+__all__ = [
+    "lib", "libsd", "lib_path", "MCDeviceInfo", "ServiceInfo", "MC_MODULE_NAME_MAX",
+    "Device", "ExplainedDevice", "iter_devices", "iter_explained", "list_devices",
+    "iter_candidate_drivers", "device_name", "hwdb_name",
+    "ModuleGraph", "loaded_modules",
+    "Service", "iter_services",
+    "Change", "diff",
+    "get_root", "set_root", "host_path", "kernel_release", "snapshot", "snapshot_info",
+]
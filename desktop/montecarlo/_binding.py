@@ -0,0 +1,244 @@
+"""
+ctypes binding for libmontecarlo and libsystemdctl.
+
+The libraries are loaded and their signatures declared exactly once per
+process; every other module goes through lib() / libsd(). Calls that read
+the system take the calling thread's context from ctx(), so scans running
+in several threads never share library state.
+"""
+import os
+import threading
+from ctypes import CDLL, Structure, POINTER, c_char, c_char_p, c_int, c_long, c_size_t, c_void_p
+
+# Repository root when running from a checkout (desktop/montecarlo/ -> ../..)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def lib_path():
+    """Path of libmontecarlo.so (MONTECARLO_LIB overrides)."""
+    if os.environ.get("MONTECARLO_LIB"):
+        return os.environ["MONTECARLO_LIB"]
+    if os.environ.get("MONTECARLO_DEV"):
+        return os.path.join(BASE_DIR, "libmontecarlo.so")
+    return "/usr/lib/libmontecarlo.so"
+
+
+def libsd_path():
+    """Path of libsystemdctl.so."""
+    if os.environ.get("MONTECARLO_DEV"):
+        return os.path.join(BASE_DIR, "systemd/libsystemdctl.so")
+    return "/usr/lib/libsystemdctl.so"
+
+
+# --- C TYPES DEFINITIONS (must match heads/libmontecarlo.h) ---
+
+MC_MODULE_NAME_MAX = 64
+MC_DRIVER_NAME_MAX = 128
+MC_HWDB_NAME_MAX = 128
+
+ModuleName = c_char * MC_MODULE_NAME_MAX
+DriverName = c_char * MC_DRIVER_NAME_MAX
+
+
+class MCDeviceInfo(Structure):
+    _fields_ = [
+        ("syspath", c_char * 256),
+        ("vidpid", c_char * 32),
+        ("product", c_char * 128),
+        ("driver", c_char * 64),
+        ("subsystem", c_char * 16)
+    ]
+
+
+# Filter reason codes (MC_REASON_*); codes >= REASON_PCI_BRIDGE are hidden
+REASON_SHOWN = 0
+REASON_MASS_STORAGE = 1
+REASON_PCI_BRIDGE = 2
+
+
+class MCDeviceExplain(Structure):
+    _fields_ = [
+        ("info", MCDeviceInfo),
+        ("reason", c_int)
+    ]
+
+
+# Snapshot diff change kinds (MC_DIFF_*); kinds >= DIFF_MODULE_LOADED are modules
+DIFF_DEVICE_ADDED = 0
+DIFF_DEVICE_REMOVED = 1
+DIFF_DEVICE_REBOUND = 2
+DIFF_MODULE_LOADED = 3
+DIFF_MODULE_UNLOADED = 4
+DIFF_MODULE_IDLE = 5
+DIFF_MODULE_IN_USE = 6
+DIFF_MODULE_REFCOUNT = 7
+
+
+class MCDiffEntry(Structure):
+    _fields_ = [
+        ("kind", c_int),
+        ("key", c_char * 256),
+        ("before", c_char * 64),
+        ("after", c_char * 64),
+        ("refcount_before", c_int),
+        ("refcount_after", c_int)
+    ]
+
+
+# (name, argtypes, restype)
+_SIGNATURES = [
+    ("mc_set_root", [c_char_p], None),
+    ("mc_get_root", [], c_char_p),
+    # Context handles (reentrant API)
+    ("mc_ctx_new", [c_char_p], c_void_p),
+    ("mc_ctx_free", [c_void_p], None),
+    ("mc_ctx_root", [c_void_p], c_char_p),
+    ("mc_ctx_list_candidate_drivers", [c_void_p, POINTER(DriverName), c_int], c_int),
+    ("mc_ctx_list_all_devices", [c_void_p, POINTER(MCDeviceInfo), c_int], c_int),
+    ("mc_ctx_explain_devices", [c_void_p, POINTER(MCDeviceExplain), c_int], c_int),
+    ("mc_ctx_get_device_subsystem", [c_void_p, c_char_p, c_char_p, c_size_t], c_int),
+    ("mc_ctx_module_has_holders", [c_void_p, c_char_p], c_int),
+    ("mc_ctx_get_module_refcount", [c_void_p, c_char_p], c_int),
+    ("mc_ctx_list_loaded_modules", [c_void_p, c_char_p, c_int], c_int),
+    ("mc_ctx_driver_is_in_use", [c_void_p, c_char_p], c_int),
+    ("mc_ctx_driver_has_bindings", [c_void_p, c_char_p], c_int),
+    ("mc_ctx_modgraph_new", [c_void_p], c_void_p),
+    ("mc_ctx_dev_has_driver", [c_void_p, c_char_p], c_int),
+    ("mc_ctx_is_excluded_device", [c_void_p, c_char_p], c_int),
+    ("mc_ctx_is_infrastructure_device", [c_void_p, c_char_p, c_char_p], c_int),
+    ("mc_ctx_probe_bind", [c_void_p, c_char_p, c_char_p], c_int),
+    ("mc_ctx_unbind_device", [c_void_p, c_char_p], c_int),
+    ("mc_reason_name", [c_int], c_char_p),
+    ("mc_read_sysattr", [c_char_p, c_char_p, c_int], c_int),
+    ("mc_modinfo_read", [c_char_p, c_char_p, c_size_t], c_int),
+    ("mc_ctx_device_name", [c_void_p, c_char_p, c_char_p, c_size_t], c_int),
+    ("mc_hwdb_device_name", [c_char_p, c_char_p, c_char_p, c_char_p, c_char_p], c_int),
+    ("mc_hwdb_pci_class", [c_char_p, c_char_p, c_size_t], c_int),
+    # Site rules (rules.conf)
+    ("mc_ctx_rule_match", [c_void_p, c_int, c_char_p, POINTER(c_int)], c_int),
+    ("mc_rule_kind_name", [c_int], c_char_p),
+    ("mc_rules_check", [c_char_p, POINTER(c_int), c_char_p, c_size_t], c_int),
+    # Snapshots (capture a tree usable as a root prefix)
+    ("mc_ctx_snapshot", [c_void_p, c_char_p, c_int], c_int),
+    ("mc_ctx_diff", [c_void_p, c_void_p, POINTER(MCDiffEntry), c_int], c_int),
+    ("mc_diff_kind_name", [c_int], c_char_p),
+    ("mc_list_candidate_drivers", [POINTER(DriverName), c_int], c_int),
+    ("mc_list_all_devices", [POINTER(MCDeviceInfo), c_int], c_int),
+    ("mc_get_device_subsystem", [c_char_p], c_char_p),
+    ("mc_try_load_driver", [c_char_p], c_int),
+    ("mc_unload_driver", [c_char_p], c_int),
+    ("mc_dmesg_has_activity", [c_char_p], c_int),
+    ("mc_module_has_holders", [c_char_p], c_int),
+    ("mc_get_module_refcount", [c_char_p], c_int),
+    ("mc_list_loaded_modules", [c_char_p, c_int], c_int),
+    ("mc_driver_is_in_use", [c_char_p], c_int),
+    ("mc_driver_has_bindings", [c_char_p], c_int),
+    ("mc_dev_has_driver", [c_char_p], c_int),
+    ("mc_is_excluded_device", [c_char_p], c_int),
+    ("mc_is_infrastructure_device", [c_char_p, c_char_p], c_int),
+    # Module graph (opaque handle)
+    ("mc_modgraph_new", [], c_void_p),
+    ("mc_modgraph_free", [c_void_p], None),
+    ("mc_modgraph_count", [c_void_p], c_int),
+    ("mc_modgraph_name", [c_void_p, c_int], c_char_p),
+    ("mc_modgraph_find", [c_void_p, c_char_p], c_int),
+    ("mc_modgraph_refcount", [c_void_p, c_char_p], c_int),
+    ("mc_modgraph_size", [c_void_p, c_char_p], c_long),
+    ("mc_modgraph_state", [c_void_p, c_char_p], c_char_p),
+    ("mc_modgraph_taint", [c_void_p, c_char_p], c_char_p),
+    ("mc_modgraph_has_holders", [c_void_p, c_char_p], c_int),
+    ("mc_modgraph_holders", [c_void_p, c_char_p, POINTER(ModuleName), c_int], c_int),
+    ("mc_modgraph_depends", [c_void_p, c_char_p, POINTER(ModuleName), c_int], c_int),
+    ("mc_modgraph_unload_order", [c_void_p, c_char_p, POINTER(ModuleName), c_int], c_int),
+]
+
+# --- SYSTEMD TYPES ---
+
+
+class ServiceInfo(Structure):
+    _fields_ = [
+        ("name", c_char * 256),
+        ("description", c_char * 512),
+        ("state", c_char * 32),
+        ("sub_state", c_char * 32)
+    ]
+
+
+_SD_SIGNATURES = [
+    ("mc_list_services", [POINTER(ServiceInfo), c_int], c_int),
+]
+
+_lock = threading.Lock()
+_libmc = None
+_libsd = None
+_libsd_tried = False
+
+
+def _declare(dll, signatures):
+    for name, argtypes, restype in signatures:
+        fn = getattr(dll, name)
+        fn.argtypes = argtypes
+        fn.restype = restype
+    return dll
+
+
+def lib():
+    """The bound libmontecarlo. Raises OSError if it can't be loaded."""
+    global _libmc
+    if _libmc is None:
+        with _lock:
+            if _libmc is None:
+                _libmc = _declare(CDLL(lib_path(), use_errno=True), _SIGNATURES)
+    return _libmc
+
+
+def libsd():
+    """The bound libsystemdctl, or None if it isn't installed (or lacks a symbol)."""
+    global _libsd, _libsd_tried
+    if not _libsd_tried:
+        with _lock:
+            if not _libsd_tried:
+                try:
+                    _libsd = _declare(CDLL(libsd_path()), _SD_SIGNATURES)
+                except (OSError, AttributeError):
+                    _libsd = None
+                _libsd_tried = True
+    return _libsd
+
+
+# --- PER-THREAD CONTEXTS ---
+
+class _Context:
+    """Owns one mc_ctx_t; freed with the thread that created it."""
+
+    __slots__ = ("_lib", "handle", "generation")
+
+    def __init__(self, generation):
+        self._lib = lib()
+        self.handle = self._lib.mc_ctx_new(None)
+        if not self.handle:
+            raise MemoryError("mc_ctx_new failed")
+        self.generation = generation
+
+    def __del__(self):
+        if self.handle:
+            self._lib.mc_ctx_free(self.handle)
+            self.handle = None
+
+
+_local = threading.local()
+_generation = 0
+
+
+def ctx():
+    """The calling thread's libmontecarlo context handle."""
+    c = getattr(_local, "ctx", None)
+    if c is None or c.generation != _generation:
+        c = _local.ctx = _Context(_generation)
+    return c.handle
+
+
+def reset_contexts():
+    """Make every thread pick up the default root again on its next call."""
+    global _generation
+    _generation += 1
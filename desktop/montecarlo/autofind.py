@@ -0,0 +1,493 @@
+"""
+Auto-Find: try drivers on one device until it binds.
+
+Drivers already registered on the device's bus are tried through sysfs
+(bind, then new_id) with mc_ctx_probe_bind: no module is loaded or removed,
+and a rejected probe leaves nothing behind. Only modules that are not loaded
+yet go through the modprobe / modprobe -r cycle, and those are removed again
+only if the probe failed and nothing else started using them.
+
+simulate() is the read-only half: it scores every possible driver for the
+device and returns the ranked plan with an estimated duration, without
+touching the system. run() executes such a plan within a Budget (deadline,
+probe count, per-probe timeout), stops between probes when its token is
+cancelled and reports progress with an ETA.
+
+Like the rest of Auto-Find, probing needs root.
+"""
+import ctypes
+import json
+import os
+import threading
+import time
+
+from . import modalias
+from ._binding import lib, ctx
+from .modules import ModuleGraph
+from .root import host_path
+
+BIND = "bind"
+LOAD = "load"
+
+# Outcomes
+BOUND = "bound"
+PROBABLE = "probable"   # loaded, not bound, but the driver logged something
+REJECTED = "rejected"
+ERROR = "error"
+TIMEOUT = "timeout"
+
+# modprobe returns before udev has finished with the new driver
+LOAD_SETTLE = 1.0
+
+# Estimated cost of one probe (seconds): a sysfs write vs. modprobe, settle, modprobe -r
+BIND_COST = 0.05
+LOAD_COST = LOAD_SETTLE + 0.5
+
+# Default run budget
+DEFAULT_DEADLINE = 120.0    # seconds for the whole run
+DEFAULT_MAX_PROBES = 50
+DEFAULT_PROBE_TIMEOUT = 15.0
+
+# Candidate scoring
+SCORE_ALIAS = 40            # modules.alias matches the device's modalias...
+SCORE_ALIAS_LITERAL = 1     # ...plus one per literal character of the pattern
+SCORE_ALIAS_MAX = 40
+SCORE_BUS = 15              # driver registered on the device's bus
+SCORE_LOADED = 5            # already loaded: probing is a cheap, reversible bind
+SCORE_BLACKLISTED = -60     # blacklisted in modprobe.d (left out of the plan)
+SCORE_HISTORY_OK = 30       # per earlier success on this device (up to 2)
+SCORE_HISTORY_FAIL = -10    # per earlier rejection on this device (up to 3)
+
+
+class Probe:
+    """One planned attempt: `driver` tried on the device by `mode`."""
+
+    __slots__ = ("driver", "mode")
+
+    def __init__(self, driver, mode):
+        self.driver = driver
+        self.mode = mode
+
+    def __repr__(self):
+        return f"Probe({self.driver!r}, {self.mode})"
+
+
+class Result:
+    __slots__ = ("probe", "outcome", "detail", "seconds")
+
+    def __init__(self, probe, outcome, detail="", seconds=0.0):
+        self.probe = probe
+        self.outcome = outcome
+        self.detail = detail
+        self.seconds = seconds
+
+    @property
+    def matched(self):
+        return self.outcome in (BOUND, PROBABLE)
+
+    def __repr__(self):
+        return f"Result({self.probe.driver!r}, {self.outcome})"
+
+
+def module_name(driver):
+    """Driver names use '-' where module names use '_' (usb-storage / usb_storage)."""
+    return driver.replace("-", "_")
+
+
+def device_bus(syspath):
+    buf = ctypes.create_string_buffer(32)
+    if lib().mc_ctx_get_device_subsystem(ctx(), syspath.encode("utf-8"), buf, len(buf)) != 0:
+        return None
+    return buf.value.decode("utf-8", "ignore")
+
+
+def bus_drivers(bus):
+    """Names registered under /sys/bus/<bus>/drivers."""
+    try:
+        return set(os.listdir(host_path(f"/sys/bus/{bus}/drivers")))
+    except OSError:
+        return set()
+
+
+def probe_bind(syspath, driver):
+    """Try a registered driver through sysfs; nothing is loaded or unloaded."""
+    start = time.monotonic()
+    rc = lib().mc_ctx_probe_bind(ctx(), syspath.encode("utf-8"), driver.encode("utf-8"))
+    probe = Probe(driver, BIND)
+    if rc == 1:
+        return Result(probe, BOUND, "bound via sysfs", time.monotonic() - start)
+    if rc == 0:
+        return Result(probe, REJECTED, "driver rejected the device", time.monotonic() - start)
+    return Result(probe, ERROR, os.strerror(ctypes.get_errno()), time.monotonic() - start)
+
+
+def probe_load(syspath, module, token=None):
+    """modprobe `module`, check the device, and take the module out again if it did nothing."""
+    libmc = lib()
+    start = time.monotonic()
+    probe = Probe(module, LOAD)
+    name = module.encode("utf-8")
+
+    if libmc.mc_try_load_driver(name) == 0:
+        return Result(probe, ERROR, "modprobe failed", time.monotonic() - start)
+
+    # Wait for the binding, but no longer than needed
+    enc_syspath = syspath.encode("utf-8")
+    settle_end = start + LOAD_SETTLE
+    while not libmc.mc_ctx_dev_has_driver(ctx(), enc_syspath):
+        if time.monotonic() >= settle_end or (token is not None and token.cancelled):
+            break
+        time.sleep(0.1)
+
+    if libmc.mc_ctx_dev_has_driver(ctx(), enc_syspath):
+        return Result(probe, BOUND, "bound after modprobe", time.monotonic() - start)
+    if libmc.mc_dmesg_has_activity(name):
+        return Result(probe, PROBABLE, "dmesg activity", time.monotonic() - start)
+
+    # GOLDEN RULE: never unload a driver that is in use
+    ref = libmc.mc_ctx_get_module_refcount(ctx(), name)
+    in_use = libmc.mc_ctx_driver_is_in_use(ctx(), name)
+    if ref > 0 or in_use:
+        reason = []
+        if ref > 0: reason.append(f"Refcnt={ref}")
+        if in_use: reason.append("BusDevices Bound")
+        return Result(probe, REJECTED, f"kept loaded ({', '.join(reason)})", time.monotonic() - start)
+
+    libmc.mc_unload_driver(name)
+    return Result(probe, REJECTED, "unloaded again", time.monotonic() - start)
+
+
+# --- HISTORY ---
+
+def history_path():
+    state = os.environ.get("XDG_STATE_HOME") or os.path.expanduser("~/.local/state")
+    return os.path.join(state, "montecarlo", "autofind.json")
+
+
+class History:
+    """Probe outcomes per device id (modalias), kept across sessions."""
+
+    def __init__(self, path=None):
+        self.path = path or history_path()
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self._data = json.load(f)
+        except (OSError, ValueError):
+            self._data = {}
+
+    def counts(self, device_id, driver):
+        entry = self._data.get(device_id, {}).get(driver, {})
+        return entry.get("ok", 0), entry.get("fail", 0)
+
+    def record(self, device_id, driver, ok):
+        if not device_id:
+            return
+        with self._lock:
+            entry = self._data.setdefault(device_id, {}).setdefault(driver, {})
+            field = "ok" if ok else "fail"
+            entry[field] = entry.get(field, 0) + 1
+            self._save()
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self._data, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+
+# --- SIMULATION ---
+
+class Candidate:
+    """A scored probe; `reasons` explains the score."""
+
+    __slots__ = ("probe", "score", "reasons", "blacklisted")
+
+    def __init__(self, probe):
+        self.probe = probe
+        self.score = 0
+        self.reasons = []
+        self.blacklisted = False
+
+    def add(self, points, reason):
+        self.score += points
+        self.reasons.append(f"{points:+d} {reason}")
+
+    @property
+    def estimate(self):
+        return BIND_COST if self.probe.mode == BIND else LOAD_COST
+
+    def __repr__(self):
+        return f"Candidate({self.probe.driver!r}, {self.probe.mode}, score={self.score})"
+
+
+class Simulation:
+    """Ranked Auto-Find plan for one device. Nothing has been loaded or bound."""
+
+    def __init__(self, syspath, bus, device_id, candidates, skipped):
+        self.syspath = syspath
+        self.bus = bus
+        self.device_id = device_id
+        self.candidates = candidates  # best first
+        self.skipped = skipped        # (name, reason) left out of the plan
+
+    def plan(self, include_blacklisted=False):
+        return [c for c in self.candidates if include_blacklisted or not c.blacklisted]
+
+    def probes(self, include_blacklisted=False):
+        return [c.probe for c in self.plan(include_blacklisted)]
+
+    def estimate(self, include_blacklisted=False):
+        """Worst case: every probe in the plan runs."""
+        return sum(c.estimate for c in self.plan(include_blacklisted))
+
+    def report(self, limit=None):
+        lines = [f"Auto-Find plan for {self.syspath}",
+                 f"  bus {self.bus or '?'}, modalias {self.device_id or '-'}"]
+        plan = self.plan()
+        for i, c in enumerate(plan[:limit] if limit else plan):
+            lines.append(f"  {i + 1:3d}. {c.probe.driver:<24} {c.probe.mode:<4} score {c.score:4d}  "
+                         f"~{c.estimate:.2f}s  ({'; '.join(c.reasons)})")
+        if limit and len(plan) > limit:
+            lines.append(f"  ... {len(plan) - limit} more")
+        blacklisted = [c.probe.driver for c in self.candidates if c.blacklisted]
+        if blacklisted:
+            lines.append(f"  blacklisted, not probed: {', '.join(blacklisted)}")
+        lines.append(f"  {len(plan)} probes, estimated {self.estimate():.1f}s at most")
+        return "\n".join(lines)
+
+
+def module_drivers(module, bus):
+    """Driver names a loaded module registered on `bus` (/sys/module/<m>/drivers/<bus>:<name>)."""
+    try:
+        entries = os.listdir(host_path(f"/sys/module/{module}/drivers"))
+    except OSError:
+        return []
+    return [e.split(":", 1)[1] for e in entries if e.startswith(bus + ":")]
+
+
+def simulate(syspath, candidates=None, graph=None, history=None):
+    """
+    Score every driver that could take `syspath` and rank them. Read-only.
+
+    Possible drivers are the ones registered on the device's bus plus the
+    modules whose modules.alias patterns match its modalias (`candidates`
+    replaces both). Loaded modules are tried by bind, others by modprobe.
+    """
+    if graph is None:
+        graph = ModuleGraph()
+    if history is None:
+        history = History()
+
+    bus = device_bus(syspath) or ""
+    device_id = modalias.device_modalias(syspath)
+    registered = bus_drivers(bus)
+    blacklist = modalias.blacklisted()
+
+    # name -> best alias pattern
+    alias_hits = {}
+    for module, pattern in modalias.match(device_id):
+        alias_hits.setdefault(module, pattern)
+
+    if candidates is None:
+        candidates = list(registered) + list(alias_hits)
+
+    scored, skipped, seen = {}, [], set()
+    for name in candidates:
+        if name in seen:
+            continue
+        seen.add(name)
+        mod = module_name(name)
+
+        # Which driver name do we bind, or do we load the module?
+        if name in registered:
+            probe = Probe(name, BIND)
+        elif mod in graph:
+            drivers = [d for d in module_drivers(mod, bus) if d in registered]
+            if not drivers:
+                skipped.append((name, f"loaded, no driver on the {bus or 'device'} bus"))
+                continue
+            probe = Probe(drivers[0], BIND)
+        else:
+            probe = Probe(name, LOAD)
+
+        if probe.driver in scored:
+            continue
+        cand = Candidate(probe)
+
+        pattern = alias_hits.get(mod) or alias_hits.get(name)
+        if pattern:
+            literal = min(modalias.specificity(pattern) * SCORE_ALIAS_LITERAL, SCORE_ALIAS_MAX)
+            cand.add(SCORE_ALIAS + literal, f"alias {pattern}")
+        if probe.driver in registered:
+            cand.add(SCORE_BUS, f"registered on {bus}")
+        if probe.mode == BIND:
+            cand.add(SCORE_LOADED, "loaded")
+        if mod in blacklist:
+            cand.blacklisted = True
+            cand.add(SCORE_BLACKLISTED, "blacklisted")
+
+        ok, fail = history.counts(device_id, probe.driver)
+        if ok:
+            cand.add(SCORE_HISTORY_OK * min(ok, 2), f"worked {ok}x before")
+        if fail:
+            cand.add(SCORE_HISTORY_FAIL * min(fail, 3), f"failed {fail}x before")
+
+        scored[probe.driver] = cand
+
+    # Best score first; among equals the cheaper probe, then name for a stable order
+    ranked = sorted(scored.values(), key=lambda c: (-c.score, c.estimate, c.probe.driver))
+    return Simulation(syspath, bus, device_id, ranked, skipped)
+
+
+def run_probe(syspath, probe, token=None):
+    if probe.mode == BIND:
+        return probe_bind(syspath, probe.driver)
+    return probe_load(syspath, probe.driver, token)
+
+
+class Budget:
+    """Limits for one run; None disables a limit."""
+
+    __slots__ = ("deadline", "max_probes", "probe_timeout")
+
+    def __init__(self, deadline=DEFAULT_DEADLINE, max_probes=DEFAULT_MAX_PROBES,
+                 probe_timeout=DEFAULT_PROBE_TIMEOUT):
+        self.deadline = deadline
+        self.max_probes = max_probes
+        self.probe_timeout = probe_timeout
+
+
+class Progress:
+    """Passed to the progress callback before each probe and once at the end."""
+
+    __slots__ = ("done", "total", "elapsed", "eta", "probe")
+
+    def __init__(self, done, total, elapsed, eta, probe=None):
+        self.done = done
+        self.total = total
+        self.elapsed = elapsed
+        self.eta = eta
+        self.probe = probe
+
+    @property
+    def fraction(self):
+        return self.done / self.total if self.total else 1.0
+
+
+class _Costs:
+    """Measured seconds per probe mode, for the ETA (estimates until measured)."""
+
+    def __init__(self):
+        self._sum = {BIND: 0.0, LOAD: 0.0}
+        self._count = {BIND: 0, LOAD: 0}
+
+    def add(self, mode, seconds):
+        self._sum[mode] += seconds
+        self._count[mode] += 1
+
+    def cost(self, mode):
+        if self._count[mode]:
+            return self._sum[mode] / self._count[mode]
+        return BIND_COST if mode == BIND else LOAD_COST
+
+    def eta(self, probes):
+        return sum(self.cost(p.mode) for p in probes)
+
+
+def _run_bounded(syspath, probe, token, timeout):
+    """run_probe(), giving up waiting after `timeout` seconds (None: wait)."""
+    if timeout is None:
+        return run_probe(syspath, probe, token)
+
+    box = []
+    worker = threading.Thread(target=lambda: box.append(run_probe(syspath, probe, token)),
+                              name="montecarlo-probe", daemon=True)
+    worker.start()
+    worker.join(timeout)
+    if box:
+        return box[0]
+    return Result(probe, TIMEOUT, f"no answer after {timeout:.1f}s", timeout)
+
+
+def run(syspath, log=print, token=None, probes=None, history=None, budget=None, progress=None):
+    """
+    Try `probes` (default: the simulate() ranking) until one matches.
+
+    log(text, tag=None) gets the running commentary, progress(Progress)
+    the counters. Stops at the first match, when `token` is cancelled, or
+    when the budget (default Budget()) runs out. A probe that times out
+    ends the run: the kernel is still busy with it, so nothing else is
+    started meanwhile. Returns the matching Result or None.
+    """
+    if history is None:
+        history = History()
+    if budget is None:
+        budget = Budget()
+    if probes is None:
+        probes = simulate(syspath, history=history).probes()
+    device_id = modalias.device_modalias(syspath)
+
+    binds = sum(1 for p in probes if p.mode == BIND)
+    log(f"Found {len(probes)} candidate drivers ({binds} registered on the device's bus, "
+        f"{len(probes) - binds} to load).")
+
+    if budget.max_probes is not None and len(probes) > budget.max_probes:
+        log(f"Limiting the run to the first {budget.max_probes} of {len(probes)} probes.")
+        probes = probes[:budget.max_probes]
+
+    costs = _Costs()
+    start = time.monotonic()
+    total = len(probes)
+
+    def report(done, probe=None):
+        if progress:
+            progress(Progress(done, total, time.monotonic() - start, costs.eta(probes[done:]), probe))
+
+    for i, probe in enumerate(probes):
+        if token is not None and token.cancelled:
+            log("Auto-Find cancelled.", "bold")
+            report(i)
+            return None
+
+        elapsed = time.monotonic() - start
+        timeout = budget.probe_timeout
+        if budget.deadline is not None:
+            left = budget.deadline - elapsed
+            if left <= 0:
+                log(f"Deadline of {budget.deadline:.0f}s reached after {i} of {total} probes.", "red")
+                report(i)
+                return None
+            timeout = left if timeout is None else min(timeout, left)
+
+        report(i, probe)
+        log(f"Testing candidate {i + 1}/{total}: {probe.driver} ({probe.mode}, "
+            f"ETA {costs.eta(probes[i:]):.1f}s)...")
+        result = _run_bounded(syspath, probe, token, timeout)
+        costs.add(probe.mode, result.seconds)
+        if result.outcome not in (ERROR, TIMEOUT):
+            history.record(device_id, probe.driver, result.matched)
+
+        if result.outcome == BOUND:
+            log(f"  -> MATCH! Device verified bound to {probe.driver}.", "green")
+            report(i + 1)
+            return result
+        if result.outcome == PROBABLE:
+            log(f"  -> PROBABLE MATCH (Dmesg activity) for {probe.driver}.", "green")
+            report(i + 1)
+            return result
+        if result.outcome == TIMEOUT:
+            log(f"  -> {result.detail}; stopping Auto-Find while the kernel finishes it.", "red")
+            report(i + 1)
+            return None
+        if result.outcome == ERROR:
+            log(f"  -> {result.detail}.", "red")
+        else:
+            log(f"  -> {result.detail}.")
+
+    report(total)
+    return None
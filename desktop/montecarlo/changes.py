@@ -0,0 +1,84 @@
+"""
+What changed between a snapshot and this system (or two snapshots).
+
+The comparison runs in libmontecarlo (montecarlo/diff.c): both sides are
+sorted by syspath / module name and merged in one pass, the same code
+behind `montecarlo_cli diff`.
+"""
+import os
+from ctypes import get_errno
+
+from ._binding import (lib, ctx, MCDiffEntry, DIFF_DEVICE_ADDED, DIFF_DEVICE_REMOVED,
+                       DIFF_DEVICE_REBOUND, DIFF_MODULE_LOADED, DIFF_MODULE_UNLOADED,
+                       DIFF_MODULE_IDLE, DIFF_MODULE_IN_USE, DIFF_MODULE_REFCOUNT)
+
+ADDED = DIFF_DEVICE_ADDED
+REMOVED = DIFF_DEVICE_REMOVED
+REBOUND = DIFF_DEVICE_REBOUND
+LOADED = DIFF_MODULE_LOADED
+UNLOADED = DIFF_MODULE_UNLOADED
+NOW_IDLE = DIFF_MODULE_IDLE
+NOW_IN_USE = DIFF_MODULE_IN_USE
+REFCOUNT = DIFF_MODULE_REFCOUNT
+
+
+class Change:
+    """One difference. `key` is a syspath for device changes, a module name otherwise."""
+
+    __slots__ = ("kind", "key", "before", "after", "refcount_before", "refcount_after")
+
+    def __init__(self, rec):
+        self.kind = rec.kind
+        self.key = rec.key.decode("utf-8", "ignore")
+        self.before = rec.before.decode("utf-8", "ignore") or None
+        self.after = rec.after.decode("utf-8", "ignore") or None
+        self.refcount_before = rec.refcount_before
+        self.refcount_after = rec.refcount_after
+
+    @property
+    def is_module(self):
+        return self.kind >= DIFF_MODULE_LOADED
+
+    @property
+    def kind_name(self):
+        """"added", "removed", "rebound", "loaded", "unloaded", "now_idle", "now_in_use", "refcount"."""
+        return lib().mc_diff_kind_name(self.kind).decode()
+
+    def __repr__(self):
+        return f"Change({self.kind_name}, {self.key!r}, {self.before!r} -> {self.after!r})"
+
+
+class _Root:
+    """A context for another tree, freed when done."""
+
+    def __init__(self, root):
+        self.handle = lib().mc_ctx_new(os.fsencode(root)) if root is not None else None
+
+    def __enter__(self):
+        if self.handle is None:
+            return ctx()
+        return self.handle
+
+    def __exit__(self, *exc):
+        if self.handle:
+            lib().mc_ctx_free(self.handle)
+            self.handle = None
+
+
+def diff(before, after=None, size_hint=64):
+    """
+    Changes from the tree at `before` to `after` (None = the current root),
+    devices first, then modules, each sorted by key. Raises OSError when a
+    side has no readable proc/modules.
+    """
+    with _Root(before) as a, _Root(after) as b:
+        size = size_hint
+        while True:
+            buf = (MCDiffEntry * size)()
+            count = lib().mc_ctx_diff(a, b, buf, size)
+            if count < 0:
+                errno = get_errno()
+                raise OSError(errno, os.strerror(errno), before)
+            if count < size:
+                return [Change(buf[i]) for i in range(count)]
+            size *= 2
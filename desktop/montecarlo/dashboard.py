@@ -0,0 +1,262 @@
+"""
+Dashboard scan: the device and module rows the Devices tab shows, and the
+per-module memory view with what unloading the idle drivers would free.
+
+Pure data, no GTK, so the UI thread, the benchmarks and tooling share it.
+Device enumeration, the module graph and the per-module .modinfo checks run
+on worker threads, each with its own libmontecarlo context.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from . import modinfo, restore, rules
+from ._binding import lib, ctx
+from .devices import list_devices
+from .modules import ModuleGraph
+
+# Workers for the scan; .modinfo checks read (and may decompress) module files
+SCAN_WORKERS = 8
+
+# Module memory verdicts, in the order they are checked
+HELD = "held"                   # other modules use it
+BOUND = "bound"                 # a device is bound to it
+BUSY = "busy"                   # refcount above 0 or not Live (loading, unloading)
+PROTECTED = "protected"         # fails is_safe_module
+RECLAIMABLE = "reclaimable"
+
+
+def is_safe_module(mod):
+    """
+    Check if module is safe to show for unloading.
+    STRICT FILTERING: Only real hardware drivers, never kernel subsystems.
+    """
+
+    # ========================================
+    # CATEGORY 1+2: SITE RULES (NEVER TOUCH)
+    # ========================================
+    # Kernel core, filesystems, netfilter, crypto, bus infrastructure...
+    # as exact names and prefixes in rules.conf (one trie/hash lookup)
+
+    if rules.protected_module(mod):
+        return False
+
+    # ========================================
+    # CATEGORY 3: HARDWARE MODALIAS CHECK
+    # ========================================
+    # STRICT: Module MUST have real hardware alias
+
+    info = modinfo.lookup(mod)
+    if not info or not info.get("alias"):
+        # No aliases (or no readable module file) = not a hardware driver, reject for safety
+        return False
+
+    # Check if ANY alias indicates real hardware (hw-alias rules)
+    has_hardware_alias = any(rules.hardware_alias(alias.strip()) for alias in info["alias"])
+
+    # STRICT: If no hardware alias, reject
+    if not has_hardware_alias:
+        return False
+
+    # ========================================
+    # PASSED ALL CHECKS
+    # ========================================
+    return True
+
+
+def scan_rows():
+    """
+    Rows for the dashboard store: [syspath, vidpid, product, driver, icon].
+    Devices first, then safe loaded modules that have no hardware present.
+    """
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as pool:
+        # 1. Physical Devices and 2. Loaded Modules (one /proc/modules read
+        # for names, holders and refcounts), side by side
+        devices_job = pool.submit(list_devices)
+        graph_job = pool.submit(ModuleGraph)
+        devices = devices_job.result()
+        graph = graph_job.result()
+        return _build_rows(pool, devices, graph)
+
+
+def _build_rows(pool, devices, graph):
+    # Track used drivers
+    used_drivers = set()
+
+    # Prepare list for UI
+    ui_list = []
+
+    for d in devices:
+        s_syspath = d.syspath
+        s_vidpid = d.vidpid
+        s_product = d.product
+        s_driver = d.driver
+
+        if s_driver != "None":
+            used_drivers.add(s_driver)
+            # USER REQ: Explicitly show (In Use)
+            s_driver_display = f"{s_driver} (In Use)"
+        else:
+            s_driver_display = s_driver
+
+        icon = "drive-harddisk-usb" # default
+        p_lower = s_product.lower()
+        d_lower = s_driver.lower()
+
+        if "mouse" in p_lower: icon = "input-mouse"
+        elif "keyboard" in p_lower: icon = "input-keyboard"
+        elif "hub" in p_lower: icon = "network-server"
+        elif "cam" in p_lower or "video" in p_lower: icon = "camera-web"
+        elif "audio" in p_lower or "sound" in p_lower: icon = "audio-card"
+        elif "print" in p_lower: icon = "printer"
+        elif "storage" in p_lower or "flash" in p_lower: icon = "drive-removable-media"
+        elif "bluetooth" in p_lower: icon = "bluetooth"
+        elif "net" in p_lower or "wifi" in p_lower or "wlan" in p_lower: icon = "network-wireless"
+
+        ui_list.append([
+            s_syspath,
+            s_vidpid,
+            s_product,
+            s_driver_display, # Use display version
+            icon
+        ])
+
+    # 3. Add Loaded Modules that DON'T have hardware present (Idle modules)
+    # CRITICAL: Only show SAFE modules that users can actually unload
+    # DO NOT show kernel subsystems (filesystems, netfilter, crypto, etc.)
+
+    # Skip modules already shown as in-use and those with holders (dependencies)
+    idle = [mod for mod in graph.names
+            if mod not in used_drivers and not graph.has_holders(mod)]
+
+    # CRITICAL: Only show safe modules (one modinfo per module, in parallel)
+    safe = pool.map(is_safe_module, idle)
+
+    for mod, is_safe in zip(idle, safe):
+        if not is_safe:
+            continue
+
+        # Check if actually in use via bus binding
+        in_use = lib().mc_ctx_driver_is_in_use(ctx(), mod.encode('utf-8'))
+
+        # Determine status
+        if in_use:
+            status_str = "Loaded Module (In Use)"
+            status_tag = " (In Use)"
+            icon_name = "package-x-generic"
+        else:
+            status_str = "Loaded Module (Idle)"
+            status_tag = " (Idle)"
+            icon_name = "application-x-addon"
+
+        # Show it in dashboard
+        ui_list.append([
+            f"module:{mod}",      # syspath (or module ID)
+            "Module",              # vidpid (show as "Module" to distinguish)
+            status_str,            # product (display name)
+            mod + status_tag,      #driver (module name with status)
+            icon_name              # icon
+        ])
+
+    return ui_list
+
+
+class ModuleMemory:
+    """One loaded module in the memory view."""
+
+    __slots__ = ("name", "size", "refcount", "state", "taint", "verdict")
+
+    def __init__(self, name, size, refcount, state, taint, verdict):
+        self.name = name
+        self.size = size
+        self.refcount = refcount
+        self.state = state
+        self.taint = taint
+        self.verdict = verdict
+
+    @property
+    def reclaimable(self):
+        return self.verdict == RECLAIMABLE
+
+    def __repr__(self):
+        return f"ModuleMemory({self.name!r}, {self.size}, {self.verdict})"
+
+
+def module_memory(graph=None):
+    """
+    Every loaded module with its size and why it can or can't be trimmed,
+    largest first. Reclaimable means an idle hardware driver: passes
+    is_safe_module, has no holders and no bound device, and is Live with
+    a refcount of 0 (anything else would make rmmod fail).
+    """
+    graph = graph or ModuleGraph()
+    bound = restore.module_bound_devices(graph.names)     # every bus, not just pci/usb/pcmcia
+    mods = []
+    candidates = []
+    for mod in graph.names:
+        refcount = graph.refcount(mod)
+        state = graph.state(mod)
+        if graph.has_holders(mod):
+            verdict = HELD
+        elif mod in bound:
+            verdict = BOUND
+        elif refcount != 0 or state not in ("Live", ""):
+            verdict = BUSY
+        else:
+            verdict = None      # decided by the .modinfo check below
+            candidates.append(mod)
+        mods.append(ModuleMemory(mod, max(graph.size(mod), 0), refcount, state, graph.taint(mod), verdict))
+
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as pool:
+        safe = dict(zip(candidates, pool.map(is_safe_module, candidates)))
+    for m in mods:
+        if m.verdict is None:
+            m.verdict = RECLAIMABLE if safe[m.name] else PROTECTED
+
+    mods.sort(key=lambda m: (-m.size, m.name))
+    return mods
+
+
+def trim_args(mods):
+    """
+    `montecarlo-helper restore` arguments unloading the reclaimable modules
+    of module_memory(). None of them has holders, so they form one level
+    and are removed in parallel.
+    """
+    names = [m.name for m in mods if m.reclaimable]
+    return ["-u", ",".join(names)] if names else []
+
+
+def unload_stack_plan(module, graph=None, bound_devices=restore.module_bound_devices,
+                      unloadable=is_safe_module):
+    """
+    Unload plan for `module` and everything holding it: (plan, blocked, bindings).
+
+    plan is in topological unload order, ending with `module`. blocked lists
+    (module, reason) pairs among the holders that make the plan unsafe: bound
+    to a device, protected, or busy with references beyond their holders.
+    `module` itself is never blocked - the user picked it from its device
+    row - and bindings are its own (driver, syspath) pairs, for the in-use
+    warning and the Restore tab.
+    """
+    graph = graph or ModuleGraph()
+    plan = graph.unload_order(module)
+    bound = bound_devices(plan)
+    blocked = []
+
+    for mod in plan:
+        if mod == module:
+            continue
+        if mod in bound:
+            devices = ", ".join(syspath.rsplit("/", 1)[-1] for _, syspath in bound[mod])
+            blocked.append((mod, f"bound to {devices}"))
+            continue
+
+        if not unloadable(mod):
+            blocked.append((mod, "protected (not a hardware driver or listed in rules.conf)"))
+            continue
+
+        # References beyond the holders come from userspace (open devices, sockets...)
+        ref = graph.refcount(mod)
+        if ref > len(graph.holders(mod)):
+            blocked.append((mod, f"busy (refcnt={ref})"))
+
+    return plan, blocked, bound.get(module, [])
@@ -0,0 +1,128 @@
+"""
+Device records over the mc_list_all_devices buffer.
+
+Records keep a reference to their slot in the ctypes array and decode a
+field only the first time it is read.
+"""
+from ctypes import create_string_buffer
+from functools import partial
+
+from ._binding import lib, ctx, MCDeviceInfo, MCDeviceExplain, DriverName, MC_HWDB_NAME_MAX, REASON_PCI_BRIDGE
+
+
+class _Text:
+    """Decode a c_char field of the underlying record on first access."""
+
+    __slots__ = ("field", "slot")
+
+    def __init__(self, field):
+        self.field = field
+        self.slot = "_" + field
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        value = getattr(obj, self.slot)
+        if value is None:
+            value = getattr(obj._rec, self.field).decode("utf-8", "ignore")
+            setattr(obj, self.slot, value)
+        return value
+
+
+class Device:
+    """One dashboard device (a view over an MCDeviceInfo record)."""
+
+    __slots__ = ("_rec", "_syspath", "_vidpid", "_product", "_driver", "_subsystem")
+
+    syspath = _Text("syspath")
+    vidpid = _Text("vidpid")
+    product = _Text("product")
+    driver = _Text("driver")
+    subsystem = _Text("subsystem")
+
+    def __init__(self, rec):
+        self._rec = rec
+        self._syspath = self._vidpid = self._product = None
+        self._driver = self._subsystem = None
+
+    @property
+    def bound(self):
+        """True if a driver is bound ("None" is what the library reports otherwise)."""
+        return self.driver != "None"
+
+    def __repr__(self):
+        return f"Device({self.syspath!r}, driver={self.driver!r})"
+
+
+class ExplainedDevice(Device):
+    """A device the filter saw, shown or not, with the reason code it was given."""
+
+    __slots__ = ("reason",)
+
+    def __init__(self, rec):
+        super().__init__(rec.info)
+        self.reason = rec.reason
+
+    @property
+    def shown(self):
+        return self.reason < REASON_PCI_BRIDGE
+
+    @property
+    def reason_name(self):
+        """"shown", "mass_storage", "bridge", "usb_hub"... (see mc_reason_name)."""
+        return lib().mc_reason_name(self.reason).decode()
+
+    def __repr__(self):
+        return f"ExplainedDevice({self.syspath!r}, reason={self.reason_name!r})"
+
+
+def _fill(fn, item_type, size_hint):
+    """Call a C list function, growing the buffer until the result fits."""
+    size = max(size_hint, 1)
+    while True:
+        buf = (item_type * size)()
+        count = fn(buf, size)
+        if count < size:
+            return buf, count
+        size *= 2
+
+
+def iter_devices(size_hint=128):
+    """Yield a Device for every device the dashboard would show."""
+    buf, count = _fill(partial(lib().mc_ctx_list_all_devices, ctx()), MCDeviceInfo, size_hint)
+    for i in range(count):
+        yield Device(buf[i])
+
+
+def list_devices(size_hint=128):
+    return list(iter_devices(size_hint))
+
+
+def iter_explained(size_hint=256):
+    """Yield an ExplainedDevice for every device walked, hidden ones included."""
+    buf, count = _fill(partial(lib().mc_ctx_explain_devices, ctx()), MCDeviceExplain, size_hint)
+    for i in range(count):
+        yield ExplainedDevice(buf[i])
+
+
+def iter_candidate_drivers(size_hint=256):
+    """Yield the names of drivers registered under /sys/bus/*/drivers."""
+    buf, count = _fill(partial(lib().mc_ctx_list_candidate_drivers, ctx()), DriverName, size_hint)
+    for i in range(count):
+        yield buf[i].value.decode("utf-8", "ignore")
+
+
+def device_name(syspath):
+    """Display name of any device, shown or filtered (hwdb names, no lspci/lsusb)."""
+    buf = create_string_buffer(256)
+    if lib().mc_ctx_device_name(ctx(), syspath.encode("utf-8"), buf, len(buf)) != 0:
+        return None
+    return buf.value.decode("utf-8", "ignore")
+
+
+def hwdb_name(bus, vendor_id, product_id):
+    """(vendor, model) names from the hwdb for a USB/PCI ID pair; "" when unknown."""
+    vendor = create_string_buffer(MC_HWDB_NAME_MAX)
+    model = create_string_buffer(MC_HWDB_NAME_MAX)
+    lib().mc_hwdb_device_name(bus.encode(), vendor_id.encode(), product_id.encode(), vendor, model)
+    return vendor.value.decode("utf-8", "ignore"), model.value.decode("utf-8", "ignore")
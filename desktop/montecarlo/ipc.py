@@ -0,0 +1,59 @@
+"""
+Daemon socket: path, subscription handshake and single-instance activation.
+
+Kept free of GTK so ui.py can hand a device to a running window before it
+imports anything heavy.
+"""
+import json
+import os
+import socket
+
+
+def socket_path():
+    """Per-user daemon socket (same logic as mc_get_socket_path)."""
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR")
+    uid = os.getuid()
+
+    if runtime_dir:
+        return os.path.join(runtime_dir, "montecarlo.sock")
+
+    # Check if /run/user/$UID exists
+    runtime_path = f"/run/user/{uid}"
+    if os.access(runtime_path, os.W_OK):
+        return os.path.join(runtime_path, "montecarlo.sock")
+
+    # Fallback to /tmp with UID
+    return f"/tmp/montecarlo-{uid}.sock"
+
+
+def request(sock, cmd, **fields):
+    """Send one request line."""
+    sock.sendall((json.dumps(dict(cmd=cmd, **fields)) + "\n").encode("utf-8"))
+
+
+def hello_ui(sock):
+    """Register this connection as the UI, so the daemon activates it."""
+    request(sock, "hello", role="ui", pid=os.getpid())
+
+
+def activate_running_ui(syspath=None, timeout=0.5):
+    """
+    Ask the daemon to bring an already running UI to the front (with the
+    device, if given). True if a UI took it; False if there is none or no
+    daemon, in which case the caller should start the UI itself.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path())
+            fields = {"syspath": syspath} if syspath else {}
+            request(sock, "activate", **fields)
+
+            with sock.makefile("r", encoding="utf-8") as stream:
+                for line in stream:
+                    msg = json.loads(line)
+                    if msg.get("event") == "activated":
+                        return msg.get("ui", 0) > 0
+    except (OSError, ValueError):
+        pass
+    return False
@@ -0,0 +1,260 @@
+"""
+Queue for privileged operations (pkexec montecarlo-helper ...).
+
+Each job is one helper invocation, run on a worker thread so the main loop
+never waits for authentication or the kernel:
+
+- jobs sharing a `key` (a module or service name) run in submission order;
+  jobs on different keys run side by side, up to `max_workers` at once;
+- a queued job can be dropped and one waiting for authentication terminated
+  (killing pkexec closes its prompt); once the helper runs as root it can
+  no longer be signalled and its real result is kept;
+- `settle=True` waits for udev after a successful job, still off the main loop.
+
+GTK-free like tasks.py: every state change is passed to `on_change(job)` and
+every finished job to its `on_done(job)`, both through `deliver`
+(GLib.idle_add in the UI).
+"""
+import itertools
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = "queued"
+RUNNING = "running"
+SETTLING = "settling"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED = (DONE, FAILED, CANCELLED)
+
+SETTLE_CMD = ["udevadm", "settle", "--timeout=2"]
+
+POLKIT_MISSING = "PolicyKit not available. Install policykit-1."
+
+
+class Job:
+    __slots__ = ("id", "title", "argv", "key", "timeout", "settle", "on_done",
+                 "state", "returncode", "stdout", "stderr", "error",
+                 "submitted", "started", "finished", "_proc", "_cancel")
+
+    def __init__(self, job_id, title, argv, key, timeout, settle, on_done):
+        self.id = job_id
+        self.title = title
+        self.argv = list(argv)
+        self.key = key
+        self.timeout = timeout
+        self.settle = settle
+        self.on_done = on_done
+        self.state = QUEUED
+        self.returncode = None
+        self.stdout = ""
+        self.stderr = ""
+        self.error = None
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+        self._proc = None
+        self._cancel = False
+
+    @property
+    def ok(self):
+        return self.state == DONE
+
+    @property
+    def active(self):
+        return self.state not in FINISHED
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def message(self):
+        """One-line result for logs and the jobs list."""
+        if self.state == DONE:
+            return "OK"
+        if self.state == CANCELLED:
+            return "Cancelled"
+        if self.error:
+            return self.error
+        if self.state == FAILED:
+            return self.stderr.strip() or f"exit status {self.returncode}"
+        return ""
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.title!r} {self.state}>"
+
+
+class JobQueue:
+    def __init__(self, deliver, on_change=None, max_workers=2):
+        self._deliver = deliver
+        self._on_change = on_change
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="montecarlo-job")
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._jobs = {}
+        self._lanes = {}  # key -> deque of jobs waiting behind the running one
+
+    def submit(self, title, argv, key=None, timeout=30, settle=False, on_done=None):
+        """Queue `argv`; returns the Job at once."""
+        with self._lock:
+            job = Job(next(self._ids), title, argv, key, timeout, settle, on_done)
+            self._jobs[job.id] = job
+
+            lane = self._lanes.get(key) if key is not None else None
+            if lane is not None:
+                lane.append(job)
+            else:
+                if key is not None:
+                    self._lanes[key] = deque()
+                self._pool.submit(self._run, job)
+
+        self._changed(job)
+        return job
+
+    def cancel(self, job):
+        """Drop a queued job or terminate a running one. Returns False if already finished."""
+        with self._lock:
+            if not job.active:
+                return False
+            job._cancel = True
+            proc = job._proc
+            lane = self._lanes.get(job.key)
+            if job.state == QUEUED and lane is not None and job in lane:
+                lane.remove(job)
+                self._finish_locked(job, CANCELLED)
+                dropped = True
+            else:
+                dropped = False
+
+        if dropped:
+            self._completed(job)
+        elif proc is not None:
+            try:
+                proc.terminate()
+            except OSError:
+                pass  # already root: let it finish
+        return True
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.id)
+
+    def active(self):
+        with self._lock:
+            return [j for j in self._jobs.values() if j.active]
+
+    def forget_finished(self):
+        with self._lock:
+            for job_id in [i for i, j in self._jobs.items() if not j.active]:
+                del self._jobs[job_id]
+
+    def shutdown(self):
+        for job in self.active():
+            self.cancel(job)
+        self._pool.shutdown(wait=False)
+
+    # Worker side
+
+    def _run(self, job):
+        with self._lock:
+            if job._cancel:
+                self._finish_locked(job, CANCELLED)
+            else:
+                job.state = RUNNING
+                job.started = time.monotonic()
+
+        if job.state == RUNNING:
+            self._changed(job)
+            self._execute(job)
+
+        self._completed(job)
+        self._next(job.key)
+
+    def _execute(self, job):
+        try:
+            proc = subprocess.Popen(job.argv, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, text=True)
+        except FileNotFoundError:
+            job.error = POLKIT_MISSING
+            self._finish(job, FAILED)
+            return
+        except OSError as e:
+            job.error = str(e)
+            self._finish(job, FAILED)
+            return
+
+        with self._lock:
+            job._proc = proc
+            cancelled = job._cancel
+        if cancelled:
+            proc.terminate()
+
+        try:
+            job.stdout, job.stderr = proc.communicate(timeout=job.timeout)
+        except subprocess.TimeoutExpired:
+            try:
+                proc.kill()
+            except OSError:
+                pass
+            job.stdout, job.stderr = proc.communicate()
+            job.error = "Timeout waiting for authentication."
+        job.returncode = proc.returncode
+
+        # Too late to cancel once the helper runs as root: a success still counts
+        if job._cancel and job.returncode != 0:
+            self._finish(job, CANCELLED)
+        elif job.error or job.returncode != 0:
+            self._finish(job, FAILED)
+        else:
+            if job.settle:
+                job.state = SETTLING
+                self._changed(job)
+                try:
+                    subprocess.run(SETTLE_CMD, capture_output=True, timeout=job.timeout)
+                except (OSError, subprocess.TimeoutExpired):
+                    pass
+            self._finish(job, DONE)
+
+    def _finish(self, job, state):
+        with self._lock:
+            self._finish_locked(job, state)
+
+    def _finish_locked(self, job, state):
+        job.state = state
+        job.finished = time.monotonic()
+        job._proc = None
+
+    def _next(self, key):
+        if key is None:
+            return
+        with self._lock:
+            lane = self._lanes.get(key)
+            if lane:
+                self._pool.submit(self._run, lane.popleft())
+            else:
+                self._lanes.pop(key, None)
+
+    def _changed(self, job):
+        if self._on_change:
+            self._deliver(self._main_loop, self._on_change, job)
+
+    def _completed(self, job):
+        self._changed(job)
+        if job.on_done:
+            self._deliver(self._main_loop, job.on_done, job)
+
+    @staticmethod
+    def _main_loop(callback, job):
+        callback(job)
+        return False
@@ -0,0 +1,128 @@
+"""
+Module alias and blacklist lookups for a device.
+
+modules.alias maps modalias patterns ("usb:v046Dp*d*...") to modules, the
+same table modprobe uses to pick drivers. Lookups go through the mapped
+module index (modindex.py) when it is current; otherwise the text file is
+parsed, grouped by bus prefix and kept until it changes. Blacklists come
+from the modprobe.d directories. Everything is read under the root prefix.
+"""
+import glob
+import os
+import threading
+from fnmatch import fnmatchcase
+
+from . import modindex
+from .root import host_path, kernel_release
+
+MODPROBE_DIRS = ["/etc/modprobe.d", "/run/modprobe.d", "/usr/local/lib/modprobe.d",
+                 "/usr/lib/modprobe.d", "/lib/modprobe.d"]
+
+_WILDCARDS = "*?["
+
+# alias_table() key of the patterns with a glob in their bus part
+WILD_BUS = "*"
+
+_lock = threading.Lock()
+_aliases = {"key": None, "table": {}}
+_blacklist = {"key": None, "names": frozenset()}
+
+
+def device_modalias(syspath):
+    """The device's modalias attribute, or None."""
+    try:
+        with open(host_path(syspath) + "/modalias") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def specificity(pattern):
+    """Literal characters after the bus prefix: usb:v046Dp*d*... beats usb:v*p*d*..."""
+    body = pattern.split(":", 1)[-1]
+    return sum(1 for c in body if c not in _WILDCARDS)
+
+
+def _stat_key(paths):
+    key = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            key.append((path, st.st_mtime_ns, st.st_size))
+        except OSError:
+            pass
+    return tuple(key)
+
+
+def alias_table():
+    """{bus prefix or WILD_BUS: [(pattern, module)]} from modules.alias of the tree's kernel."""
+    path = host_path(f"/lib/modules/{kernel_release()}/modules.alias")
+    key = _stat_key([path])
+    with _lock:
+        if _aliases["key"] == key:
+            return _aliases["table"]
+
+    table = {}
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) != 3 or parts[0] != "alias":
+                    continue
+                pattern, module = parts[1], parts[2]
+                bus = pattern.split(":", 1)[0]
+                # "acpi*:PNP0C0A:*" can match more than one bus: kept under WILD_BUS
+                table.setdefault(WILD_BUS if any(c in _WILDCARDS for c in bus) else bus, []).append((pattern, module))
+    except OSError:
+        pass
+
+    with _lock:
+        _aliases["key"] = key
+        _aliases["table"] = table
+    return table
+
+
+def match(modalias):
+    """[(module, pattern)] whose alias pattern matches `modalias`, most specific first."""
+    if not modalias:
+        return []
+    index = modindex.current()
+    if index is not None:
+        hits = index.match(modalias)
+    else:
+        prefix = modalias.split(":", 1)[0]
+        table = alias_table()
+        hits = [(module, pattern) for pattern, module in table.get(prefix, []) + table.get(WILD_BUS, [])
+                if fnmatchcase(modalias, pattern)]
+    hits.sort(key=lambda hit: -specificity(hit[1]))
+    return hits
+
+
+def blacklisted():
+    """Module names listed as `blacklist` (or `install <m> /bin/false`) in modprobe.d."""
+    files = []
+    for d in MODPROBE_DIRS:
+        files.extend(sorted(glob.glob(host_path(d) + "/*.conf")))
+    key = _stat_key(files)
+    with _lock:
+        if _blacklist["key"] == key:
+            return _blacklist["names"]
+
+    names = set()
+    for path in files:
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    parts = line.split("#", 1)[0].split()
+                    if len(parts) >= 2 and parts[0] == "blacklist":
+                        names.add(parts[1].replace("-", "_"))
+                    elif len(parts) >= 3 and parts[0] == "install" and parts[2] in ("/bin/false", "/bin/true"):
+                        names.add(parts[1].replace("-", "_"))
+        except OSError:
+            pass
+
+    names = frozenset(names)
+    with _lock:
+        _blacklist["key"] = key
+        _blacklist["names"] = names
+    return names
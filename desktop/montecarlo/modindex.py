@@ -0,0 +1,204 @@
+"""
+Reader for the binary module index written by `montecarlo_cli index build`.
+
+The file (/var/cache/montecarlo/modindex-<kernel>.bin, layout in
+heads/modindex.h) is mapped read-only, so every process shares one copy of
+the module and alias tables and a lookup touches only the pages it needs
+instead of re-parsing modules.alias. current() hands out the index of the
+tree's kernel, or None when it is missing or older than depmod's output;
+callers then fall back to the text files.
+"""
+import mmap
+import os
+import struct
+import threading
+from fnmatch import fnmatchcase
+
+from .root import host_path, kernel_release
+
+MAGIC = b"MCMODIDX"
+VERSION = 2
+INDEX_DIR = "/var/cache/montecarlo"
+
+BUILTIN = 0x1
+UNLISTED = 0x2  # file on disk missing from modules.dep
+
+_HEADER = struct.Struct("<8sII64sqqIIIIIIIIII")
+_MODULE = struct.Struct("<IIIIII")
+_ALIAS = struct.Struct("<II")
+_DEP = struct.Struct("<I")
+_WILD = struct.Struct("<I")
+
+_lock = threading.Lock()
+_current = {"key": None, "index": None}
+
+
+def index_path(kernel=None):
+    """Default index path for `kernel` (the tree's kernel if None)."""
+    return host_path(f"{INDEX_DIR}/modindex-{kernel or kernel_release()}.bin")
+
+
+def _mtime(path):
+    try:
+        return int(os.stat(path).st_mtime)
+    except OSError:
+        return 0
+
+
+class ModIndex:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._load()
+        except (ValueError, struct.error):
+            self._map.close()
+            raise
+
+    def _load(self):
+        size = len(self._map)
+        if size < _HEADER.size:
+            raise ValueError("truncated module index")
+        (magic, version, header_size, kernel, self.dep_mtime, self.alias_mtime,
+         self._module_count, self._modules_off, self._alias_count, self._aliases_off,
+         self._dep_count, self._deps_off, strings_size, self._strings_off,
+         self._wild_count, self._wild_off) = _HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION or header_size != _HEADER.size:
+            raise ValueError("not a module index (or another version)")
+        for off, count, item in ((self._modules_off, self._module_count, _MODULE.size),
+                                 (self._aliases_off, self._alias_count, _ALIAS.size),
+                                 (self._deps_off, self._dep_count, _DEP.size),
+                                 (self._wild_off, self._wild_count, _WILD.size),
+                                 (self._strings_off, strings_size, 1)):
+            if off > size or count * item > size - off:
+                raise ValueError("module index section out of bounds")
+        self.kernel = kernel.split(b"\0", 1)[0].decode("utf-8", "replace")
+        self._strings_end = self._strings_off + strings_size
+
+    def close(self):
+        self._map.close()
+
+    def __len__(self):
+        return self._module_count
+
+    @property
+    def alias_count(self):
+        return self._alias_count
+
+    def _string(self, off):
+        start = self._strings_off + off
+        end = self._map.find(b"\0", start, self._strings_end)
+        if end < 0:
+            end = self._strings_end
+        return self._map[start:end].decode("utf-8", "replace")
+
+    def _module(self, i):
+        if not 0 <= i < self._module_count:
+            raise IndexError(i)
+        return _MODULE.unpack_from(self._map, self._modules_off + i * _MODULE.size)
+
+    def name(self, i):
+        return self._string(self._module(i)[0])
+
+    def path(self, i):
+        """Path relative to /lib/modules/<kernel>, "" for built-in modules."""
+        return self._string(self._module(i)[1])
+
+    def description(self, i):
+        return self._string(self._module(i)[2])
+
+    def builtin(self, i):
+        return bool(self._module(i)[5] & BUILTIN)
+
+    def find(self, module):
+        """Index of `module` ('-' and '_' are the same), or -1."""
+        name = module.replace("-", "_")
+        lo, hi = 0, self._module_count - 1
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            probe = self.name(mid)
+            if probe == name:
+                return mid
+            if probe < name:
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        return -1
+
+    def depends(self, module):
+        """Direct dependencies of `module` (names), as listed in modules.dep."""
+        i = self.find(module)
+        if i < 0:
+            return []
+        _, _, _, start, count, _ = self._module(i)
+        off = self._deps_off + start * _DEP.size
+        return [self.name(_DEP.unpack_from(self._map, off + d * _DEP.size)[0]) for d in range(count)]
+
+    def _alias(self, a):
+        pattern, module = _ALIAS.unpack_from(self._map, self._aliases_off + a * _ALIAS.size)
+        return self._string(pattern), module
+
+    def match(self, modalias):
+        """[(module, pattern)] whose alias pattern matches `modalias`, in table order."""
+        if not modalias:
+            return []
+        prefix = modalias.split(":", 1)[0] + ":" if ":" in modalias else modalias
+
+        # Patterns are sorted: the ones sharing the bus prefix form one run
+        lo, hi = 0, self._alias_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._alias(mid)[0][:len(prefix)] < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        run = []
+        for a in range(lo, self._alias_count):
+            if not self._alias(a)[0].startswith(prefix):
+                break
+            run.append(a)
+
+        # Plus the patterns with a glob in the bus part ("acpi*:..."), which sort elsewhere
+        wild = [_WILD.unpack_from(self._map, self._wild_off + w * _WILD.size)[0] for w in range(self._wild_count)]
+
+        hits = []
+        for a in sorted(set(run).union(wild)):
+            pattern, module = self._alias(a)
+            if fnmatchcase(modalias, pattern):
+                hits.append((self.name(module), pattern))
+        return hits
+
+
+def current():
+    """Index of the tree's kernel, or None if it is missing, unreadable or stale."""
+    kernel = kernel_release()
+    path = index_path(kernel)
+    base = host_path(f"/lib/modules/{kernel}")
+    dep_mtime = _mtime(base + "/modules.dep")
+    alias_mtime = _mtime(base + "/modules.alias")
+    try:
+        st = os.stat(path)
+        key = (path, st.st_ino, st.st_mtime_ns, st.st_size, dep_mtime, alias_mtime)
+    except OSError:
+        key = None
+
+    with _lock:
+        if _current["key"] == key and key is not None:
+            return _current["index"]
+
+    index = None
+    if key is not None:
+        try:
+            index = ModIndex(path)
+        except (OSError, ValueError):
+            index = None
+        if index is not None and (index.dep_mtime, index.alias_mtime) != (dep_mtime, alias_mtime):
+            index.close()
+            index = None
+
+    # The previous mapping is left to the garbage collector: another thread may still use it
+    with _lock:
+        _current["key"] = key
+        _current["index"] = index
+    return index
@@ -0,0 +1,122 @@
+"""
+Module metadata read straight from the module files, without modinfo(8).
+
+libmontecarlo extracts the .modinfo section of .ko, .ko.xz and .ko.zst
+files (see montecarlo/modinfo.c); this module turns it into a dict of
+lists (`alias`, `depends`, `firmware`, `parm` repeat) and finds a module's
+file through the module index, or modules.dep when there is no index.
+"""
+import ctypes
+import os
+import threading
+
+from . import modindex
+from ._binding import lib
+from .root import host_path, kernel_release
+
+_BUF_SIZE = 64 * 1024
+
+_lock = threading.Lock()
+_dep_paths = {"key": None, "paths": {}, "deps": {}}
+
+
+def read(path):
+    """{key: [values]} from the module file at `path` (already root-prefixed), or None."""
+    size = _BUF_SIZE
+    while True:
+        buf = ctypes.create_string_buffer(size)
+        n = lib().mc_modinfo_read(os.fsencode(path), buf, size)
+        if n < 0:
+            return None
+        if n <= size:
+            break
+        size = n
+
+    info = {}
+    for entry in buf.raw[:n].split(b"\0"):
+        key, sep, value = entry.partition(b"=")
+        if sep:
+            info.setdefault(key.decode("utf-8", "replace"), []).append(value.decode("utf-8", "replace"))
+    return info
+
+
+def _module_name(rel):
+    return os.path.basename(rel).split(".ko", 1)[0].replace("-", "_")
+
+
+def _modules_dep(base):
+    """({module: relative path}, {module: [direct deps]}) from modules.dep, kept until the file changes."""
+    path = base + "/modules.dep"
+    try:
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+    except OSError:
+        return {}, {}
+    with _lock:
+        if _dep_paths["key"] == key:
+            return _dep_paths["paths"], _dep_paths["deps"]
+
+    paths, deps = {}, {}
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                rel, _, rest = line.partition(":")
+                rel = rel.strip()
+                if rel:
+                    name = _module_name(rel)
+                    paths[name] = rel
+                    deps[name] = [_module_name(d) for d in rest.split()]
+    except OSError:
+        pass
+
+    with _lock:
+        _dep_paths["key"] = key
+        _dep_paths["paths"] = paths
+        _dep_paths["deps"] = deps
+    return paths, deps
+
+
+def _modules_dep_paths(base):
+    return _modules_dep(base)[0]
+
+
+def module_file(module):
+    """Root-prefixed file of `module`, or None (unknown or built into the kernel)."""
+    base = host_path(f"/lib/modules/{kernel_release()}")
+    name = module.replace("-", "_")
+
+    index = modindex.current()
+    if index is not None:
+        i = index.find(name)
+        rel = index.path(i) if i >= 0 else ""
+    else:
+        rel = _modules_dep_paths(base).get(name, "")
+    return f"{base}/{rel}" if rel else None
+
+
+def depends(module):
+    """Direct dependencies of an installed module (modules.dep, through the index if present)."""
+    index = modindex.current()
+    if index is not None:
+        return index.depends(module)
+    base = host_path(f"/lib/modules/{kernel_release()}")
+    return list(_modules_dep(base)[1].get(module.replace("-", "_"), []))
+
+
+def lookup(module):
+    """{key: [values]} for an installed module by name, or None."""
+    path = module_file(module)
+    return read(path) if path else None
+
+
+def description(module):
+    """One-line description of `module`, or None."""
+    index = modindex.current()
+    if index is not None:
+        i = index.find(module)
+        if i >= 0:
+            return index.description(i) or None
+    info = lookup(module)
+    if info and info.get("description"):
+        return info["description"][0]
+    return None
@@ -0,0 +1,86 @@
+"""Loaded-module queries backed by the libmontecarlo module graph."""
+from ._binding import lib, ctx, ModuleName
+
+
+class ModuleGraph:
+    """Snapshot of /proc/modules: sizes, refcounts, states, holders and dependencies.
+
+    Built from a single read; every query afterwards is a hash lookup in
+    libmontecarlo instead of a trip through /sys/module.
+    """
+
+    def __init__(self):
+        self._lib = lib()
+        self._handle = self._lib.mc_ctx_modgraph_new(ctx())
+        self.names = []
+        if self._handle:
+            name = self._lib.mc_modgraph_name
+            self.names = [name(self._handle, i).decode("utf-8", "ignore")
+                          for i in range(self._lib.mc_modgraph_count(self._handle))]
+
+    def __del__(self):
+        if getattr(self, "_handle", None):
+            self._lib.mc_modgraph_free(self._handle)
+            self._handle = None
+
+    def __contains__(self, module):
+        return bool(self._handle) and self._lib.mc_modgraph_find(self._handle, module.encode("utf-8")) >= 0
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def refcount(self, module):
+        if not self._handle:
+            return self._lib.mc_ctx_get_module_refcount(ctx(), module.encode("utf-8"))
+        return self._lib.mc_modgraph_refcount(self._handle, module.encode("utf-8"))
+
+    def size(self, module):
+        """Core size in bytes, -1 when not loaded."""
+        if not self._handle:
+            return -1
+        return self._lib.mc_modgraph_size(self._handle, module.encode("utf-8"))
+
+    def state(self, module):
+        """"Live", "Loading" or "Unloading"; "" when not loaded."""
+        if not self._handle:
+            return ""
+        return self._lib.mc_modgraph_state(self._handle, module.encode("utf-8")).decode("utf-8", "ignore")
+
+    def taint(self, module):
+        """Taint flags ("OE"...), "" for an untainted module."""
+        if not self._handle:
+            return ""
+        return self._lib.mc_modgraph_taint(self._handle, module.encode("utf-8")).decode("utf-8", "ignore")
+
+    def has_holders(self, module):
+        if not self._handle:
+            return bool(self._lib.mc_ctx_module_has_holders(ctx(), module.encode("utf-8")))
+        return bool(self._lib.mc_modgraph_has_holders(self._handle, module.encode("utf-8")))
+
+    def _names(self, fn, module):
+        if not self._handle:
+            return []
+        max_out = max(len(self.names), 1)
+        buf = (ModuleName * max_out)()
+        n = fn(self._handle, module.encode("utf-8"), buf, max_out)
+        return [buf[i].value.decode("utf-8", "ignore") for i in range(max(n, 0))]
+
+    def holders(self, module):
+        """Modules that use `module`."""
+        return self._names(self._lib.mc_modgraph_holders, module)
+
+    def depends(self, module):
+        """Modules that `module` uses."""
+        return self._names(self._lib.mc_modgraph_depends, module)
+
+    def unload_order(self, module):
+        """`module` and everything holding it, dependents first."""
+        return self._names(self._lib.mc_modgraph_unload_order, module)
+
+
+def loaded_modules():
+    """Set of loaded module names."""
+    return set(ModuleGraph().names)
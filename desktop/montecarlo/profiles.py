@@ -0,0 +1,221 @@
+"""
+Module profiles: named sets of loaded modules and device bindings.
+
+A profile ("docked", "travel", "lab rig"...) is the loaded-module set and
+the (driver, device) bindings at the time it was saved, one JSON file per
+profile under $XDG_CONFIG_HOME/montecarlo/profiles. Applying one is a
+minimal delta against what is loaded now, handed to `montecarlo-helper
+restore` in a single privileged run:
+
+- unloads: modules not in the profile that are idle hardware drivers,
+  holders before the modules they hold, each level removed in parallel;
+- loads: profile modules missing now, dependencies first (modules.dep),
+  each level loaded in parallel;
+- bindings: profile devices present but unbound after the loads.
+
+Anything else not in the profile (kernel infrastructure, drivers still
+bound to a device, modules held by something that stays) is left loaded
+and reported as kept.
+"""
+import json
+import os
+import re
+import time
+
+from . import dashboard, modinfo, restore
+from .modules import ModuleGraph
+from .root import get_root, host_path, kernel_release
+
+_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9 ._-]{0,63}$")
+
+
+def profiles_dir():
+    config = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+    return os.path.join(config, "montecarlo", "profiles")
+
+
+def _path(name):
+    if not _NAME.match(name):
+        raise ValueError(f"invalid profile name: {name!r}")
+    return os.path.join(profiles_dir(), name + ".json")
+
+
+class Profile:
+    __slots__ = ("name", "saved", "kernel", "modules", "bindings")
+
+    def __init__(self, name, modules, bindings=(), saved=None, kernel=""):
+        self.name = name
+        self.modules = sorted(set(modules))
+        self.bindings = sorted(tuple(b) for b in bindings)  # (driver, syspath)
+        self.saved = saved if saved is not None else time.time()
+        self.kernel = kernel
+
+    def to_json(self):
+        return {"name": self.name, "saved": round(self.saved, 3), "kernel": self.kernel,
+                "modules": self.modules, "bindings": [list(b) for b in self.bindings]}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["name"], data["modules"], data.get("bindings", ()),
+                   data.get("saved", 0.0), data.get("kernel", ""))
+
+    def __repr__(self):
+        return f"Profile({self.name!r}, {len(self.modules)} modules, {len(self.bindings)} bindings)"
+
+
+def list_profiles():
+    """Names of the saved profiles, sorted."""
+    try:
+        files = os.listdir(profiles_dir())
+    except OSError:
+        return []
+    return sorted(f[:-5] for f in files if f.endswith(".json") and _NAME.match(f[:-5]))
+
+
+def load(name):
+    """The saved profile `name`. Raises OSError or ValueError."""
+    with open(_path(name)) as f:
+        try:
+            return Profile.from_json(json.load(f))
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"profile {name!r} is malformed") from e
+
+
+def delete(name):
+    os.unlink(_path(name))
+
+
+def current_bindings(modules=None):
+    """[(driver dir, syspath)] of every bound device whose driver belongs to one of `modules`."""
+    root = get_root()
+    found = []
+    try:
+        buses = sorted(os.listdir(host_path("/sys/bus")))
+    except OSError:
+        return found
+    for bus in buses:
+        drivers_dir = host_path(f"/sys/bus/{bus}/drivers")
+        try:
+            drivers = sorted(os.listdir(drivers_dir))
+        except OSError:
+            continue
+        for driver in drivers:
+            # The driver's own module link: driver and module names often differ
+            link = os.path.join(drivers_dir, driver, "module")
+            owner = os.path.basename(os.path.realpath(link)) if os.path.islink(link) else driver.replace("-", "_")
+            if modules is not None and owner not in modules:
+                continue
+            found += restore.bound_devices_in(os.path.join(drivers_dir, driver), driver, root)
+    return found
+
+
+def save(name, graph=None):
+    """Capture the loaded modules and their bindings as profile `name` (replacing it)."""
+    path = _path(name)
+    graph = graph or ModuleGraph()
+    modules = set(graph.names)
+    profile = Profile(name, modules, current_bindings(modules), kernel=kernel_release())
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(profile.to_json(), f, indent=1)
+    os.replace(tmp, path)
+    return profile
+
+
+class Delta:
+    """What applying a profile changes; empty when the profile is already in place."""
+
+    __slots__ = ("profile", "unload_levels", "load_levels", "bindings", "kept", "missing")
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.unload_levels = []
+        self.load_levels = []
+        self.bindings = []
+        self.kept = []      # (module, reason) left loaded although not in the profile
+        self.missing = []   # profile modules not installed for this kernel
+
+    @property
+    def unloads(self):
+        return [m for level in self.unload_levels for m in level]
+
+    @property
+    def loads(self):
+        return [m for level in self.load_levels for m in level]
+
+    def __bool__(self):
+        return bool(self.unload_levels or self.load_levels or self.bindings)
+
+    def args(self):
+        """`montecarlo-helper restore` arguments."""
+        args = []
+        for level in self.unload_levels:
+            args += ["-u", ",".join(level)]
+        for level in self.load_levels:
+            args += ["-m", ",".join(level)]
+        for driver, syspath in self.bindings:
+            args += ["-b", driver, syspath]
+        return args
+
+
+def _unload_levels(modules, graph):
+    """Holders first: a module's level is one past the deepest holder being unloaded with it."""
+    level = {}
+
+    def depth(mod):
+        if mod not in level:
+            level[mod] = 0  # holder chains are acyclic; this only guards bad input
+            level[mod] = max((depth(h) + 1 for h in graph.holders(mod) if h in modules), default=0)
+        return level[mod]
+
+    levels = {}
+    for mod in sorted(modules):
+        levels.setdefault(depth(mod), []).append(mod)
+    return [levels[k] for k in sorted(levels)]
+
+
+def delta(profile, graph=None, depends=modinfo.depends, unloadable=dashboard.is_safe_module):
+    """Minimal change from what is loaded now to `profile`."""
+    graph = graph or ModuleGraph()
+    loaded = set(graph.names)
+    wanted = set(profile.modules)
+    d = Delta(profile)
+
+    # Unload: idle hardware drivers only, and only if all their holders go too
+    candidates = {}
+    bound = restore.module_bound_devices(loaded - wanted)
+    for mod in sorted(loaded - wanted):
+        if not unloadable(mod):
+            d.kept.append((mod, "not a hardware driver"))
+        elif mod in bound:
+            d.kept.append((mod, "bound to a device"))
+        else:
+            candidates[mod] = graph.holders(mod)
+    changed = True
+    while changed:
+        changed = False
+        for mod, holders in list(candidates.items()):
+            staying = [h for h in holders if h not in candidates]
+            if staying:
+                del candidates[mod]
+                d.kept.append((mod, f"held by {', '.join(staying)}"))
+                changed = True
+    d.unload_levels = _unload_levels(set(candidates), graph)
+
+    # Load: what the profile has and this kernel can provide, dependencies first
+    to_load = []
+    for mod in sorted(wanted - loaded):
+        if modinfo.module_file(mod) is None:
+            d.missing.append(mod)
+        else:
+            to_load.append(mod)
+    d.load_levels = restore.load_levels(to_load, depends)
+
+    # Rebind profile devices that are here but have no driver
+    for driver, syspath in profile.bindings:
+        dev = host_path(syspath)
+        if os.path.isdir(dev) and not os.path.lexists(os.path.join(dev, "driver")):
+            d.bindings.append((driver, syspath))
+    return d
@@ -0,0 +1,71 @@
+"""
+Module repository scan: driver modules installed but not loaded.
+"""
+import os
+
+from . import modinfo
+from .root import host_path, kernel_release
+
+# Bus directories to scan (kernel/drivers/<subdir> -> bus type shown)
+BUS_DIRS = {
+    "usb": "usb",
+    "pci": "pci",
+    "hid": "hid",
+    "i2c": "i2c",
+    "scsi": "scsi",
+    "mmc": "sdio",  # SDIO is under mmc directory
+    "net": "net"    # Network drivers (often PCI)
+}
+
+MODULE_SUFFIXES = (".ko", ".ko.xz", ".ko.zst")
+
+# Out-of-tree modules (DKMS, vendor packages); their bus comes from their aliases
+EXTRA_DIRS = ("updates", "extra")
+ALIAS_BUSES = {"usb": "usb", "pci": "pci", "hid": "hid", "i2c": "i2c", "scsi": "scsi", "sdio": "sdio"}
+
+
+def _alias_bus(path):
+    """Bus of the first hardware alias in the module's .modinfo, or None."""
+    info = modinfo.read(path) or {}
+    for alias in info.get("alias", ()):
+        bus = ALIAS_BUSES.get(alias.split(":", 1)[0])
+        if bus:
+            return bus
+    return None
+
+
+def scan_repository(loaded=()):
+    """Rows [name, path, bus] for every driver module not in `loaded`."""
+    base_path = host_path(f"/lib/modules/{kernel_release()}/kernel/drivers")
+
+    rows = []
+
+    for bus_subdir, bus_type in BUS_DIRS.items():
+        bus_path = f"{base_path}/{bus_subdir}"
+        if not os.path.exists(bus_path):
+            continue
+
+        for root, dirs, files in os.walk(bus_path):
+            for f in files:
+                if f.endswith(MODULE_SUFFIXES):
+                    name = f.split('.')[0].replace('-', '_')
+                    if name not in loaded:
+                        full_path = os.path.join(root, f)
+                        rows.append([name, full_path, bus_type])
+
+    seen = {row[0] for row in rows}
+    for extra in EXTRA_DIRS:
+        for root, dirs, files in os.walk(host_path(f"/lib/modules/{kernel_release()}/{extra}")):
+            for f in files:
+                if not f.endswith(MODULE_SUFFIXES):
+                    continue
+                name = f.split('.')[0].replace('-', '_')
+                if name in loaded or name in seen:
+                    continue
+                full_path = os.path.join(root, f)
+                bus_type = _alias_bus(full_path)
+                if bus_type:
+                    seen.add(name)
+                    rows.append([name, full_path, bus_type])
+
+    return rows
@@ -0,0 +1,230 @@
+"""
+Restore history: modules unloaded and services stopped from the UI.
+
+Kept in $XDG_STATE_HOME/montecarlo/restore.json so it survives a crash or
+a restart, with the time of each entry and, for modules, the devices the
+driver was bound to at the time. plan() turns the history into the
+argument list of `montecarlo-helper restore`, which brings everything back
+under one authorization: modules level by level in dependency order (the
+modules of a level load in parallel), then the recorded bindings, then all
+services at once.
+"""
+import json
+import os
+import threading
+import time
+
+from . import modinfo
+from .root import get_root, host_path
+
+MODULE = "module"
+SERVICE = "service"
+
+
+def history_path():
+    state = os.environ.get("XDG_STATE_HOME") or os.path.expanduser("~/.local/state")
+    return os.path.join(state, "montecarlo", "restore.json")
+
+
+class Entry:
+    __slots__ = ("kind", "name", "time", "bindings")
+
+    def __init__(self, kind, name, when=None, bindings=()):
+        self.kind = kind
+        self.name = name
+        self.time = when if when is not None else time.time()
+        self.bindings = [tuple(b) for b in bindings]  # (driver, syspath)
+
+    def to_json(self):
+        data = {"kind": self.kind, "name": self.name, "time": round(self.time, 3)}
+        if self.bindings:
+            data["bindings"] = [list(b) for b in self.bindings]
+        return data
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["kind"], data["name"], data.get("time", 0.0), data.get("bindings", ()))
+
+    def __repr__(self):
+        return f"Entry({self.kind}, {self.name!r}, {len(self.bindings)} bindings)"
+
+
+class History:
+    """Entries in the order they were recorded; one per (kind, name)."""
+
+    def __init__(self, path=None):
+        self.path = path or history_path()
+        self._lock = threading.Lock()
+        self._entries = []
+        try:
+            with open(self.path) as f:
+                self._entries = [Entry.from_json(e) for e in json.load(f).get("entries", [])]
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            self._entries = []
+
+    def entries(self, kind=None):
+        with self._lock:
+            return [e for e in self._entries if kind is None or e.kind == kind]
+
+    def get(self, kind, name):
+        with self._lock:
+            return next((e for e in self._entries if e.kind == kind and e.name == name), None)
+
+    def add(self, kind, name, bindings=()):
+        """Record `name`; a second unload keeps the first time and adds new bindings."""
+        with self._lock:
+            for e in self._entries:
+                if e.kind == kind and e.name == name:
+                    e.bindings += [tuple(b) for b in bindings if tuple(b) not in e.bindings]
+                    entry = e
+                    break
+            else:
+                entry = Entry(kind, name, bindings=bindings)
+                self._entries.append(entry)
+            self._save()
+        return entry
+
+    def remove(self, kind, name):
+        with self._lock:
+            self._entries = [e for e in self._entries if not (e.kind == kind and e.name == name)]
+            self._save()
+
+    def clear(self, kind=None):
+        with self._lock:
+            self._entries = [e for e in self._entries if kind is not None and e.kind != kind]
+            self._save()
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"entries": [e.to_json() for e in self._entries]}, f, indent=1)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+
+def bound_devices_in(drv_dir, driver, root):
+    """[(driver, syspath)] for the device links in one sysfs driver directory."""
+    try:
+        links = sorted(os.listdir(drv_dir))
+    except OSError:
+        return []
+    found = []
+    for link in links:
+        path = os.path.join(drv_dir, link)
+        if link in ("module", "bind", "unbind", "new_id", "remove_id", "uevent") or not os.path.islink(path):
+            continue
+        syspath = os.path.realpath(path)
+        if root and syspath.startswith(root + "/"):
+            syspath = syspath[len(root):]
+        if syspath.startswith("/sys/devices/"):
+            found.append((driver, syspath))
+    return found
+
+
+def driver_dirs():
+    """(driver, driver dir, owning module) for every sysfs driver directory, on any bus."""
+    try:
+        buses = sorted(os.listdir(host_path("/sys/bus")))
+    except OSError:
+        return
+    for bus in buses:
+        drivers_dir = host_path(f"/sys/bus/{bus}/drivers")
+        try:
+            drivers = sorted(os.listdir(drivers_dir))
+        except OSError:
+            continue
+        for driver in drivers:
+            drv_dir = os.path.join(drivers_dir, driver)
+            link = os.path.join(drv_dir, "module")
+            owner = os.path.basename(os.path.realpath(link)) if os.path.islink(link) else driver.replace("-", "_")
+            yield driver, drv_dir, owner
+
+
+def bound_devices(driver):
+    """
+    [(driver dir, syspath)] of the devices bound to `driver` now, checked
+    before an unload: the driver directories named after it or owned by its
+    module, on any bus (mc_driver_has_bindings).
+    """
+    root = get_root()
+    wanted = driver.replace("-", "_")
+    found = []
+    for name, drv_dir, owner in driver_dirs():
+        if wanted in (name.replace("-", "_"), owner):
+            found += bound_devices_in(drv_dir, name, root)
+    return found
+
+
+def module_bound_devices(modules):
+    """
+    {module: [(driver dir, syspath)]} of the devices bound on any bus to a
+    driver of one of `modules`, found through each driver's `module` link
+    (hdaudio, hid, i2c... drivers too, not just pci and usb).
+    """
+    root = get_root()
+    wanted = set(modules)
+    found = {}
+    for driver, drv_dir, owner in driver_dirs():
+        if owner in wanted:
+            devices = bound_devices_in(drv_dir, driver, root)
+            if devices:
+                found.setdefault(owner, []).extend(devices)
+    return found
+
+
+def load_levels(modules, depends=modinfo.depends):
+    """
+    Split `modules` into levels: every module comes after the ones it needs
+    (directly or through modules outside the list), and the modules of one
+    level are independent of each other.
+    """
+    wanted = set(modules)
+    level = {}
+
+    def depth(mod, stack):
+        # Level of the first list module that may load after `mod` and everything below it
+        if mod in level:
+            return level[mod]
+        if mod in stack:
+            return 0  # dependency cycle: nothing sensible to order
+        stack.add(mod)
+        below = 0
+        for dep in depends(mod):
+            below = max(below, depth(dep, stack) + (1 if dep in wanted else 0))
+        stack.discard(mod)
+        level[mod] = below
+        return below
+
+    levels = {}
+    for mod in modules:
+        levels.setdefault(depth(mod, set()), []).append(mod)
+    return [levels[k] for k in sorted(levels)]
+
+
+def plan(modules=(), services=(), history=None, depends=modinfo.depends):
+    """`montecarlo-helper restore` arguments for these module and service names."""
+    args = []
+    for level in load_levels(list(modules), depends):
+        args += ["-m", ",".join(level)]
+    if history is not None:
+        for mod in modules:
+            entry = history.get(MODULE, mod)
+            for driver, syspath in (entry.bindings if entry else ()):
+                args += ["-b", driver, syspath]
+    for svc in services:
+        args += ["-s", svc]
+    return args
+
+
+def parse_report(stdout):
+    """{"unloaded", "loaded", "bound", "started", "failed"}: names from the helper's per-item lines."""
+    report = {"unloaded": [], "loaded": [], "bound": [], "started": [], "failed": []}
+    for line in stdout.splitlines():
+        tag, sep, rest = line.partition(": ")
+        key = tag.lower()
+        if sep and key in report:
+            report[key].append(rest.strip())
+    return report
@@ -0,0 +1,82 @@
+"""
+Root prefix shared with libmontecarlo.
+
+Everything the package reads from /sys, /proc and /lib/modules goes through
+host_path(), so a synthetic or captured tree can stand in for the live
+system. The prefix comes from $MONTECARLO_ROOT or set_root().
+"""
+import os
+from ctypes import get_errno
+
+from ._binding import lib, ctx, reset_contexts
+
+SNAPSHOT_STAMP = "/montecarlo-snapshot"
+SNAPSHOT_ALL_MODULES = 0x1
+
+_root = None
+
+
+def _normalize(root):
+    if not root or root == "/":
+        return ""
+    return os.path.realpath(root).rstrip("/")
+
+
+def get_root():
+    """Current root prefix ("" for the live system)."""
+    global _root
+    if _root is None:
+        _root = _normalize(os.environ.get("MONTECARLO_ROOT", ""))
+    return _root
+
+
+def set_root(root):
+    """Point both the package and libmontecarlo at another tree."""
+    global _root
+    _root = _normalize(root)
+    lib().mc_set_root(_root.encode("utf-8"))
+    reset_contexts()
+
+
+def host_path(path):
+    """Absolute live-system path -> path under the current root."""
+    return get_root() + path
+
+
+def kernel_release():
+    """Kernel release of the tree (proc/sys/kernel/osrelease, else uname)."""
+    if get_root():
+        try:
+            with open(host_path("/proc/sys/kernel/osrelease")) as f:
+                return f.read().strip()
+        except OSError:
+            pass
+    return os.uname().release
+
+
+
+def snapshot(out_dir, all_modules=False):
+    """
+    Capture the current root into `out_dir` (missing or empty) for later
+    replay with set_root(out_dir). Returns the number of devices captured.
+    """
+    flags = SNAPSHOT_ALL_MODULES if all_modules else 0
+    count = lib().mc_ctx_snapshot(ctx(), os.fsencode(out_dir), flags)
+    if count < 0:
+        errno = get_errno()
+        raise OSError(errno, os.strerror(errno), out_dir)
+    return count
+
+
+def snapshot_info(root=None):
+    """Stamp of a captured tree as a dict (kernel, captured, source...), {} if none."""
+    info = {}
+    try:
+        with open((root if root is not None else get_root()) + SNAPSHOT_STAMP) as f:
+            for line in f:
+                key, sep, value = line.rstrip("\n").partition("=")
+                if sep:
+                    info[key] = value
+    except OSError:
+        pass
+    return info
@@ -0,0 +1,60 @@
+"""
+Site rules from /etc/montecarlo/rules.conf.
+
+The file is compiled and kept current by libmontecarlo (montecarlo/rules.c:
+a hashed table of exact names plus a prefix trie, reloaded when the file
+changes), so these are thin calls into the same matcher the device filter
+uses and Python and C never disagree about a rule.
+"""
+import os
+from ctypes import byref, c_int, create_string_buffer, get_errno
+
+from ._binding import lib, ctx
+
+# Rule kinds (MC_RULE_*)
+MODULE = 0        # never offered for unloading
+HW_ALIAS = 1      # alias prefixes that mark a hardware driver
+DRIVER = 2
+PCI_CLASS = 3
+USB_CLASS = 4
+SCSI_DEVTYPE = 5
+KINDS = 6
+
+RULES_PATH = "/etc/montecarlo/rules.conf"
+
+
+def reason(kind, value):
+    """MC_REASON_* code of the rule `value` matches (0 for module/hw-alias rules), or None."""
+    code = c_int(0)
+    if lib().mc_ctx_rule_match(ctx(), kind, value.encode("utf-8"), byref(code)) != 1:
+        return None
+    return code.value
+
+
+def match(kind, value):
+    return reason(kind, value) is not None
+
+
+def protected_module(module):
+    """True if a module rule (exact name or prefix) keeps `module` off the unload list."""
+    return match(MODULE, module)
+
+
+def hardware_alias(alias):
+    return match(HW_ALIAS, alias)
+
+
+def check(path=None):
+    """
+    Validate a rules file (None = the built-in rules) without installing it.
+    Returns {kind name: count}; raises ValueError("line N: ...") or OSError.
+    """
+    counts = (c_int * KINDS)()
+    err = create_string_buffer(256)
+    encoded = os.fsencode(path) if path is not None else None
+    if lib().mc_rules_check(encoded, counts, err, len(err)) < 0:
+        message = err.value.decode("utf-8", "replace")
+        if message.startswith("line "):
+            raise ValueError(message)
+        raise OSError(get_errno(), message, path)
+    return {lib().mc_rule_kind_name(k).decode(): counts[k] for k in range(KINDS)}
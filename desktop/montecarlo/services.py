@@ -0,0 +1,44 @@
+"""systemd units via libsystemdctl."""
+from ctypes import POINTER, cast
+
+from ._binding import libsd, ServiceInfo
+
+
+class Service:
+    """One systemd unit (a view over a ServiceInfo record)."""
+
+    __slots__ = ("_rec",)
+
+    def __init__(self, rec):
+        self._rec = rec
+
+    @property
+    def name(self):
+        return self._rec.name.decode("utf-8", "ignore")
+
+    @property
+    def description(self):
+        return self._rec.description.decode("utf-8", "ignore")
+
+    @property
+    def state(self):
+        return self._rec.state.decode("utf-8", "ignore")
+
+    @property
+    def sub_state(self):
+        return self._rec.sub_state.decode("utf-8", "ignore")
+
+
+def available():
+    return libsd() is not None
+
+
+def iter_services(max_svc=500):
+    """Yield a Service per unit. Yields nothing if libsystemdctl is missing."""
+    sd = libsd()
+    if sd is None:
+        return
+    buf = (ServiceInfo * max_svc)()
+    count = sd.mc_list_services(cast(buf, POINTER(ServiceInfo)), max_svc)
+    for i in range(count):
+        yield Service(buf[i])
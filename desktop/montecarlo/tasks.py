@@ -0,0 +1,154 @@
+"""
+Background task scheduler for UI refreshes.
+
+One worker pool for every refresh. Work is keyed by the resource it
+refreshes ("devices", "repository", ...):
+
+- at most `limit` tasks per key run at once (default 1);
+- submitting while the key is busy replaces any pending request, so a
+  burst of identical refreshes collapses into one rerun;
+- a newer submit cancels the running task's token and only the newest
+  result is handed to the main loop.
+
+GTK-free: results are delivered through the `deliver` callable (GLib.idle_add
+in the UI), which runs them on the main loop.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Cancelled(Exception):
+    """Raised by Token.check() once the task has been superseded."""
+
+
+class Token:
+    """Cooperative cancellation flag handed to every task."""
+
+    __slots__ = ("_event",)
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise Cancelled()
+
+
+class _Resource:
+    __slots__ = ("limit", "running", "generation", "pending", "tokens")
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.running = 0
+        self.generation = 0
+        self.pending = None
+        self.tokens = set()
+
+
+class TaskScheduler:
+    def __init__(self, deliver, max_workers=4):
+        self._deliver = deliver
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="montecarlo-task")
+        self._lock = threading.Lock()
+        self._resources = {}
+
+    def _resource(self, key):
+        res = self._resources.get(key)
+        if res is None:
+            res = self._resources[key] = _Resource(1)
+        return res
+
+    def set_limit(self, key, limit):
+        """Allow `limit` concurrent tasks for `key`."""
+        with self._lock:
+            self._resource(key).limit = max(1, limit)
+
+    def submit(self, key, fn, on_done=None, on_error=None):
+        """
+        Run fn(token) in the background; on_done(result) (or on_error(exc))
+        runs on the main loop, only if no newer submit for `key` came in.
+        Returns the request's generation.
+        """
+        with self._lock:
+            res = self._resource(key)
+            res.generation += 1
+            job = (fn, on_done, on_error, res.generation)
+
+            # Whatever is running now produces a stale result
+            for token in res.tokens:
+                token.cancel()
+
+            if res.running < res.limit:
+                self._start(key, res, job)
+            else:
+                res.pending = job
+            return res.generation
+
+    def cancel(self, key):
+        """Drop the pending request and cancel running ones for `key`."""
+        with self._lock:
+            res = self._resource(key)
+            res.generation += 1
+            res.pending = None
+            for token in res.tokens:
+                token.cancel()
+
+    def busy(self, key):
+        with self._lock:
+            res = self._resources.get(key)
+            return bool(res and (res.running or res.pending))
+
+    def shutdown(self):
+        for key in list(self._resources):
+            self.cancel(key)
+        self._pool.shutdown(wait=False)
+
+    # Called with the lock held
+    def _start(self, key, res, job):
+        token = Token()
+        res.running += 1
+        res.tokens.add(token)
+        self._pool.submit(self._run, key, job, token)
+
+    def _run(self, key, job, token):
+        fn, on_done, on_error, generation = job
+        result = error = None
+        try:
+            result = fn(token)
+        except Cancelled:
+            pass
+        except Exception as e:
+            error = e
+        finally:
+            with self._lock:
+                res = self._resources[key]
+                res.running -= 1
+                res.tokens.discard(token)
+                if res.pending is not None and res.running < res.limit:
+                    job_next, res.pending = res.pending, None
+                    self._start(key, res, job_next)
+
+        if token.cancelled:
+            return
+        if error is not None:
+            if on_error:
+                self._deliver(self._finish, key, generation, on_error, error)
+            else:
+                print(f"[tasks] {key} failed: {error}")
+        elif on_done:
+            self._deliver(self._finish, key, generation, on_done, result)
+
+    def _finish(self, key, generation, callback, value):
+        # Main loop: a newer request may have been made since delivery was queued
+        with self._lock:
+            current = self._resources[key].generation
+        if generation == current:
+            callback(value)
+        return False
@@ -0,0 +1,53 @@
+"""
+Startup-time breakdown.
+
+`startup` starts counting when this module is first imported (ui.py does it
+before anything heavy) and records named steps. The UI writes the report
+to the telemetry log; MONTECARLO_TRACE_STARTUP=1 also prints it to stderr.
+"""
+import os
+import sys
+import time
+
+
+class StartupTrace:
+    def __init__(self):
+        self.t0 = self.last = time.perf_counter()
+        self.steps = []        # (label, seconds since previous step)
+        self.done = False
+
+    def mark(self, label):
+        """Close the step that ended now under `label`."""
+        now = time.perf_counter()
+        self.steps.append((label, now - self.last))
+        self.last = now
+
+    def timed(self, label, fn, *args):
+        """Run fn(*args) as its own step (steps in between are not charged to it)."""
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            now = time.perf_counter()
+            self.steps.append((label, now - start))
+            self.last = now
+
+    def total(self):
+        return self.last - self.t0
+
+    def report(self):
+        lines = [f"{label:<28} {secs * 1000:8.1f} ms" for label, secs in self.steps]
+        lines.append(f"{'total':<28} {self.total() * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+    def finish(self, label="first idle"):
+        """Mark the end of startup once; returns the report."""
+        if not self.done:
+            self.mark(label)
+            self.done = True
+            if os.environ.get("MONTECARLO_TRACE_STARTUP"):
+                print("Startup breakdown:\n" + self.report(), file=sys.stderr)
+        return self.report()
+
+
+startup = StartupTrace()
@@ -6,6 +6,21 @@ extern "C" {
 
 #include <stddef.h>
 
+/*Root prefix of the default context ("" or "/" = live system, also read from $MONTECARLO_ROOT)*/
+/*mc_set_root is thread-safe: a call running concurrently uses either the old root or the new one*/
+void mc_set_root(const char *root);
+const char *mc_get_root(void);
+
+/*Context handle: one per thread for concurrent use, NULL = default context*/
+typedef struct mc_ctx mc_ctx_t;
+
+mc_ctx_t *mc_ctx_new(const char *root);   /* NULL root = copy the default root */
+void mc_ctx_free(mc_ctx_t *ctx);
+const char *mc_ctx_root(const mc_ctx_t *ctx);
+
+/*Daemon socket (per-user runtime dir)*/
+void mc_get_socket_path(char *buf, size_t bufsize);
+
 /*Core Driver Operations*/
 int mc_read_sysattr(const char *path, char *buf, size_t buflen);
 void mc_get_ids(const char *syspath, char *vendor, char *product);
@@ -19,22 +34,174 @@ typedef struct {
     char subsystem[16];
 } mc_device_info_t;
 
+/* Streaming walk: return non-zero from the callback to stop early */
+typedef int (*mc_device_cb)(const mc_device_info_t *info, void *user);
+
 int mc_list_all_devices(mc_device_info_t *out, int max);
+int mc_foreach_device(mc_device_cb cb, void *user);
+
+/*Filter explain: every device, listed or hidden, with the reason*/
+#define MC_REASON_SHOWN 0                   /* listed */
+#define MC_REASON_MASS_STORAGE 1            /* listed, but never auto-probed */
+#define MC_REASON_PCI_BRIDGE 2              /* hidden from here on */
+#define MC_REASON_PCI_SMBUS 3
+#define MC_REASON_PCI_SYSTEM_PERIPHERAL 4
+#define MC_REASON_PCI_INFRA_DRIVER 5        /* pcieport, shpchp, piix4_smbus... */
+#define MC_REASON_SCSI_HOST 6               /* scsi_host, scsi_target, scsi_generic */
+#define MC_REASON_SCSI_NO_IDENTITY 7        /* no vendor or model */
+#define MC_REASON_USB_DEVICE 8              /* usb_device node; its interfaces are listed */
+#define MC_REASON_USB_HUB 9
+#define MC_REASON_USB_HCD 10
+#define MC_REASON_USB_NO_PARENT 11
+#define MC_REASON_HIDDEN(r) ((r) >= MC_REASON_PCI_BRIDGE)
+
+typedef struct {
+    mc_device_info_t info;
+    int reason;                             /* MC_REASON_* */
+} mc_device_explain_t;
+
+typedef int (*mc_explain_cb)(const mc_device_explain_t *e, void *user);
+
+int mc_foreach_device_explained(mc_explain_cb cb, void *user);
+int mc_explain_devices(mc_device_explain_t *out, int max);
+const char *mc_reason_name(int reason);
 const char* mc_get_device_subsystem(const char *syspath);
 int mc_try_load_driver(const char *driver);
 int mc_unload_driver(const char *driver);
 int mc_dmesg_has_activity(const char *driver);
-int mc_dmesg_has_activity(const char *driver);
 int mc_module_has_holders(const char *module);
 int mc_get_module_refcount(const char *module);
 int mc_list_loaded_modules(char *out_buf, int max_size);
 int mc_driver_is_in_use(const char *driver);
+int mc_driver_has_bindings(const char *driver);
+int mc_probe_bind(const char *syspath, const char *driver);
+int mc_unbind_device(const char *syspath);
+
+/*Module Graph (one /proc/modules snapshot)*/
+#define MC_MODULE_NAME_MAX 64
+#define MC_MODULE_STATE_MAX 16
+
+typedef struct mc_modgraph mc_modgraph_t;
+
+mc_modgraph_t *mc_modgraph_new(void);
+void mc_modgraph_free(mc_modgraph_t *g);
+int mc_modgraph_count(const mc_modgraph_t *g);
+const char *mc_modgraph_name(const mc_modgraph_t *g, int idx);
+int mc_modgraph_find(const mc_modgraph_t *g, const char *module);
+int mc_modgraph_refcount(const mc_modgraph_t *g, const char *module);
+long mc_modgraph_size(const mc_modgraph_t *g, const char *module);          /* bytes, -1 = not loaded */
+const char *mc_modgraph_state(const mc_modgraph_t *g, const char *module);  /* "Live", "Loading", "Unloading" */
+const char *mc_modgraph_taint(const mc_modgraph_t *g, const char *module);  /* "OE"..., "" when clean */
+int mc_modgraph_has_holders(const mc_modgraph_t *g, const char *module);
+int mc_modgraph_holders(const mc_modgraph_t *g, const char *module, char out[][MC_MODULE_NAME_MAX], int max);
+int mc_modgraph_depends(const mc_modgraph_t *g, const char *module, char out[][MC_MODULE_NAME_MAX], int max);
+int mc_modgraph_unload_order(const mc_modgraph_t *g, const char *module, char out[][MC_MODULE_NAME_MAX], int max);
 
 /*High level checks*/
 int mc_dev_has_driver(const char *syspath);
 int mc_is_excluded_device(const char *syspath);
 int mc_is_infrastructure_device(const char *syspath, const char *subsystem);
 
+/*Reentrant variants: all state in ctx, all results in caller-owned buffers*/
+void mc_ctx_get_ids(const mc_ctx_t *ctx, const char *syspath, char *vendor, char *product);
+int mc_ctx_list_candidate_drivers(const mc_ctx_t *ctx, char out[][128], int max);
+int mc_ctx_list_all_devices(const mc_ctx_t *ctx, mc_device_info_t *out, int max);
+int mc_ctx_foreach_device(const mc_ctx_t *ctx, mc_device_cb cb, void *user);
+int mc_ctx_foreach_device_explained(const mc_ctx_t *ctx, mc_explain_cb cb, void *user);
+int mc_ctx_explain_devices(const mc_ctx_t *ctx, mc_device_explain_t *out, int max);
+int mc_ctx_get_device_subsystem(const mc_ctx_t *ctx, const char *syspath, char *buf, size_t len);
+int mc_ctx_module_has_holders(const mc_ctx_t *ctx, const char *module);
+int mc_ctx_get_module_refcount(const mc_ctx_t *ctx, const char *module);
+int mc_ctx_list_loaded_modules(const mc_ctx_t *ctx, char *out_buf, int max_size);
+int mc_ctx_driver_is_in_use(const mc_ctx_t *ctx, const char *driver);
+int mc_ctx_driver_has_bindings(const mc_ctx_t *ctx, const char *driver);
+mc_modgraph_t *mc_ctx_modgraph_new(const mc_ctx_t *ctx);
+int mc_ctx_dev_has_driver(const mc_ctx_t *ctx, const char *syspath);
+int mc_ctx_is_excluded_device(const mc_ctx_t *ctx, const char *syspath);
+int mc_ctx_is_infrastructure_device(const mc_ctx_t *ctx, const char *syspath, const char *subsystem);
+int mc_ctx_probe_bind(const mc_ctx_t *ctx, const char *syspath, const char *driver);
+int mc_ctx_unbind_device(const mc_ctx_t *ctx, const char *syspath);
+
+/*Hardware database names (udev hwdb, memoized per vendor:product / PCI class)*/
+#define MC_HWDB_NAME_MAX 128
+
+int mc_hwdb_device_name(const char *bus, const char *vendor_id, const char *product_id, char *vendor, char *model);
+int mc_hwdb_pci_class(const char *class_code, char *buf, size_t len);
+int mc_hwdb_cache_size(void);
+int mc_ctx_device_name(const mc_ctx_t *ctx, const char *syspath, char *buf, size_t len);
+
+/*Module files (.ko, .ko.xz, .ko.zst): raw .modinfo section, "key=value\0..."*/
+int mc_modinfo_read(const char *path, char *buf, size_t len);
+const char *mc_modinfo_next(const char *info, int len, const char *key, const char *prev);
+
+/*Module Index (mmap of /var/cache/montecarlo/modindex-<kernel>.bin, see modindex.h)*/
+typedef struct mc_modindex mc_modindex_t;
+
+int mc_ctx_kernel_release(const mc_ctx_t *ctx, char *buf, size_t len);
+int mc_ctx_modindex_path(const mc_ctx_t *ctx, const char *kernel, char *buf, size_t len);
+int mc_ctx_modindex_build(const mc_ctx_t *ctx, const char *kernel, const char *out_path);
+mc_modindex_t *mc_ctx_modindex_open(const mc_ctx_t *ctx);
+mc_modindex_t *mc_modindex_open(const char *path);
+void mc_modindex_close(mc_modindex_t *idx);
+const char *mc_modindex_kernel(const mc_modindex_t *idx);
+int mc_modindex_count(const mc_modindex_t *idx);
+int mc_modindex_alias_count(const mc_modindex_t *idx);
+int mc_modindex_find(const mc_modindex_t *idx, const char *module);
+const char *mc_modindex_name(const mc_modindex_t *idx, int i);
+const char *mc_modindex_path(const mc_modindex_t *idx, int i);
+const char *mc_modindex_description(const mc_modindex_t *idx, int i);
+int mc_modindex_flags(const mc_modindex_t *idx, int i);
+int mc_modindex_depends(const mc_modindex_t *idx, int i, int *out, int max);
+int mc_modindex_match(const mc_modindex_t *idx, const char *modalias, int *out, int max);
+const char *mc_modindex_alias(const mc_modindex_t *idx, int a, int *module);
+
+/*Site rules (rules.conf under the context root, built-in copy when missing; reloaded on change)*/
+#define MC_RULES_PATH "/etc/montecarlo/rules.conf"
+
+#define MC_RULE_MODULE 0        /* "module": never offered for unloading */
+#define MC_RULE_HW_ALIAS 1      /* "hw-alias": alias prefixes of real hardware drivers */
+#define MC_RULE_DRIVER 2        /* "driver": PCI infrastructure drivers */
+#define MC_RULE_PCI_CLASS 3     /* "pci-class": value is the sysfs class, e.g. "0x0c0500" */
+#define MC_RULE_USB_CLASS 4     /* "usb-class": bDeviceClass / bInterfaceClass */
+#define MC_RULE_SCSI_DEVTYPE 5  /* "scsi-devtype": "" for none */
+#define MC_RULE_KINDS 6
+
+int mc_ctx_rule_match(const mc_ctx_t *ctx, int kind, const char *value, int *reason);
+int mc_rule_match(int kind, const char *value, int *reason);
+const char *mc_rule_kind_name(int kind);
+int mc_rules_check(const char *path, int *counts, char *err, size_t errlen);
+
+/*Snapshots: the files the library reads, copied into a directory usable as a root prefix*/
+#define MC_SNAPSHOT_STAMP "/montecarlo-snapshot"   /* kernel, capture time, source */
+#define MC_SNAPSHOT_ALL_MODULES 0x1                /* .modinfo stubs for every module, not just loaded ones */
+
+int mc_ctx_snapshot(const mc_ctx_t *ctx, const char *out_dir, int flags);
+
+/*Snapshot diff: shown devices and loaded modules of two roots, merged over sorted keys*/
+#define MC_DIFF_DEVICE_ADDED 0
+#define MC_DIFF_DEVICE_REMOVED 1
+#define MC_DIFF_DEVICE_REBOUND 2        /* driver changed ("None" = unbound) */
+#define MC_DIFF_MODULE_LOADED 3
+#define MC_DIFF_MODULE_UNLOADED 4
+#define MC_DIFF_MODULE_IDLE 5           /* in use before, no holders or bound devices now */
+#define MC_DIFF_MODULE_IN_USE 6
+#define MC_DIFF_MODULE_REFCOUNT 7       /* same state, different refcount */
+
+typedef struct {
+    int kind;                           /* MC_DIFF_* */
+    char key[256];                      /* syspath or module name */
+    char before[64];                    /* driver or module state, "" when absent */
+    char after[64];
+    int refcount_before;                /* modules only, -1 when absent */
+    int refcount_after;
+} mc_diff_entry_t;
+
+typedef int (*mc_diff_cb)(const mc_diff_entry_t *e, void *user);
+
+int mc_ctx_foreach_diff(const mc_ctx_t *before, const mc_ctx_t *after, mc_diff_cb cb, void *user);
+int mc_ctx_diff(const mc_ctx_t *before, const mc_ctx_t *after, mc_diff_entry_t *out, int max);
+const char *mc_diff_kind_name(int kind);
+
 
 
 #ifdef __cplusplus
@@ -0,0 +1,69 @@
+#pragma once
+
+/*
+ * MODULE INDEX FILE FORMAT
+ * /var/cache/montecarlo/modindex-<kernel release>.bin, little-endian.
+ * Written once per kernel by `montecarlo_cli index build`, then mapped
+ * read-only by every process (library, daemon, CLI, helper, Python UI).
+ *
+ *   header
+ *   modules[module_count]   sorted by name (strcmp)
+ *   aliases[alias_count]    sorted by pattern (strcmp)
+ *   deps[dep_count]         module indices, one run per module
+ *   wild[wild_count]        alias indices whose bus part (up to the first
+ *                           ':') holds a glob character, e.g. "acpi*:PNP0C0A:*";
+ *                           they sort apart from their bus and are tried
+ *                           separately
+ *   strings[strings_size]   NUL-terminated strings, offset 0 = ""
+ *
+ * All *_off fields are byte offsets from the start of the file, string
+ * references are offsets into the string table. desktop/montecarlo/
+ * modindex.py reads the same layout; bump MC_MODINDEX_VERSION on change.
+ */
+
+#include <stdint.h>
+
+#define MC_MODINDEX_MAGIC "MCMODIDX"
+#define MC_MODINDEX_VERSION 2
+#define MC_MODINDEX_DIR "/var/cache/montecarlo"
+
+/* Module flags */
+#define MC_MODINDEX_BUILTIN 0x1     /* listed in modules.builtin, no file */
+#define MC_MODINDEX_UNLISTED 0x2    /* file on disk missing from modules.dep */
+
+struct mc_modindex_header
+{
+    char magic[8];
+    uint32_t version;
+    uint32_t header_size;
+    char kernel[64];
+    /* Sources the index was built from: rebuild when they change */
+    int64_t dep_mtime;
+    int64_t alias_mtime;
+    uint32_t module_count;
+    uint32_t modules_off;
+    uint32_t alias_count;
+    uint32_t aliases_off;
+    uint32_t dep_count;
+    uint32_t deps_off;
+    uint32_t strings_size;
+    uint32_t strings_off;
+    uint32_t wild_count;
+    uint32_t wild_off;
+};
+
+struct mc_modindex_module
+{
+    uint32_t name;          /* string: module name, '_' form */
+    uint32_t path;          /* string: path relative to /lib/modules/<kernel> */
+    uint32_t description;   /* string */
+    uint32_t deps_start;    /* index into deps */
+    uint32_t deps_count;
+    uint32_t flags;
+};
+
+struct mc_modindex_alias
+{
+    uint32_t pattern;       /* string: modalias glob */
+    uint32_t module;        /* index into modules */
+};
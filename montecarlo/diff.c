@@ -0,0 +1,294 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <errno.h>
+
+#include "heads/libmontecarlo.h"
+
+/*
+ * SNAPSHOT DIFF
+ * What changed between two roots: a snapshot taken before a kernel upgrade
+ * or docking and the live system, or two snapshots. Each side is reduced to
+ * an array of (key, state) sorted by key - syspath for devices, name for
+ * modules - and the two arrays are merged in a single pass, so the cost is
+ * one sort per side plus a linear walk instead of a lookup per row.
+ */
+
+struct diff_device
+{
+    char syspath[256];
+    char driver[64];
+};
+
+struct diff_devices
+{
+    struct diff_device *items;
+    int count;
+    int cap;
+    int failed;
+};
+
+struct diff_module
+{
+    char name[MC_MODULE_NAME_MAX];
+    int refcount;
+    int in_use;                 // holders or bound devices, as `montecarlo_cli modules` reports
+};
+
+static int collect_device(const mc_device_info_t *info, void *user)
+{
+    struct diff_devices *list = user;
+    if (list->count == list->cap)
+    {
+        int cap = list->cap ? list->cap * 2 : 128;
+        struct diff_device *items = realloc(list->items, cap * sizeof(*items));
+        if (!items)
+        {
+            list->failed = 1;
+            return 1;
+        }
+        list->items = items;
+        list->cap = cap;
+    }
+
+    struct diff_device *d = &list->items[list->count++];
+    snprintf(d->syspath, sizeof(d->syspath), "%s", info->syspath);
+    snprintf(d->driver, sizeof(d->driver), "%s", info->driver);
+    return 0;
+}
+
+static int device_cmp(const void *a, const void *b)
+{
+    return strcmp(((const struct diff_device *)a)->syspath, ((const struct diff_device *)b)->syspath);
+}
+
+static int module_cmp(const void *a, const void *b)
+{
+    return strcmp(((const struct diff_module *)a)->name, ((const struct diff_module *)b)->name);
+}
+
+static int collect_devices(const mc_ctx_t *ctx, struct diff_devices *list)
+{
+    memset(list, 0, sizeof(*list));
+    mc_ctx_foreach_device(ctx, collect_device, list);
+    if (list->failed)
+    {
+        free(list->items);
+        errno = ENOMEM;
+        return -1;
+    }
+    if (list->count > 1)
+        qsort(list->items, list->count, sizeof(*list->items), device_cmp);
+    return 0;
+}
+
+/* NULL without a readable /proc/modules: an empty side would show every module as new */
+static struct diff_module *collect_modules(const mc_ctx_t *ctx, int *count)
+{
+    mc_modgraph_t *g = mc_ctx_modgraph_new(ctx);
+    if (!g)
+    {
+        if (errno == 0)
+            errno = ENOENT;
+        return NULL;
+    }
+
+    int n = mc_modgraph_count(g);
+    struct diff_module *mods = malloc((n > 0 ? n : 1) * sizeof(*mods));
+    if (!mods)
+    {
+        mc_modgraph_free(g);
+        errno = ENOMEM;
+        return NULL;
+    }
+
+    for (int i = 0; i < n; i++)
+    {
+        const char *name = mc_modgraph_name(g, i);
+        snprintf(mods[i].name, sizeof(mods[i].name), "%s", name);
+        mods[i].refcount = mc_modgraph_refcount(g, name);
+        mods[i].in_use = mc_modgraph_has_holders(g, name) || mc_ctx_driver_has_bindings(ctx, name);
+    }
+    mc_modgraph_free(g);
+
+    if (n > 1)
+        qsort(mods, n, sizeof(*mods), module_cmp);
+    *count = n;
+    return mods;
+}
+
+static const char *module_state(const struct diff_module *m)
+{
+    return m->in_use ? "in_use" : "idle";
+}
+
+struct diff_out
+{
+    mc_diff_cb cb;
+    void *user;
+    int count;
+    int stopped;
+};
+
+static void emit(struct diff_out *out, int kind, const char *key,
+                 const char *before, const char *after, int ref_before, int ref_after)
+{
+    mc_diff_entry_t e;
+    e.kind = kind;
+    snprintf(e.key, sizeof(e.key), "%s", key);
+    snprintf(e.before, sizeof(e.before), "%s", before ? before : "");
+    snprintf(e.after, sizeof(e.after), "%s", after ? after : "");
+    e.refcount_before = ref_before;
+    e.refcount_after = ref_after;
+
+    out->count++;
+    if (out->cb && out->cb(&e, out->user) != 0)
+        out->stopped = 1;
+}
+
+/* Merge of two lists sorted by syspath */
+static void diff_devices(const struct diff_devices *a, const struct diff_devices *b, struct diff_out *out)
+{
+    int i = 0, j = 0;
+    while ((i < a->count || j < b->count) && !out->stopped)
+    {
+        int c = i == a->count ? 1 : j == b->count ? -1 : strcmp(a->items[i].syspath, b->items[j].syspath);
+
+        if (c < 0)
+        {
+            emit(out, MC_DIFF_DEVICE_REMOVED, a->items[i].syspath, a->items[i].driver, NULL, -1, -1);
+            i++;
+        }
+        else if (c > 0)
+        {
+            emit(out, MC_DIFF_DEVICE_ADDED, b->items[j].syspath, NULL, b->items[j].driver, -1, -1);
+            j++;
+        }
+        else
+        {
+            if (strcmp(a->items[i].driver, b->items[j].driver) != 0)
+                emit(out, MC_DIFF_DEVICE_REBOUND, a->items[i].syspath, a->items[i].driver, b->items[j].driver, -1, -1);
+            i++;
+            j++;
+        }
+    }
+}
+
+/* Merge of two lists sorted by module name */
+static void diff_modules(const struct diff_module *a, int na, const struct diff_module *b, int nb,
+                         struct diff_out *out)
+{
+    int i = 0, j = 0;
+    while ((i < na || j < nb) && !out->stopped)
+    {
+        int c = i == na ? 1 : j == nb ? -1 : strcmp(a[i].name, b[j].name);
+
+        if (c < 0)
+        {
+            emit(out, MC_DIFF_MODULE_UNLOADED, a[i].name, module_state(&a[i]), NULL, a[i].refcount, -1);
+            i++;
+        }
+        else if (c > 0)
+        {
+            emit(out, MC_DIFF_MODULE_LOADED, b[j].name, NULL, module_state(&b[j]), -1, b[j].refcount);
+            j++;
+        }
+        else
+        {
+            // A state change wins over a plain refcount change; both carry the two counts
+            if (a[i].in_use != b[j].in_use)
+                emit(out, b[j].in_use ? MC_DIFF_MODULE_IN_USE : MC_DIFF_MODULE_IDLE, a[i].name,
+                     module_state(&a[i]), module_state(&b[j]), a[i].refcount, b[j].refcount);
+            else if (a[i].refcount != b[j].refcount)
+                emit(out, MC_DIFF_MODULE_REFCOUNT, a[i].name,
+                     module_state(&a[i]), module_state(&b[j]), a[i].refcount, b[j].refcount);
+            i++;
+            j++;
+        }
+    }
+}
+
+/*
+ * Devices first, then modules, each in key order. Returns the number of
+ * changes passed to cb (fewer if it returned non-zero to stop), -1 with
+ * errno set when a side can't be read.
+ */
+int mc_ctx_foreach_diff(const mc_ctx_t *before, const mc_ctx_t *after, mc_diff_cb cb, void *user)
+{
+    struct diff_devices dev_a, dev_b;
+    struct diff_module *mod_a = NULL, *mod_b = NULL;
+    struct diff_out out = { cb, user, 0, 0 };
+    int na = 0, nb = 0, ret = -1;
+
+    errno = 0;
+    if (!(mod_a = collect_modules(before, &na)) || !(mod_b = collect_modules(after, &nb)))
+        goto out_modules;
+    if (collect_devices(before, &dev_a) != 0)
+        goto out_modules;
+    if (collect_devices(after, &dev_b) != 0)
+    {
+        free(dev_a.items);
+        goto out_modules;
+    }
+
+    diff_devices(&dev_a, &dev_b, &out);
+    diff_modules(mod_a, na, mod_b, nb, &out);
+    ret = out.count;
+
+    free(dev_a.items);
+    free(dev_b.items);
+out_modules:
+    {
+        int saved = errno;
+        free(mod_a);
+        free(mod_b);
+        errno = saved;
+    }
+    return ret;
+}
+
+struct diff_list
+{
+    mc_diff_entry_t *out;
+    int max;
+    int count;
+};
+
+static int diff_list_cb(const mc_diff_entry_t *e, void *user)
+{
+    struct diff_list *list = user;
+    if (list->count >= list->max)
+        return 1;
+    list->out[list->count++] = *e;
+    return 0;
+}
+
+/* Up to max changes into out; returns the number stored, -1 on error */
+int mc_ctx_diff(const mc_ctx_t *before, const mc_ctx_t *after, mc_diff_entry_t *out, int max)
+{
+    struct diff_list list = { out, max, 0 };
+    if (!out || max <= 0)
+        return 0;
+
+    if (mc_ctx_foreach_diff(before, after, diff_list_cb, &list) < 0)
+        return -1;
+    return list.count;
+}
+
+/* Machine-readable name of a change kind ("added", "rebound", "now_idle"...) */
+const char *mc_diff_kind_name(int kind)
+{
+    static const char *const names[] = {
+        [MC_DIFF_DEVICE_ADDED] = "added",
+        [MC_DIFF_DEVICE_REMOVED] = "removed",
+        [MC_DIFF_DEVICE_REBOUND] = "rebound",
+        [MC_DIFF_MODULE_LOADED] = "loaded",
+        [MC_DIFF_MODULE_UNLOADED] = "unloaded",
+        [MC_DIFF_MODULE_IDLE] = "now_idle",
+        [MC_DIFF_MODULE_IN_USE] = "now_in_use",
+        [MC_DIFF_MODULE_REFCOUNT] = "refcount",
+    };
+    if (kind < 0 || kind >= (int)(sizeof(names) / sizeof(names[0])) || !names[kind])
+        return "unknown";
+    return names[kind];
+}
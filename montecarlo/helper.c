@@ -11,8 +11,14 @@
 #include <stdlib.h>
 #include <string.h>
 #include <ctype.h>
+#include <fcntl.h>
+#include <limits.h>
+#include <unistd.h>
+#include <sys/stat.h>
+#include <sys/wait.h>
 
 #define MAX_MODULE_NAME 64
+#define MAX_RESTORE_ITEMS 256
 
 
 bool is_valid_char_name(const char c)
@@ -42,22 +48,242 @@ bool is_valid_module_name(const char *name)
     return true;
 }
 
+/* A device path under /sys/devices, no way out of it */
+bool is_valid_syspath(const char *path)
+{
+    if (!path || strncmp(path, "/sys/devices/", 13) != 0 || strlen(path) >= PATH_MAX - 128)
+        return false;
+    if (strstr(path, "/..") || strstr(path, "/./") || strstr(path, "//"))
+        return false;
+    for (const char *c = path; *c; c++)
+    {
+        if (!isgraph((unsigned char)*c))
+            return false;
+    }
+    return true;
+}
+
+bool is_valid_service_name(const char *name)
+{
+    return name && name[0] != '\0' && name[0] != '-' &&
+           !strchr(name, '/') && !strchr(name, ';') && !strchr(name, '|');
+}
+
+/* Reap one child per item (started together) and report each; returns the failures */
+static int reap_items(pid_t *pids, char **names, int n, const char *done_tag, const char *what)
+{
+    int failed = 0;
+    for (int i = 0; i < n; i++)
+    {
+        int status = 0;
+        if (pids[i] < 0 || waitpid(pids[i], &status, 0) < 0 || !WIFEXITED(status) || WEXITSTATUS(status) != 0)
+        {
+            fprintf(stdout, "FAILED: %s %s\n", what, names[i]);
+            failed++;
+        }
+        else
+            fprintf(stdout, "%s: %s\n", done_tag, names[i]);
+        fflush(stdout);
+    }
+    return failed;
+}
+
+/*
+ * modprobe / rmmod <module> in a child, no shell involved. Their output
+ * goes to stderr so it never interleaves with the per-item report lines.
+ * rmmod, not modprobe -r, for unloads: callers list every module in order,
+ * and modprobe -r would also drop unused dependencies never recorded for
+ * rollback.
+ */
+static pid_t spawn_module_cmd(bool unload, const char *module)
+{
+    pid_t pid = fork();
+    if (pid == 0)
+    {
+        dup2(STDERR_FILENO, STDOUT_FILENO);
+        if (unload)
+            execlp("rmmod", "rmmod", module, (char *)NULL);
+        else
+            execlp("modprobe", "modprobe", module, (char *)NULL);
+        _exit(127);
+    }
+    return pid;
+}
+
+/* Already bound (udev rebinds most devices on load) counts as done */
+static int bind_device(const char *driver, const char *syspath)
+{
+    char path[PATH_MAX];
+    struct stat st;
+
+    snprintf(path, sizeof(path), "%s/driver", syspath);
+    if (lstat(path, &st) == 0)
+        return 0;
+
+    if (snprintf(path, sizeof(path), "%s/subsystem/drivers/%s/bind", syspath, driver) >= (int)sizeof(path))
+        return -1;
+    int fd = open(path, O_WRONLY | O_CLOEXEC);
+    if (fd < 0)
+        return -1;
+    const char *dev = strrchr(syspath, '/') + 1;
+    ssize_t written = write(fd, dev, strlen(dev));
+    close(fd);
+    return written < 0 ? -1 : 0;
+}
+
 int main(int argc, char *argv[])
 {
 #include "systemd/libsystemd.h"
 
 // ... (existing includes)
 
-    if (argc != 4 && argc != 3)
+    if (argc < 3)
     {
-        fprintf(stderr, "Usage: %s [load|unload|service] [args...]\n", argv[0]);
+        fprintf(stderr, "Usage: %s [load|unload|unload-stack|restore|service] [args...]\n", argv[0]);
         fprintf(stderr, "  load/unload <module>\n");
+        fprintf(stderr, "  unload-stack <module> [module...]\n");
+        fprintf(stderr, "  restore [-u <module>[,...]]... [-m <module>[,...]]... [-b <driver> <syspath>]... [-s <service>]...\n");
         fprintf(stderr, "  service <action> <service_name>\n");
         return 1;
     }
 
     const char *mode = argv[1];
 
+    // --- MODULE STACK (one authorization, caller-supplied order) ---
+    if (strcmp(mode, "unload-stack") == 0)
+    {
+        /* Validate the whole plan before touching anything */
+        for (int i = 2; i < argc; i++)
+        {
+            if (!is_valid_module_name(argv[i]))
+            {
+                fprintf(stderr, "Error: Invalid module name '%s'.\n", argv[i]);
+                return 1;
+            }
+        }
+
+        /* One at a time in the caller's order, stopping at the first failure */
+        for (int i = 2; i < argc; i++)
+        {
+            pid_t pid = spawn_module_cmd(true, argv[i]);
+            if (reap_items(&pid, &argv[i], 1, "UNLOADED", "unload") != 0)
+            {
+                fprintf(stderr, "FAILED: unload module %s\n", argv[i]);
+                return 1;
+            }
+        }
+        fprintf(stdout, "SUCCESS: Stack of %d modules unloaded\n", argc - 2);
+        return 0;
+    }
+
+    // --- BULK RESTORE (one authorization) ---
+    if (strcmp(mode, "restore") == 0)
+    {
+        /*
+         * Each -u / -m is one level: its modules are independent and are
+         * removed / loaded in parallel, levels run in the order given (the
+         * caller sorts them: holders before what they hold, dependencies
+         * before their users). Unloads go first, then loads, then the
+         * recorded bindings udev did not redo, then every service at once.
+         */
+        static char *modules[MAX_RESTORE_ITEMS], *binds[MAX_RESTORE_ITEMS][2], *services[MAX_RESTORE_ITEMS];
+        static int level_end[MAX_RESTORE_ITEMS];
+        static bool level_unload[MAX_RESTORE_ITEMS];
+        int n_mod = 0, n_level = 0, n_bind = 0, n_svc = 0, n_unload = 0;
+
+        /* Validate the whole plan before touching anything */
+        for (int i = 2; i < argc; i++)
+        {
+            if ((strcmp(argv[i], "-m") == 0 || strcmp(argv[i], "-u") == 0) && i + 1 < argc && n_level < MAX_RESTORE_ITEMS)
+            {
+                bool unload = argv[i][1] == 'u';
+                if (unload && n_level > n_unload)
+                {
+                    fprintf(stderr, "Error: -u levels must come before -m levels.\n");
+                    return 1;
+                }
+                n_unload += unload;
+                level_unload[n_level] = unload;
+                for (char *save = NULL, *mod = strtok_r(argv[++i], ",", &save); mod; mod = strtok_r(NULL, ",", &save))
+                {
+                    if (!is_valid_module_name(mod) || n_mod == MAX_RESTORE_ITEMS)
+                    {
+                        fprintf(stderr, "Error: Invalid module name '%s'.\n", mod);
+                        return 1;
+                    }
+                    modules[n_mod++] = mod;
+                }
+                level_end[n_level++] = n_mod;
+            }
+            else if (strcmp(argv[i], "-b") == 0 && i + 2 < argc && n_bind < MAX_RESTORE_ITEMS)
+            {
+                if (!is_valid_module_name(argv[i + 1]) || !is_valid_syspath(argv[i + 2]))
+                {
+                    fprintf(stderr, "Error: Invalid binding '%s' '%s'.\n", argv[i + 1], argv[i + 2]);
+                    return 1;
+                }
+                binds[n_bind][0] = argv[++i];
+                binds[n_bind++][1] = argv[++i];
+            }
+            else if (strcmp(argv[i], "-s") == 0 && i + 1 < argc && n_svc < MAX_RESTORE_ITEMS)
+            {
+                if (!is_valid_service_name(argv[i + 1]))
+                {
+                    fprintf(stderr, "Invalid service name.\n");
+                    return 1;
+                }
+                services[n_svc++] = argv[++i];
+            }
+            else
+            {
+                fprintf(stderr, "Error: Unexpected argument '%s'.\n", argv[i]);
+                return 1;
+            }
+        }
+
+        int failed = 0;
+        pid_t pids[MAX_RESTORE_ITEMS];
+
+        for (int l = 0, start = 0; l < n_level; start = level_end[l++])
+        {
+            for (int m = start; m < level_end[l]; m++)
+                pids[m - start] = spawn_module_cmd(level_unload[l], modules[m]);
+            if (level_unload[l])
+                failed += reap_items(pids, modules + start, level_end[l] - start, "UNLOADED", "unload");
+            else
+                failed += reap_items(pids, modules + start, level_end[l] - start, "LOADED", "load");
+        }
+
+        if (n_bind > 0)
+        {
+            if (system("udevadm settle --timeout=5 >/dev/null 2>&1") != 0)
+                fprintf(stderr, "udevadm settle failed, binding anyway\n");
+            for (int b = 0; b < n_bind; b++)
+            {
+                int ok = bind_device(binds[b][0], binds[b][1]) == 0;
+                fprintf(stdout, ok ? "BOUND: %s\n" : "FAILED: bind %s\n", binds[b][1]);
+                failed += !ok;
+            }
+            fflush(stdout);
+        }
+
+        for (int v = 0; v < n_svc; v++)
+        {
+            pids[v] = fork();
+            if (pids[v] == 0)
+                _exit(systemd_start_service(services[v]) < 0 ? 1 : 0);
+        }
+        failed += reap_items(pids, services, n_svc, "STARTED", "start");
+
+        if (failed)
+        {
+            fprintf(stderr, "FAILED: %d of %d items not restored\n", failed, n_mod + n_bind + n_svc);
+            return 1;
+        }
+        fprintf(stdout, "SUCCESS: %d modules, %d bindings, %d services restored\n", n_mod, n_bind, n_svc);
+        return 0;
+    }
+
     // --- MODULE OPERATIONS ---
     if (strcmp(mode, "load") == 0 || strcmp(mode, "unload") == 0)
     {
@@ -99,7 +325,7 @@ int main(int argc, char *argv[])
         const char *service = argv[3];
 
         // Sanitize service name (basic check)
-        if (strchr(service, '/') || strchr(service, ';') || strchr(service, '|')) {
+        if (!is_valid_service_name(service)) {
             fprintf(stderr, "Invalid service name.\n");
             return 1;
         }
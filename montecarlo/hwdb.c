@@ -0,0 +1,194 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <stdbool.h>
+#include <pthread.h>
+#include <libudev.h>
+
+#include "heads/libmontecarlo.h"
+
+/*
+ * HARDWARE DATABASE NAMES
+ * Vendor, model and PCI class names from the udev hwdb (the data behind
+ * lsusb/lspci names), looked up in-process. Results, misses included, are
+ * memoized per bus:vendor:product and per PCI class for the life of the
+ * process, so repeated scans query the hwdb once per distinct device.
+ * The hwdb describes hardware IDs, not the machine, so the host database
+ * is used whatever the context root.
+ */
+
+#define HWDB_CACHE_SIZE 1024       // power of two; lookups still work when full
+#define HWDB_KEY_MAX 48
+
+struct hwdb_entry
+{
+    char key[HWDB_KEY_MAX];        // "usb:v046Dp0825", "pci:v00008086d00001234", "class:0C0500"
+    char vendor[MC_HWDB_NAME_MAX];
+    char model[MC_HWDB_NAME_MAX];
+};
+
+static pthread_mutex_t hwdb_lock = PTHREAD_MUTEX_INITIALIZER;
+static struct udev *hwdb_udev;
+static struct udev_hwdb *hwdb;
+static bool hwdb_tried;
+static struct hwdb_entry *hwdb_cache;
+static unsigned int hwdb_cached;
+
+static unsigned int key_hash(const char *s)
+{
+    unsigned int h = 5381;
+    while (*s)
+        h = h * 33 + (unsigned char)*s++;
+    return h;
+}
+
+/* Slot holding key, or the empty slot it would go in; NULL when full. Lock held. */
+static struct hwdb_entry *cache_slot(const char *key)
+{
+    if (!hwdb_cache)
+    {
+        hwdb_cache = calloc(HWDB_CACHE_SIZE, sizeof(*hwdb_cache));
+        if (!hwdb_cache)
+            return NULL;
+    }
+
+    unsigned int h = key_hash(key) & (HWDB_CACHE_SIZE - 1);
+    for (unsigned int probe = 0; probe < HWDB_CACHE_SIZE; probe++)
+    {
+        struct hwdb_entry *e = &hwdb_cache[(h + probe) & (HWDB_CACHE_SIZE - 1)];
+        if (!e->key[0] || strcmp(e->key, key) == 0)
+            return e;
+    }
+    return NULL;
+}
+
+/* Query the hwdb with a modalias-shaped string. Lock held. */
+static void hwdb_query(const char *modalias, const char *vendor_prop, const char *model_prop,
+                       char *vendor, char *model)
+{
+    vendor[0] = model[0] = '\0';
+
+    if (!hwdb_tried)
+    {
+        hwdb_tried = true;
+        hwdb_udev = udev_new();
+        if (hwdb_udev)
+            hwdb = udev_hwdb_new(hwdb_udev);
+    }
+    if (!hwdb)
+        return;
+
+    struct udev_list_entry *e;
+    udev_list_entry_foreach(e, udev_hwdb_get_properties_list_entry(hwdb, modalias, 0))
+    {
+        const char *name = udev_list_entry_get_name(e);
+        const char *value = udev_list_entry_get_value(e);
+        if (!value)
+            continue;
+        if (vendor_prop && strcmp(name, vendor_prop) == 0)
+            snprintf(vendor, MC_HWDB_NAME_MAX, "%s", value);
+        else if (model_prop && strcmp(name, model_prop) == 0)
+            snprintf(model, MC_HWDB_NAME_MAX, "%s", value);
+    }
+}
+
+static void cached_query(const char *key, const char *modalias, const char *vendor_prop,
+                         const char *model_prop, char *vendor, char *model)
+{
+    pthread_mutex_lock(&hwdb_lock);
+    struct hwdb_entry *e = cache_slot(key);
+    if (e && e->key[0])
+    {
+        memcpy(vendor, e->vendor, MC_HWDB_NAME_MAX);
+        memcpy(model, e->model, MC_HWDB_NAME_MAX);
+    }
+    else
+    {
+        hwdb_query(modalias, vendor_prop, model_prop, vendor, model);
+        if (e)
+        {
+            snprintf(e->key, sizeof(e->key), "%s", key);
+            memcpy(e->vendor, vendor, MC_HWDB_NAME_MAX);
+            memcpy(e->model, model, MC_HWDB_NAME_MAX);
+            hwdb_cached++;
+        }
+    }
+    pthread_mutex_unlock(&hwdb_lock);
+}
+
+/* "0x8086" / "8086" -> 0x8086; -1 if not hex */
+static long parse_id(const char *id)
+{
+    if (!id || !id[0])
+        return -1;
+    char *end;
+    long v = strtol(id, &end, 16);
+    return (*end == '\0' && v >= 0 && v <= 0xffff) ? v : -1;
+}
+
+/*
+ * Vendor and model names for a USB or PCI vendor/product ID pair
+ * (hex, with or without 0x). vendor and model are MC_HWDB_NAME_MAX
+ * buffers, set to "" when unknown. Returns 1 if either name was found.
+ */
+int mc_hwdb_device_name(const char *bus, const char *vendor_id, const char *product_id,
+                        char *vendor, char *model)
+{
+    char key[HWDB_KEY_MAX];
+    long vid = parse_id(vendor_id), pid = parse_id(product_id);
+
+    vendor[0] = model[0] = '\0';
+    if (!bus || vid < 0 || pid < 0)
+        return 0;
+
+    if (strcmp(bus, "usb") == 0)
+        snprintf(key, sizeof(key), "usb:v%04lXp%04lX", vid, pid);
+    else if (strcmp(bus, "pci") == 0)
+        snprintf(key, sizeof(key), "pci:v%08lXd%08lX", vid, pid);
+    else
+        return 0;
+
+    // The key is a prefix of the device's modalias, which is what hwdb patterns match
+    cached_query(key, key, "ID_VENDOR_FROM_DATABASE", "ID_MODEL_FROM_DATABASE", vendor, model);
+    return vendor[0] || model[0];
+}
+
+/*
+ * Name of a PCI class code (sysfs "class", e.g. 0x0c0500): the subclass
+ * name ("SMBus") when known, else the class ("Serial bus controller").
+ * Returns 1 if found.
+ */
+int mc_hwdb_pci_class(const char *class_code, char *buf, size_t len)
+{
+    char key[HWDB_KEY_MAX], modalias[96], cls[MC_HWDB_NAME_MAX], sub[MC_HWDB_NAME_MAX];
+    char *end;
+
+    if (len)
+        buf[0] = '\0';
+    if (!class_code)
+        return 0;
+    unsigned long code = strtoul(class_code, &end, 16);
+    if (end == class_code || code > 0xffffff)
+        return 0;
+
+    unsigned int bc = (code >> 16) & 0xff, sc = (code >> 8) & 0xff, pi = code & 0xff;
+    snprintf(key, sizeof(key), "class:%02X%02X%02X", bc, sc, pi);
+    snprintf(modalias, sizeof(modalias),
+             "pci:v00000000d00000000sv00000000sd00000000bc%02Xsc%02Xi%02X", bc, sc, pi);
+
+    cached_query(key, modalias, "ID_PCI_CLASS_FROM_DATABASE", "ID_PCI_SUBCLASS_FROM_DATABASE", cls, sub);
+    const char *name = sub[0] ? sub : cls;
+    if (!name[0])
+        return 0;
+    snprintf(buf, len, "%s", name);
+    return 1;
+}
+
+/* Number of memoized lookups (hits and misses), for diagnostics */
+int mc_hwdb_cache_size(void)
+{
+    pthread_mutex_lock(&hwdb_lock);
+    int n = (int)hwdb_cached;
+    pthread_mutex_unlock(&hwdb_lock);
+    return n;
+}
@@ -6,11 +6,169 @@
 #include <sys/wait.h>
 #include <dirent.h>
 #include <unistd.h>
-#include <libudev.h>
+#include <limits.h>
+#include <pthread.h>
+#include <stdarg.h>
 #include <stdbool.h>
+#include <errno.h>
+#include <fcntl.h>
 
 #include "heads/libmontecarlo.h"
 
+/*
+ * CONTEXT
+ * A context carries all per-caller state (currently the root prefix), so
+ * threads that each own one share nothing mutable. Every sysfs, procfs and
+ * /lib/modules path goes through mc_path() so the library can run against
+ * a captured or synthetic tree. Empty root = live system.
+ *
+ * The functions without a ctx argument use a process-wide default context,
+ * initialised from $MONTECARLO_ROOT on first use and changed with
+ * mc_set_root(). A NULL ctx also means the default context.
+ *
+ * The default context is never modified in place: mc_set_root() publishes
+ * a new one under mc_default_lock and keeps the old one alive, since
+ * another thread may still be building a path from it (or hold the string
+ * mc_get_root() returned). Roots change once or twice per process, so the
+ * retired contexts cost a few pages at most.
+ */
+struct mc_ctx
+{
+    char root[PATH_MAX];
+};
+
+static mc_ctx_t mc_default_initial;
+static const mc_ctx_t *mc_default = &mc_default_initial;
+static pthread_once_t mc_default_once = PTHREAD_ONCE_INIT;
+static pthread_mutex_t mc_default_lock = PTHREAD_MUTEX_INITIALIZER;
+
+static void root_store(char *dst, size_t dstlen, const char *root)
+{
+    dst[0] = '\0';
+    if (!root || root[0] == '\0' || strcmp(root, "/") == 0)
+        return;
+
+    char resolved[PATH_MAX];
+    if (!realpath(root, resolved))
+        snprintf(resolved, sizeof(resolved), "%s", root);
+
+    snprintf(dst, dstlen, "%s", resolved);
+    size_t len = strlen(dst);
+    while (len > 1 && dst[len - 1] == '/')
+        dst[--len] = '\0';
+}
+
+static void default_init(void)
+{
+    root_store(mc_default_initial.root, sizeof(mc_default_initial.root), getenv("MONTECARLO_ROOT"));
+}
+
+static const mc_ctx_t *ctx_or_default(const mc_ctx_t *ctx)
+{
+    if (ctx)
+        return ctx;
+    pthread_once(&mc_default_once, default_init);
+
+    pthread_mutex_lock(&mc_default_lock);
+    const mc_ctx_t *def = mc_default;
+    pthread_mutex_unlock(&mc_default_lock);
+    return def;
+}
+
+mc_ctx_t *mc_ctx_new(const char *root)
+{
+    mc_ctx_t *ctx = calloc(1, sizeof(*ctx));
+    if (!ctx)
+        return NULL;
+
+    if (root)
+        root_store(ctx->root, sizeof(ctx->root), root);
+    else
+        memcpy(ctx->root, ctx_or_default(NULL)->root, sizeof(ctx->root));
+    return ctx;
+}
+
+void mc_ctx_free(mc_ctx_t *ctx)
+{
+    free(ctx);
+}
+
+const char *mc_ctx_root(const mc_ctx_t *ctx)
+{
+    return ctx_or_default(ctx)->root;
+}
+
+/* Safe while other threads use the default context; they see the old root or the new one */
+void mc_set_root(const char *root)
+{
+    pthread_once(&mc_default_once, default_init);
+
+    mc_ctx_t *next = calloc(1, sizeof(*next));
+    if (!next)
+        return;
+    root_store(next->root, sizeof(next->root), root);
+
+    pthread_mutex_lock(&mc_default_lock);
+    mc_default = next;      // the previous one is retired, not freed
+    pthread_mutex_unlock(&mc_default_lock);
+}
+
+const char *mc_get_root(void)
+{
+    return ctx_or_default(NULL)->root;
+}
+
+/* Format an absolute path and prefix it with the context root (if any) */
+static int mc_path(const mc_ctx_t *ctx, char *buf, size_t len, const char *fmt, ...)
+{
+    const char *root = ctx->root;
+    size_t rlen = strlen(root);
+
+    if (rlen >= len)
+        return -1;
+    memcpy(buf, root, rlen);
+
+    va_list ap;
+    va_start(ap, fmt);
+    int n = vsnprintf(buf + rlen, len - rlen, fmt, ap);
+    va_end(ap);
+
+    return (n < 0 || (size_t)n >= len - rlen) ? -1 : 0;
+}
+
+/* Prefix a caller-supplied syspath, unless it is already under the root */
+static int mc_rooted(const mc_ctx_t *ctx, char *buf, size_t len, const char *syspath)
+{
+    const char *root = ctx->root;
+    size_t rlen = strlen(root);
+
+    if (rlen && strncmp(syspath, root, rlen) == 0 && (syspath[rlen] == '/' || syspath[rlen] == '\0'))
+        return (snprintf(buf, len, "%s", syspath) < (int)len) ? 0 : -1;
+    return mc_path(ctx, buf, len, "%s", syspath);
+}
+
+/* DAEMON SOCKET PATH */
+/* Per-user: $XDG_RUNTIME_DIR, else /run/user/$UID, else /tmp with the UID */
+void mc_get_socket_path(char *buf, size_t bufsize)
+{
+    const char *runtime_dir = getenv("XDG_RUNTIME_DIR");
+    uid_t uid = getuid();
+
+    if (runtime_dir && runtime_dir[0] != '\0')
+    {
+        snprintf(buf, bufsize, "%s/montecarlo.sock", runtime_dir);
+        return;
+    }
+
+    char runtime_path[256];
+    snprintf(runtime_path, sizeof(runtime_path), "/run/user/%d", uid);
+
+    if (access(runtime_path, W_OK) == 0)
+        snprintf(buf, bufsize, "%s/montecarlo.sock", runtime_path);
+    else
+        snprintf(buf, bufsize, "/tmp/montecarlo-%d.sock", uid);
+}
+
 /* READ SYSFS ATTRIBUTE */
 int mc_read_sysattr(const char *path, char *buf, size_t buflen)
 {
@@ -31,13 +189,123 @@ int mc_read_sysattr(const char *path, char *buf, size_t buflen)
     return 1;
 }
 
+/*
+ * SYSFS DEVICE VIEW
+ * Enumeration and filtering read sysfs directly (which is all libudev
+ * does for these attributes) so they honour the root prefix and don't
+ * need a udev context per call.
+ */
+struct sysdev
+{
+    const mc_ctx_t *ctx;
+    char path[1024];        // on-disk path (root-prefixed)
+    const char *syspath;    // same path as seen on the target system
+    char subsystem[32];
+    char devtype[32];
+};
+
+/* Read <dev>/<name>, trailing whitespace stripped. Returns NULL if absent. */
+static const char *sysdev_attr(const struct sysdev *d, const char *name, char *buf, size_t len)
+{
+    char path[1200];
+    snprintf(path, sizeof(path), "%s/%s", d->path, name);
+    if (!mc_read_sysattr(path, buf, len))
+        return NULL;
+
+    size_t n = strlen(buf);
+    while (n > 0 && (buf[n - 1] == ' ' || buf[n - 1] == '\t' || buf[n - 1] == '\r'))
+        buf[--n] = '\0';
+    return buf;
+}
+
+/* Basename of the <dev>/<link> symlink target (e.g. "driver", "subsystem") */
+static const char *sysdev_link_name(const struct sysdev *d, const char *link, char *buf, size_t len)
+{
+    char path[1200], target[1024];
+    snprintf(path, sizeof(path), "%s/%s", d->path, link);
+
+    ssize_t n = readlink(path, target, sizeof(target) - 1);
+    if (n == -1)
+        return NULL;
+    target[n] = '\0';
+
+    const char *name = strrchr(target, '/');
+    snprintf(buf, len, "%s", name ? name + 1 : target);
+    return buf;
+}
+
+static const char *sysdev_sysname(const struct sysdev *d)
+{
+    const char *name = strrchr(d->syspath, '/');
+    return name ? name + 1 : d->syspath;
+}
+
+/* Fill a view from an on-disk (rooted) path. Returns 0 on success. */
+static int sysdev_open(const mc_ctx_t *ctx, struct sysdev *d, const char *path)
+{
+    memset(d, 0, sizeof(*d));
+    d->ctx = ctx;
+    if (snprintf(d->path, sizeof(d->path), "%s", path) >= (int)sizeof(d->path))
+        return -1;
+
+    size_t rlen = strlen(ctx->root);
+    d->syspath = d->path + ((strncmp(d->path, ctx->root, rlen) == 0) ? rlen : 0);
+
+    if (!sysdev_link_name(d, "subsystem", d->subsystem, sizeof(d->subsystem)))
+        return -1;
+
+    /* DEVTYPE lives in uevent */
+    char uevent[1200];
+    snprintf(uevent, sizeof(uevent), "%s/uevent", d->path);
+    FILE *f = fopen(uevent, "r");
+    if (f)
+    {
+        char line[256];
+        while (fgets(line, sizeof(line), f))
+        {
+            if (strncmp(line, "DEVTYPE=", 8) == 0)
+            {
+                line[strcspn(line, "\n")] = '\0';
+                snprintf(d->devtype, sizeof(d->devtype), "%s", line + 8);
+                break;
+            }
+        }
+        fclose(f);
+    }
+    return 0;
+}
+
+/* Walk up to the nearest ancestor with the given subsystem/devtype */
+static int sysdev_parent_with(const struct sysdev *d, const char *subsystem, const char *devtype,
+                              struct sysdev *parent)
+{
+    char path[1024];
+    snprintf(path, sizeof(path), "%s", d->path);
+
+    size_t floor = strlen(d->ctx->root) + strlen("/sys/devices");
+    char *slash;
+    while ((slash = strrchr(path, '/')) && (size_t)(slash - path) > floor)
+    {
+        *slash = '\0';
+        if (sysdev_open(d->ctx, parent, path) != 0)
+            continue;
+        if (strcmp(parent->subsystem, subsystem) == 0 &&
+            (!devtype || strcmp(parent->devtype, devtype) == 0))
+            return 0;
+    }
+    return -1;
+}
+
 /* GET ID_VENDOR / ID_PRODUCT */
-void mc_get_ids(const char *syspath, char *vendor, char *product)
+void mc_ctx_get_ids(const mc_ctx_t *ctx, const char *syspath, char *vendor, char *product)
 {
-    char path_v[1024], path_p[1024];
+    char root_path[1024], path_v[1100], path_p[1100];
 
-    snprintf(path_v, sizeof(path_v), "%s/idVendor", syspath);
-    snprintf(path_p, sizeof(path_p), "%s/idProduct", syspath);
+    ctx = ctx_or_default(ctx);
+    if (mc_rooted(ctx, root_path, sizeof(root_path), syspath) != 0)
+        root_path[0] = '\0';
+    snprintf(path_v, sizeof(path_v), "%s/idVendor", root_path);
+    snprintf(path_p, sizeof(path_p), "%s/idProduct", root_path);
 
     if (!mc_read_sysattr(path_v, vendor, 32))
     {
@@ -60,8 +328,10 @@ void mc_get_ids(const char *syspath, char *vendor, char *product)
 /*   /sys/bus/i2c/drivers */
 /*   /sys/bus/sdio/drivers */
 /*   /sys/bus/scsi/drivers */
-int mc_list_candidate_drivers(char out[][128], int max)
+int mc_ctx_list_candidate_drivers(const mc_ctx_t *ctx, char out[][128], int max)
 {
+    ctx = ctx_or_default(ctx);
+
     const char *bus_paths[] = {
         "/sys/bus/usb/drivers",
         "/sys/bus/usb-serial/drivers",
@@ -77,7 +347,11 @@ int mc_list_candidate_drivers(char out[][128], int max)
 
     for (int b = 0; bus_paths[b] != NULL; b++)
     {
-        DIR *dir = opendir(bus_paths[b]);
+        char bus_dir[1024];
+        if (mc_path(ctx, bus_dir, sizeof(bus_dir), "%s", bus_paths[b]) != 0)
+            continue;
+
+        DIR *dir = opendir(bus_dir);
         if (!dir)
             continue;
 
@@ -88,8 +362,8 @@ int mc_list_candidate_drivers(char out[][128], int max)
                 continue;
 
             // Check if it's a directory or symlink
-            char full_path[512];
-            snprintf(full_path, sizeof(full_path), "%s/%s", bus_paths[b], ent->d_name);
+            char full_path[1300];
+            snprintf(full_path, sizeof(full_path), "%s/%s", bus_dir, ent->d_name);
 
             struct stat st;
             if (lstat(full_path, &st) == 0 && S_ISDIR(st.st_mode))
@@ -166,292 +440,651 @@ int mc_dmesg_has_activity(const char *driver)
 }
 
 /* GET DEVICE SUBSYSTEM */
-const char *mc_get_device_subsystem(const char *syspath)
+/* Writes the bus name (basename of <syspath>/subsystem) to buf. */
+/* Returns 0 on success, -1 with "unknown" in buf otherwise. */
+int mc_ctx_get_device_subsystem(const mc_ctx_t *ctx, const char *syspath, char *buf, size_t len)
 {
-    static char subsystem[16];
     char link_path[1024];
     char target[1024];
 
-    snprintf(link_path, sizeof(link_path), "%s/subsystem", syspath);
+    if (!buf || len == 0)
+        return -1;
+    snprintf(buf, len, "unknown");
 
-    ssize_t len = readlink(link_path, target, sizeof(target) - 1);
-    
-    if (len == -1)
-    {
-        strcpy(subsystem, "unknown");
-        return subsystem;
-    }
+    ctx = ctx_or_default(ctx);
+    if (!syspath || mc_rooted(ctx, link_path, sizeof(link_path) - 12, syspath) != 0)
+        return -1;
+    strcat(link_path, "/subsystem");
 
-    target[len] = '\0';
+    ssize_t n = readlink(link_path, target, sizeof(target) - 1);
+    if (n == -1)
+        return -1;
+    target[n] = '\0';
 
     const char *bus_name = strrchr(target, '/');
-    if (!bus_name)
-    {
-        strcpy(subsystem, "unknown");
-        return NULL;
-    }
-    
-    size_t subsystem_len = strlen(bus_name) - strlen(syspath) - 1;
-    
-    if(subsystem_len > sizeof(subsystem) - 1)
-        return NULL;
-    
-    strncpy(subsystem, bus_name + 1, subsystem_len);
-    subsystem[subsystem_len] = '\0';
-        
-    return subsystem;
+    bus_name = bus_name ? bus_name + 1 : target;
+
+    if (strlen(bus_name) >= len)
+        return -1;
+
+    snprintf(buf, len, "%s", bus_name);
+    return 0;
 }
 
 /* CHECK IF DEVICE HAS DRIVER BOUND */
-int mc_dev_has_driver(const char *syspath)
+int mc_ctx_dev_has_driver(const mc_ctx_t *ctx, const char *syspath)
 {
-    struct udev *udev = udev_new();
-    if (!udev)
+    char driver_link[1024];
+    ctx = ctx_or_default(ctx);
+    if (!syspath || mc_rooted(ctx, driver_link, sizeof(driver_link) - 8, syspath) != 0)
         return 0;
+    strcat(driver_link, "/driver");
 
-    struct udev_device *dev = udev_device_new_from_syspath(udev, syspath);
-    if (!dev)
-    {
-        udev_unref(udev);
-        return 0;
-    }
+    return access(driver_link, F_OK) == 0;
+}
 
-    char driver_link[1024];
-    snprintf(driver_link, sizeof(driver_link), "%s/driver", syspath);
+/* Write one value to a sysfs attribute. Returns 0, or -1 with errno from the kernel. */
+static int sysfs_write(const char *path, const char *value)
+{
+    int fd = open(path, O_WRONLY | O_CLOEXEC);
+    if (fd < 0)
+        return -1;
 
-    int has_driver = 0;
-    if (access(driver_link, F_OK) == 0)
-        has_driver = 1;
-    
+    ssize_t n = write(fd, value, strlen(value));
+    int saved = errno;
+    close(fd);
 
-    udev_device_unref(dev);
-    udev_unref(udev);
-    return has_driver;
+    if (n < 0)
+    {
+        errno = saved;
+        return -1;
+    }
+    return 0;
 }
 
-/* LIST ALL DEVICES (Multi-Bus Support) */
-int mc_list_all_devices(mc_device_info_t *out, int max)
+/* "vvvv pppp" as the bus's new_id/remove_id files expect it */
+static int sysdev_match_id(const struct sysdev *d, char *buf, size_t len)
 {
-    struct udev *udev = udev_new();
-    if (!udev)
+    char vendor[32], product[32];
+
+    if (strcmp(d->subsystem, "usb") == 0)
+    {
+        struct sysdev parent;
+        const struct sysdev *udev = d;
+        if (strcmp(d->devtype, "usb_interface") == 0)
+        {
+            if (sysdev_parent_with(d, "usb", "usb_device", &parent) != 0)
+                return -1;
+            udev = &parent;
+        }
+        if (!sysdev_attr(udev, "idVendor", vendor, sizeof(vendor)) ||
+            !sysdev_attr(udev, "idProduct", product, sizeof(product)))
+            return -1;
+        snprintf(buf, len, "%s %s", vendor, product);
         return 0;
+    }
 
-    struct udev_enumerate *enumerate = udev_enumerate_new(udev);
-    if (!enumerate)
+    if (strcmp(d->subsystem, "pci") == 0)
     {
-        udev_unref(udev);
+        if (!sysdev_attr(d, "vendor", vendor, sizeof(vendor)) ||
+            !sysdev_attr(d, "device", product, sizeof(product)))
+            return -1;
+        // sysfs shows 0x8086, new_id wants 8086
+        snprintf(buf, len, "%s %s",
+                 strncmp(vendor, "0x", 2) == 0 ? vendor + 2 : vendor,
+                 strncmp(product, "0x", 2) == 0 ? product + 2 : product);
         return 0;
     }
 
-    // Add multiple subsystems to enumerate
-    const char *subsystems[] = { "usb", "pci", "hid", "scsi", "pcmcia", NULL };
-    for (int i = 0; subsystems[i]; i++)
-        udev_enumerate_add_match_subsystem(enumerate, subsystems[i]);
+    return -1;
+}
 
-    udev_enumerate_scan_devices(enumerate);
+static bool sysdev_bound_to(const struct sysdev *d, const char *driver)
+{
+    char current[128];
+    return sysdev_link_name(d, "driver", current, sizeof(current)) && strcmp(current, driver) == 0;
+}
 
-    struct udev_list_entry *devices = udev_enumerate_get_list_entry(enumerate);
-    struct udev_list_entry *dev_list_entry;
+/*
+ * PROBE BY BIND
+ * Tries a driver that is already registered on the device's bus, without
+ * loading or unloading any module:
+ *   1. write the device name to <bus>/drivers/<driver>/bind
+ *   2. if refused and the bus has new_id (usb, pci), add the device's
+ *      vendor/product as a dynamic id, which makes the driver probe it
+ * A dynamic id that did not lead to a binding is removed again.
+ * Returns 1 if the device is bound to the driver, 0 if the driver rejected
+ * it, -1 if it could not be tried (errno ENOENT: driver not registered on
+ * that bus, EBUSY: device bound to another driver, EACCES: not root...).
+ */
+int mc_ctx_probe_bind(const mc_ctx_t *ctx, const char *syspath, const char *driver)
+{
+    char dev_path[1024], drv_dir[1200], attr[1300], id[64];
+    struct sysdev dev;
+    struct stat st;
 
-    int count = 0;
-    udev_list_entry_foreach(dev_list_entry, devices)
+    ctx = ctx_or_default(ctx);
+    if (!syspath || !driver || !driver[0] || strchr(driver, '/'))
     {
-        if (count >= max)
-            break;
-
-        const char *path = udev_list_entry_get_name(dev_list_entry);
-        struct udev_device *dev = udev_device_new_from_syspath(udev, path);
-        
-        if (!dev)
-            continue;
+        errno = EINVAL;
+        return -1;
+    }
+    if (mc_rooted(ctx, dev_path, sizeof(dev_path), syspath) != 0 ||
+        sysdev_open(ctx, &dev, dev_path) != 0)
+    {
+        errno = ENODEV;
+        return -1;
+    }
 
-        const char *subsystem = udev_device_get_subsystem(dev);
-        if (!subsystem)
-        {
-            udev_device_unref(dev);
-            continue;
-        }
+    char current[128];
+    if (sysdev_link_name(&dev, "driver", current, sizeof(current)))
+    {
+        if (strcmp(current, driver) == 0)
+            return 1;
+        errno = EBUSY;
+        return -1;
+    }
 
-        // Skip infrastructure devices
-        if (mc_is_infrastructure_device(path, subsystem))
-        {
-            udev_device_unref(dev);
-            continue;
-        }
+    if (mc_path(ctx, drv_dir, sizeof(drv_dir), "/sys/bus/%s/drivers/%s", dev.subsystem, driver) != 0 ||
+        stat(drv_dir, &st) != 0 || !S_ISDIR(st.st_mode))
+    {
+        errno = ENOENT;
+        return -1;
+    }
 
-        // Variables comunes
-        const char *vendor = NULL;
-        const char *product = NULL;
-        const char *model = NULL;
-        const char *man_name = NULL;
-        char combined_name[128];
-        char vidpid[32] = "????:????";
+    // 1. The driver's own id table
+    snprintf(attr, sizeof(attr), "%s/bind", drv_dir);
+    if (sysfs_write(attr, sysdev_sysname(&dev)) == 0 && sysdev_bound_to(&dev, driver))
+        return 1;
+    if (errno == EACCES || errno == EPERM || errno == EROFS)
+        return -1;
 
-        // USB Devices
-        if (strcmp(subsystem, "usb") == 0)
-        {
-            const char *devtype = udev_device_get_devtype(dev);
-            if (!devtype || strcmp(devtype, "usb_interface") != 0)
-            {
-                udev_device_unref(dev);
-                continue;
-            }
+    // 2. Teach it the device's id
+    snprintf(attr, sizeof(attr), "%s/new_id", drv_dir);
+    if (sysdev_match_id(&dev, id, sizeof(id)) != 0 || access(attr, F_OK) != 0)
+        return 0;
 
-            // Skip Hubs
-            const char *class_str = udev_device_get_sysattr_value(dev, "bInterfaceClass");
-            if (class_str && strcmp(class_str, "09") == 0)
-            {
-                udev_device_unref(dev);
-                continue;
-            }
+    bool added = sysfs_write(attr, id) == 0;
+    if (sysdev_bound_to(&dev, driver))
+        return 1;
 
-            // Parent device for USB metadata
-            struct udev_device *parent = udev_device_get_parent_with_subsystem_devtype(dev, "usb", "usb_device");
-            if (!parent)
-            {
-                udev_device_unref(dev);
-                continue;
-            }
+    if (added)
+    {
+        snprintf(attr, sizeof(attr), "%s/remove_id", drv_dir);
+        sysfs_write(attr, id);
+    }
+    return 0;
+}
 
-            const char *p_class = udev_device_get_sysattr_value(parent, "bDeviceClass");
-            if (p_class && strcmp(p_class, "09") == 0)
-            {
-                udev_device_unref(dev);
-                continue;
-            }
+/* UNBIND DEVICE */
+/* Detaches the device from its driver; the module stays loaded. */
+/* Returns 0 if the device is unbound afterwards, -1 otherwise. */
+int mc_ctx_unbind_device(const mc_ctx_t *ctx, const char *syspath)
+{
+    char dev_path[1024], attr[1100];
+    struct sysdev dev;
 
-            vendor = udev_device_get_sysattr_value(parent, "idVendor");
-            product = udev_device_get_sysattr_value(parent, "idProduct");
-            const char *prod_name = udev_device_get_sysattr_value(parent, "product");
-            man_name = udev_device_get_sysattr_value(parent, "manufacturer");
-            const char *iface_num = udev_device_get_sysattr_value(dev, "bInterfaceNumber");
+    ctx = ctx_or_default(ctx);
+    if (!syspath || mc_rooted(ctx, dev_path, sizeof(dev_path), syspath) != 0 ||
+        sysdev_open(ctx, &dev, dev_path) != 0)
+    {
+        errno = ENODEV;
+        return -1;
+    }
 
-            snprintf(vidpid, sizeof(vidpid), "%s:%s", vendor ? vendor : "????", product ? product : "????");
+    snprintf(attr, sizeof(attr), "%s/driver", dev.path);
+    if (access(attr, F_OK) != 0)
+        return 0;
 
-            if (!prod_name)
-                prod_name = "Unknown Device";
-            if (!man_name)
-                man_name = "";
+    snprintf(attr, sizeof(attr), "%s/driver/unbind", dev.path);
+    if (sysfs_write(attr, sysdev_sysname(&dev)) != 0)
+        return -1;
 
-            if (iface_num)
-                snprintf(combined_name, sizeof(combined_name), "%s %s (If: %s)", man_name, prod_name, iface_num);
-            else
-                snprintf(combined_name, sizeof(combined_name), "%s %s", man_name, prod_name);
+    snprintf(attr, sizeof(attr), "%s/driver", dev.path);
+    return access(attr, F_OK) == 0 ? -1 : 0;
+}
 
-            strncpy(out[count].product, combined_name, 127);
-        }
-        // PCI Devices
-        else if (strcmp(subsystem, "pci") == 0)
-        {
-            vendor = udev_device_get_sysattr_value(dev, "vendor");
-            product = udev_device_get_sysattr_value(dev, "device");
-            const char *label = udev_device_get_sysattr_value(dev, "label");
-            const char *sysname = udev_device_get_sysname(dev);
+static int path_cmp(const void *a, const void *b)
+{
+    return strcmp(*(char *const *)a, *(char *const *)b);
+}
 
-            if (vendor && product)
-                snprintf(vidpid, sizeof(vidpid), "%s:%s", vendor, product);
+/* Collect canonical device paths of the enumerated buses, sorted */
+static char **collect_device_paths(const mc_ctx_t *ctx, int *count)
+{
+    const char *subsystems[] = { "usb", "pci", "hid", "scsi", "pcmcia", NULL };
+    char **paths = NULL;
+    int n = 0, cap = 0;
 
-            if (label)
-                strncpy(out[count].product, label, 127);
-            else
-                snprintf(out[count].product, 127, "PCI Device %s", sysname ? sysname : "Unknown");
-        }
-        // HID Devices
-        else if (strcmp(subsystem, "hid") == 0)
-        {
-            strncpy(vidpid, "HID", sizeof(vidpid));
-            const char *name = udev_device_get_sysattr_value(dev, "name");
-            snprintf(out[count].product, 127, "HID: %s", name ? name : "HID Device");
-        }
-        // SCSI Devices
-        else if (strcmp(subsystem, "scsi") == 0)
-        {
-            strncpy(vidpid, "SCSI", sizeof(vidpid));
-            model = udev_device_get_sysattr_value(dev, "model");
-            vendor = udev_device_get_sysattr_value(dev, "vendor");
+    *count = 0;
+    for (int i = 0; subsystems[i]; i++)
+    {
+        char bus_dir[1024];
+        if (mc_path(ctx, bus_dir, sizeof(bus_dir), "/sys/bus/%s/devices", subsystems[i]) != 0)
+            continue;
 
-            if (!vendor || !model)
-                strncpy(out[count].product, "SCSI Device", 127);
-            else
-                snprintf(out[count].product, 127, "%s %s", vendor, model);
-        }
-        // PCMCIA Devices
-        else if (strcmp(subsystem, "pcmcia") == 0)
-        {
-            const char *prod_id = udev_device_get_sysattr_value(dev, "prod_id");
-            const char *manf_id = udev_device_get_sysattr_value(dev, "manf_id");
-            const char *sysname = udev_device_get_sysname(dev);
-
-            strncpy(vidpid, "PCMCIA", sizeof(vidpid));
-            if (!prod_id)
-                snprintf(out[count].product, 127, "PCMCIA Device %s", sysname ? sysname : "Unknown");
-            else if (!manf_id)
-                snprintf(out[count].product, 127, "PCMCIA: %s", prod_id);
-            else
-                snprintf(out[count].product, 127, "PCMCIA: %s %s", manf_id, prod_id);
-        }
-        else
-        {
-            // Unknown subsystem, skip
-            udev_device_unref(dev);
+        DIR *dir = opendir(bus_dir);
+        if (!dir)
             continue;
-        }
 
-        // Driver info (common)
-        char driver_path[1024];
-        char driver_target[1024];
-        snprintf(driver_path, sizeof(driver_path), "%s/driver", path);
-        ssize_t len = readlink(driver_path, driver_target, sizeof(driver_target) - 1);
-        if (len != -1)
+        struct dirent *ent;
+        while ((ent = readdir(dir)) != NULL)
         {
-            driver_target[len] = '\0';
-            const char *dname = strrchr(driver_target, '/');
-            const char *final_driver = dname ? dname + 1 : "unknown";
+            if (ent->d_name[0] == '.')
+                continue;
 
-            // Skip USB host controllers
-            if (strcmp(subsystem, "usb") == 0 &&
-                (strstr(final_driver, "hcd") != NULL || strcmp(final_driver, "hub") == 0))
-            {
-                udev_device_unref(dev);
+            char link[1300], real[PATH_MAX];
+            snprintf(link, sizeof(link), "%s/%s", bus_dir, ent->d_name);
+            if (!realpath(link, real))
                 continue;
-            }
 
-            strncpy(out[count].driver, final_driver, 63);
-        }
-        else
-        {
-            strncpy(out[count].driver, "None", 63);
+            if (n == cap)
+            {
+                cap = cap ? cap * 2 : 256;
+                char **grown = realloc(paths, cap * sizeof(*paths));
+                if (!grown)
+                    break;
+                paths = grown;
+            }
+            paths[n] = strdup(real);
+            if (paths[n])
+                n++;
         }
-
-        // Fill common fields
-        strncpy(out[count].syspath, path, 255);
-        strncpy(out[count].vidpid, vidpid, 31);
-        strncpy(out[count].subsystem, subsystem, 15);
-        out[count].subsystem[15] = '\0';
-
-        count++;
-        udev_device_unref(dev);
+        closedir(dir);
     }
 
-    udev_enumerate_unref(enumerate);
-    udev_unref(udev);
+    if (n > 1)
+        qsort(paths, n, sizeof(*paths), path_cmp);
+    *count = n;
+    return paths;
+}
 
-    return count;
+static int infrastructure_reason(const struct sysdev *d);
+static bool is_mass_storage(const struct sysdev *dev);
+
+/* Reason a usb-class rule gives the class in attribute `name` (bDeviceClass...), 0 if none */
+static int usb_class_reason(const struct sysdev *d, const char *name)
+{
+    char cls[8];
+    int reason = 0;
+    if (sysdev_attr(d, name, cls, sizeof(cls)))
+        mc_ctx_rule_match(d->ctx, MC_RULE_USB_CLASS, cls, &reason);
+    return reason;
 }
 
+/* Join two name parts with a space, skipping empty ones */
+static void name_join(char *buf, size_t len, const char *a, const char *b)
+{
+    snprintf(buf, len, "%s%s%s", a, (a[0] && b[0]) ? " " : "", b);
+}
 
-/* CHECK IF MODULE HAS HOLDERS */
-// Returns 1 if /sys/module/<name>/holders is NOT empty (module is a dependency).
-// Returns 0 if empty (independent module).
-int mc_module_has_holders(const char *module)
+/* USB name: the device's own strings, hwdb names where they are missing */
+static void usb_display_name(const struct sysdev *usb_dev, const struct sysdev *iface, char *buf, size_t len)
 {
-    char path[256];
-    snprintf(path, sizeof(path), "/sys/module/%s/holders", module);
+    char vendor[32], product[32], prod_buf[128], man_buf[128], iface_buf[8];
+    char db_vendor[MC_HWDB_NAME_MAX], db_model[MC_HWDB_NAME_MAX];
 
-    DIR *dir = opendir(path);
-    if (!dir)
+    const char *prod_name = sysdev_attr(usb_dev, "product", prod_buf, sizeof(prod_buf));
+    const char *man = sysdev_attr(usb_dev, "manufacturer", man_buf, sizeof(man_buf));
+    const char *iface_num = iface ? sysdev_attr(iface, "bInterfaceNumber", iface_buf, sizeof(iface_buf)) : NULL;
+
+    if (!prod_name || !man)
     {
-        return 0; // If holders dir doesn't exist, assume no holders (or built-in?)
+        mc_hwdb_device_name("usb", sysdev_attr(usb_dev, "idVendor", vendor, sizeof(vendor)),
+                            sysdev_attr(usb_dev, "idProduct", product, sizeof(product)),
+                            db_vendor, db_model);
+        if (!prod_name)
+            prod_name = db_model[0] ? db_model : "Unknown Device";
+        if (!man)
+            man = db_vendor;
+    }
+
+    char combined[256];
+    name_join(combined, sizeof(combined), man, prod_name);
+    if (iface_num)
+        snprintf(buf, len, "%s (If: %s)", combined, iface_num);
+    else
+        snprintf(buf, len, "%s", combined);
+}
+
+/* PCI name: firmware label, else hwdb vendor and model, else vendor and class */
+static void pci_display_name(const struct sysdev *dev, char *buf, size_t len)
+{
+    char vendor[32], device[32], class_code[16], label[128];
+    char db_vendor[MC_HWDB_NAME_MAX], db_model[MC_HWDB_NAME_MAX], class_name[MC_HWDB_NAME_MAX];
+
+    if (sysdev_attr(dev, "label", label, sizeof(label)))
+    {
+        snprintf(buf, len, "%s", label);
+        return;
+    }
+
+    mc_hwdb_device_name("pci", sysdev_attr(dev, "vendor", vendor, sizeof(vendor)),
+                        sysdev_attr(dev, "device", device, sizeof(device)), db_vendor, db_model);
+
+    if (db_model[0])
+        name_join(buf, len, db_vendor, db_model);
+    else if (mc_hwdb_pci_class(sysdev_attr(dev, "class", class_code, sizeof(class_code)),
+                               class_name, sizeof(class_name)))
+        name_join(buf, len, db_vendor, class_name);
+    else if (db_vendor[0])
+        snprintf(buf, len, "%s PCI Device %s", db_vendor, sysdev_sysname(dev));
+    else
+        snprintf(buf, len, "PCI Device %s", sysdev_sysname(dev));
+}
+
+/* Display name of any device, filtered or not (the dashboard's "product") */
+int mc_ctx_device_name(const mc_ctx_t *ctx, const char *syspath, char *buf, size_t len)
+{
+    char dev_path[1024], a[128], b[128];
+    struct sysdev dev, parent;
+
+    ctx = ctx_or_default(ctx);
+    if (!syspath || !buf || len == 0 || mc_rooted(ctx, dev_path, sizeof(dev_path), syspath) != 0 ||
+        sysdev_open(ctx, &dev, dev_path) != 0)
+        return -1;
+
+    if (strcmp(dev.subsystem, "pci") == 0)
+        pci_display_name(&dev, buf, len);
+    else if (strcmp(dev.subsystem, "usb") == 0 && strcmp(dev.devtype, "usb_interface") == 0 &&
+             sysdev_parent_with(&dev, "usb", "usb_device", &parent) == 0)
+        usb_display_name(&parent, &dev, buf, len);
+    else if (strcmp(dev.subsystem, "usb") == 0)
+        usb_display_name(&dev, NULL, buf, len);
+    else if (strcmp(dev.subsystem, "hid") == 0)
+        snprintf(buf, len, "HID: %s", sysdev_attr(&dev, "name", a, sizeof(a)) ? a : "HID Device");
+    else if (strcmp(dev.subsystem, "scsi") == 0 && sysdev_attr(&dev, "vendor", a, sizeof(a)) &&
+             sysdev_attr(&dev, "model", b, sizeof(b)))
+        snprintf(buf, len, "%s %s", a, b);
+    else
+        snprintf(buf, len, "%s", sysdev_sysname(&dev));
+    return 0;
+}
+
+/* Fill info for one device and classify it (MC_REASON_*). -1 = not a dashboard bus. */
+/* With explain false, work stops at the first reason to hide the device. */
+static int describe_device(const struct sysdev *dev, bool explain, mc_device_info_t *info)
+{
+    const char *subsystem = dev->subsystem;
+    int reason = infrastructure_reason(dev);
+    if (reason && !explain)
+        return reason;
+
+    memset(info, 0, sizeof(*info));
+
+    // Variables comunes
+    char vendor[64], product[64], model[128], man_name[128], name[128];
+    char vidpid[32] = "????:????";
+
+    // USB Devices
+    if (strcmp(subsystem, "usb") == 0)
+    {
+        struct sysdev parent;
+        const struct sysdev *usb_dev = &parent;
+        int class_reason;
+
+        if (strcmp(dev->devtype, "usb_interface") != 0)
+        {
+            // The device node itself: only its interfaces are listed
+            reason = reason ? reason : MC_REASON_USB_DEVICE;
+            if (!explain)
+                return reason;
+            usb_dev = dev;
+            if (MC_REASON_HIDDEN(class_reason = usb_class_reason(dev, "bDeviceClass")))
+                reason = class_reason;
+        }
+        else
+        {
+            // Skip Hubs (and any other class a usb-class rule hides)
+            if (!reason && MC_REASON_HIDDEN(class_reason = usb_class_reason(dev, "bInterfaceClass")))
+                reason = class_reason;
+            if (reason && !explain)
+                return reason;
+
+            // Parent device for USB metadata
+            if (sysdev_parent_with(dev, "usb", "usb_device", &parent) != 0)
+            {
+                reason = reason ? reason : MC_REASON_USB_NO_PARENT;
+                if (!explain)
+                    return reason;
+                usb_dev = dev;
+            }
+            else if (!reason && MC_REASON_HIDDEN(class_reason = usb_class_reason(&parent, "bDeviceClass")))
+            {
+                reason = class_reason;
+                if (!explain)
+                    return reason;
+            }
+        }
+
+        const char *v = sysdev_attr(usb_dev, "idVendor", vendor, sizeof(vendor));
+        const char *pr = sysdev_attr(usb_dev, "idProduct", product, sizeof(product));
+
+        snprintf(vidpid, sizeof(vidpid), "%s:%s", v ? v : "????", pr ? pr : "????");
+        usb_display_name(usb_dev, usb_dev == dev ? NULL : dev, info->product, sizeof(info->product));
+    }
+    // PCI Devices
+    else if (strcmp(subsystem, "pci") == 0)
+    {
+        const char *v = sysdev_attr(dev, "vendor", vendor, sizeof(vendor));
+        const char *pr = sysdev_attr(dev, "device", product, sizeof(product));
+
+        if (v && pr)
+            snprintf(vidpid, sizeof(vidpid), "%s:%s", v, pr);
+
+        pci_display_name(dev, info->product, sizeof(info->product));
+    }
+    // HID Devices
+    else if (strcmp(subsystem, "hid") == 0)
+    {
+        strncpy(vidpid, "HID", sizeof(vidpid));
+        const char *hid_name = sysdev_attr(dev, "name", name, sizeof(name));
+        snprintf(info->product, 127, "HID: %s", hid_name ? hid_name : "HID Device");
+    }
+    // SCSI Devices
+    else if (strcmp(subsystem, "scsi") == 0)
+    {
+        strncpy(vidpid, "SCSI", sizeof(vidpid));
+        const char *m = sysdev_attr(dev, "model", model, sizeof(model));
+        const char *v = sysdev_attr(dev, "vendor", vendor, sizeof(vendor));
+
+        if (!v || !m)
+            strncpy(info->product, "SCSI Device", 127);
+        else
+            snprintf(info->product, 127, "%s %s", v, m);
+    }
+    // PCMCIA Devices
+    else if (strcmp(subsystem, "pcmcia") == 0)
+    {
+        const char *prod_id = sysdev_attr(dev, "prod_id", name, sizeof(name));
+        const char *manf_id = sysdev_attr(dev, "manf_id", man_name, sizeof(man_name));
+
+        strncpy(vidpid, "PCMCIA", sizeof(vidpid));
+        if (!prod_id)
+            snprintf(info->product, 127, "PCMCIA Device %s", sysdev_sysname(dev));
+        else if (!manf_id)
+            snprintf(info->product, 127, "PCMCIA: %s", prod_id);
+        else
+            snprintf(info->product, 127, "PCMCIA: %s %s", manf_id, prod_id);
+    }
+    else
+    {
+        // Unknown subsystem, skip
+        return -1;
+    }
+
+    // Driver info (common)
+    char final_driver[64];
+    if (sysdev_link_name(dev, "driver", final_driver, sizeof(final_driver)))
+    {
+        // Skip USB host controllers
+        if (!reason && strcmp(subsystem, "usb") == 0 &&
+            (strstr(final_driver, "hcd") != NULL || strcmp(final_driver, "hub") == 0))
+        {
+            reason = strcmp(final_driver, "hub") == 0 ? MC_REASON_USB_HUB : MC_REASON_USB_HCD;
+            if (!explain)
+                return reason;
+        }
+
+        strncpy(info->driver, final_driver, 63);
+    }
+    else
+    {
+        strncpy(info->driver, "None", 63);
+    }
+
+    // Fill common fields
+    strncpy(info->syspath, dev->syspath, 255);
+    strncpy(info->vidpid, vidpid, 31);
+    strncpy(info->subsystem, subsystem, 15);
+    info->subsystem[15] = '\0';
+
+    // Listed, but the daemon never hands it to Auto-Find
+    if (explain && !reason && is_mass_storage(dev))
+        reason = MC_REASON_MASS_STORAGE;
+    return reason;
+}
+
+/* One pass over the enumerated buses; cb gets the reason (explain) or only listed devices */
+static int walk_devices(const mc_ctx_t *ctx, bool explain, mc_device_cb cb, mc_explain_cb explain_cb, void *user)
+{
+    ctx = ctx_or_default(ctx);
+
+    int total = 0;
+    char **paths = collect_device_paths(ctx, &total);
+
+    int count = 0;
+    for (int p = 0; p < total; p++)
+    {
+        struct sysdev dev;
+        if (sysdev_open(ctx, &dev, paths[p]) != 0)
+            continue;
+
+        mc_device_explain_t e;
+        int reason = describe_device(&dev, explain, &e.info);
+        if (reason < 0 || (!explain && MC_REASON_HIDDEN(reason)))
+            continue;
+        e.reason = reason;
+
+        count++;
+        if (explain ? explain_cb(&e, user) : cb(&e.info, user))
+            break;
+    }
+
+    for (int p = 0; p < total; p++)
+        free(paths[p]);
+    free(paths);
+
+    return count;
+}
+
+/* WALK ALL DEVICES (Multi-Bus Support) */
+/* Calls cb once per visible device; a non-zero return from cb stops the walk. */
+/* Returns the number of devices passed to cb. */
+int mc_ctx_foreach_device(const mc_ctx_t *ctx, mc_device_cb cb, void *user)
+{
+    if (!cb)
+        return 0;
+    return walk_devices(ctx, false, cb, NULL, user);
+}
+
+/* FILTER EXPLAIN */
+/* Every enumerated device, listed or hidden, with the MC_REASON_* code deciding it. */
+int mc_ctx_foreach_device_explained(const mc_ctx_t *ctx, mc_explain_cb cb, void *user)
+{
+    if (!cb)
+        return 0;
+    return walk_devices(ctx, true, NULL, cb, user);
+}
+
+struct explain_devices_ctx
+{
+    mc_device_explain_t *out;
+    int max;
+    int count;
+};
+
+static int explain_devices_cb(const mc_device_explain_t *e, void *user)
+{
+    struct explain_devices_ctx *ctx = user;
+    ctx->out[ctx->count++] = *e;
+    return ctx->count >= ctx->max;
+}
+
+int mc_ctx_explain_devices(const mc_ctx_t *ctx, mc_device_explain_t *out, int max)
+{
+    struct explain_devices_ctx list = { out, max, 0 };
+    if (!out || max <= 0)
+        return 0;
+
+    mc_ctx_foreach_device_explained(ctx, explain_devices_cb, &list);
+    return list.count;
+}
+
+/* Machine-readable name of a reason code ("bridge", "usb_hub"...) */
+const char *mc_reason_name(int reason)
+{
+    static const char *const names[] = {
+        [MC_REASON_SHOWN] = "shown",
+        [MC_REASON_MASS_STORAGE] = "mass_storage",
+        [MC_REASON_PCI_BRIDGE] = "bridge",
+        [MC_REASON_PCI_SMBUS] = "smbus",
+        [MC_REASON_PCI_SYSTEM_PERIPHERAL] = "system_peripheral",
+        [MC_REASON_PCI_INFRA_DRIVER] = "infra_driver",
+        [MC_REASON_SCSI_HOST] = "scsi_host",
+        [MC_REASON_SCSI_NO_IDENTITY] = "scsi_no_identity",
+        [MC_REASON_USB_DEVICE] = "usb_device",
+        [MC_REASON_USB_HUB] = "usb_hub",
+        [MC_REASON_USB_HCD] = "hcd",
+        [MC_REASON_USB_NO_PARENT] = "usb_no_parent",
+    };
+    if (reason < 0 || reason >= (int)(sizeof(names) / sizeof(names[0])) || !names[reason])
+        return "unknown";
+    return names[reason];
+}
+
+struct list_devices_ctx
+{
+    mc_device_info_t *out;
+    int max;
+    int count;
+};
+
+static int list_devices_cb(const mc_device_info_t *info, void *user)
+{
+    struct list_devices_ctx *ctx = user;
+    if (ctx->count >= ctx->max)
+        return 1;
+
+    ctx->out[ctx->count++] = *info;
+    return ctx->count >= ctx->max;
+}
+
+/* LIST ALL DEVICES (Multi-Bus Support) */
+int mc_ctx_list_all_devices(const mc_ctx_t *ctx, mc_device_info_t *out, int max)
+{
+    struct list_devices_ctx list = { out, max, 0 };
+    if (!out || max <= 0)
+        return 0;
+
+    mc_ctx_foreach_device(ctx, list_devices_cb, &list);
+    return list.count;
+}
+
+
+/* CHECK IF MODULE HAS HOLDERS */
+// Returns 1 if /sys/module/<name>/holders is NOT empty (module is a dependency).
+// Returns 0 if empty (independent module).
+int mc_ctx_module_has_holders(const mc_ctx_t *ctx, const char *module)
+{
+    char path[1024];
+    if (mc_path(ctx_or_default(ctx), path, sizeof(path), "/sys/module/%s/holders", module) != 0)
+        return 0;
+
+    DIR *dir = opendir(path);
+    if (!dir)
+    {
+        return 0; // If holders dir doesn't exist, assume no holders (or built-in?)
     }
 
     struct dirent *ent;
@@ -473,11 +1106,12 @@ int mc_module_has_holders(const char *module)
 }
 
 /* CHECK MODULE USE COUNT */
-int mc_get_module_refcount(const char *module)
+int mc_ctx_get_module_refcount(const mc_ctx_t *ctx, const char *module)
 {
     // Check /sys/module/<name>/refcnt
-    char path[256];
-    snprintf(path, sizeof(path), "/sys/module/%s/refcnt", module);
+    char path[1024];
+    if (mc_path(ctx_or_default(ctx), path, sizeof(path), "/sys/module/%s/refcnt", module) != 0)
+        return -1;
 
     FILE *f = fopen(path, "r");
     if (!f)
@@ -496,9 +1130,13 @@ int mc_get_module_refcount(const char *module)
 
 /* LIST LOADED MODULES */
 // Writes null-separated module names to out_buf. Returns count.
-int mc_list_loaded_modules(char *out_buf, int max_size)
+int mc_ctx_list_loaded_modules(const mc_ctx_t *ctx, char *out_buf, int max_size)
 {
-    FILE *f = fopen("/proc/modules", "r");
+    char path[1024];
+    if (mc_path(ctx_or_default(ctx), path, sizeof(path), "/proc/modules") != 0)
+        return 0;
+
+    FILE *f = fopen(path, "r");
     if (!f)
     {
         return 0;
@@ -531,6 +1169,360 @@ int mc_list_loaded_modules(char *out_buf, int max_size)
     return count;
 }
 
+/*
+ * MODULE GRAPH
+ * One read of /proc/modules gives us every loaded module, its refcount and
+ * its "used by" list. We keep that as an adjacency list indexed by a small
+ * open-addressing hash table so per-module queries don't touch sysfs.
+ */
+struct mc_modnode
+{
+    char name[MC_MODULE_NAME_MAX];
+    unsigned long size;   // core text+data in bytes, what an unload gives back
+    int refcnt;
+    char state[MC_MODULE_STATE_MAX];   // "Live", "Loading", "Unloading"
+    char taint[MC_MODULE_STATE_MAX];   // flags without the parentheses, "" when clean
+    int holders_off;  // into edges[], modules that use this one
+    int holders_cnt;
+    int deps_off;     // into edges[], modules this one uses
+    int deps_cnt;
+};
+
+struct mc_modgraph
+{
+    struct mc_modnode *nodes;
+    int count;
+    int *edges;
+    int *slots;       // hash table of node index + 1, 0 = empty
+    unsigned int mask;
+};
+
+static unsigned int modgraph_hash(const char *s)
+{
+    unsigned int h = 2166136261u;
+    while (*s)
+    {
+        h ^= (unsigned char)*s++;
+        h *= 16777619u;
+    }
+    return h;
+}
+
+int mc_modgraph_find(const mc_modgraph_t *g, const char *module)
+{
+    if (!g || !module || !g->slots)
+        return -1;
+
+    unsigned int i = modgraph_hash(module) & g->mask;
+    while (g->slots[i])
+    {
+        int idx = g->slots[i] - 1;
+        if (strcmp(g->nodes[idx].name, module) == 0)
+            return idx;
+        i = (i + 1) & g->mask;
+    }
+    return -1;
+}
+
+static void modgraph_insert(mc_modgraph_t *g, int idx)
+{
+    unsigned int i = modgraph_hash(g->nodes[idx].name) & g->mask;
+    while (g->slots[i])
+        i = (i + 1) & g->mask;
+    g->slots[i] = idx + 1;
+}
+
+/* BUILD MODULE GRAPH */
+// Returns NULL if /proc/modules can't be read.
+mc_modgraph_t *mc_ctx_modgraph_new(const mc_ctx_t *ctx)
+{
+    char path[1024];
+    if (mc_path(ctx_or_default(ctx), path, sizeof(path), "/proc/modules") != 0)
+        return NULL;
+
+    FILE *f = fopen(path, "r");
+    if (!f)
+        return NULL;
+
+    mc_modgraph_t *g = calloc(1, sizeof(*g));
+    if (!g)
+    {
+        fclose(f);
+        return NULL;
+    }
+
+    /* Pass 1: names, refcounts and raw "used by" fields */
+    int cap = 256;
+    char **used_by = NULL;
+    g->nodes = malloc(cap * sizeof(*g->nodes));
+    used_by = malloc(cap * sizeof(*used_by));
+    if (!g->nodes || !used_by)
+        goto fail;
+
+    char *line = NULL;
+    size_t line_cap = 0;
+    int total_edges = 0;
+
+    while (getline(&line, &line_cap, f) != -1)
+    {
+        char name[MC_MODULE_NAME_MAX];
+        unsigned long size;
+        int refcnt;
+        char users[4096];
+        char state[MC_MODULE_STATE_MAX];
+        char taint[MC_MODULE_STATE_MAX];
+
+        /* name size refcount users state address [(taint)] */
+        int n = sscanf(line, "%63s %lu %d %4095s %15s %*s %15s", name, &size, &refcnt, users, state, taint);
+        if (n < 1)
+            continue;
+
+        if (g->count == cap)
+        {
+            cap *= 2;
+            struct mc_modnode *nn = realloc(g->nodes, cap * sizeof(*g->nodes));
+            char **nu = realloc(used_by, cap * sizeof(*used_by));
+            if (nn)
+                g->nodes = nn;
+            if (nu)
+                used_by = nu;
+            if (!nn || !nu)
+            {
+                free(line);
+                goto fail;
+            }
+        }
+
+        struct mc_modnode *node = &g->nodes[g->count];
+        memset(node, 0, sizeof(*node));
+        strcpy(node->name, name);
+        node->size = (n >= 2) ? size : 0;
+        node->refcnt = (n >= 3) ? refcnt : -1;
+        if (n >= 5)
+            strcpy(node->state, state);
+        if (n >= 6 && taint[0] == '(')
+        {
+            size_t len = strcspn(taint + 1, ")");
+            memcpy(node->taint, taint + 1, len);
+            node->taint[len] = '\0';
+        }
+
+        used_by[g->count] = NULL;
+        if (n >= 4 && strcmp(users, "-") != 0)
+        {
+            used_by[g->count] = strdup(users);
+            for (const char *c = users; *c; c++)
+            {
+                if (*c == ',')
+                    total_edges++;
+            }
+            total_edges++; // last entry may lack a trailing comma
+        }
+        g->count++;
+    }
+    free(line);
+    fclose(f);
+    f = NULL;
+
+    /* Hash table sized to a power of two, at most half full */
+    unsigned int size = 16;
+    while (size < (unsigned int)g->count * 2)
+        size <<= 1;
+    g->mask = size - 1;
+    g->slots = calloc(size, sizeof(*g->slots));
+    /* Each edge appears once as a holder and once as a dependency */
+    g->edges = malloc((total_edges * 2 + 1) * sizeof(*g->edges));
+    if (!g->slots || !g->edges)
+        goto fail;
+
+    for (int i = 0; i < g->count; i++)
+        modgraph_insert(g, i);
+
+    /* Pass 2: resolve holders, counting dependencies as we go */
+    int pos = 0;
+    for (int i = 0; i < g->count; i++)
+    {
+        g->nodes[i].holders_off = pos;
+        if (!used_by[i])
+            continue;
+
+        char *save = NULL;
+        for (char *tok = strtok_r(used_by[i], ",", &save); tok; tok = strtok_r(NULL, ",", &save))
+        {
+            int h = mc_modgraph_find(g, tok);
+            if (h < 0)
+                continue; // "[permanent]" and friends
+            g->edges[pos++] = h;
+            g->nodes[i].holders_cnt++;
+            g->nodes[h].deps_cnt++;
+        }
+    }
+
+    /* Pass 3: invert holders into dependency lists */
+    for (int i = 0; i < g->count; i++)
+    {
+        g->nodes[i].deps_off = pos;
+        pos += g->nodes[i].deps_cnt;
+        g->nodes[i].deps_cnt = 0;
+    }
+    for (int i = 0; i < g->count; i++)
+    {
+        struct mc_modnode *node = &g->nodes[i];
+        for (int k = 0; k < node->holders_cnt; k++)
+        {
+            struct mc_modnode *holder = &g->nodes[g->edges[node->holders_off + k]];
+            g->edges[holder->deps_off + holder->deps_cnt++] = i;
+        }
+    }
+
+    for (int i = 0; i < g->count; i++)
+        free(used_by[i]);
+    free(used_by);
+    return g;
+
+fail:
+    if (f)
+        fclose(f);
+    if (used_by)
+    {
+        for (int i = 0; i < g->count; i++)
+            free(used_by[i]);
+        free(used_by);
+    }
+    mc_modgraph_free(g);
+    return NULL;
+}
+
+void mc_modgraph_free(mc_modgraph_t *g)
+{
+    if (!g)
+        return;
+    free(g->nodes);
+    free(g->edges);
+    free(g->slots);
+    free(g);
+}
+
+int mc_modgraph_count(const mc_modgraph_t *g)
+{
+    return g ? g->count : 0;
+}
+
+const char *mc_modgraph_name(const mc_modgraph_t *g, int idx)
+{
+    if (!g || idx < 0 || idx >= g->count)
+        return NULL;
+    return g->nodes[idx].name;
+}
+
+// Returns -1 if the module is not loaded (built-in or absent).
+int mc_modgraph_refcount(const mc_modgraph_t *g, const char *module)
+{
+    int idx = mc_modgraph_find(g, module);
+    return (idx < 0) ? -1 : g->nodes[idx].refcnt;
+}
+
+// Core size in bytes, -1 if the module is not loaded.
+long mc_modgraph_size(const mc_modgraph_t *g, const char *module)
+{
+    int idx = mc_modgraph_find(g, module);
+    return (idx < 0) ? -1 : (long)g->nodes[idx].size;
+}
+
+// "" when not loaded or the kernel doesn't report it.
+const char *mc_modgraph_state(const mc_modgraph_t *g, const char *module)
+{
+    int idx = mc_modgraph_find(g, module);
+    return (idx < 0) ? "" : g->nodes[idx].state;
+}
+
+const char *mc_modgraph_taint(const mc_modgraph_t *g, const char *module)
+{
+    int idx = mc_modgraph_find(g, module);
+    return (idx < 0) ? "" : g->nodes[idx].taint;
+}
+
+int mc_modgraph_has_holders(const mc_modgraph_t *g, const char *module)
+{
+    int idx = mc_modgraph_find(g, module);
+    return (idx < 0) ? 0 : (g->nodes[idx].holders_cnt > 0);
+}
+
+static int modgraph_copy_names(const mc_modgraph_t *g, int off, int cnt,
+                               char out[][MC_MODULE_NAME_MAX], int max)
+{
+    int n = 0;
+    for (int k = 0; k < cnt && n < max; k++)
+    {
+        strcpy(out[n], g->nodes[g->edges[off + k]].name);
+        n++;
+    }
+    return n;
+}
+
+/* Modules that use <module> (its "used by" list) */
+int mc_modgraph_holders(const mc_modgraph_t *g, const char *module,
+                        char out[][MC_MODULE_NAME_MAX], int max)
+{
+    int idx = mc_modgraph_find(g, module);
+    if (idx < 0)
+        return 0;
+    return modgraph_copy_names(g, g->nodes[idx].holders_off, g->nodes[idx].holders_cnt, out, max);
+}
+
+/* Modules that <module> uses (reverse of the "used by" lists) */
+int mc_modgraph_depends(const mc_modgraph_t *g, const char *module,
+                        char out[][MC_MODULE_NAME_MAX], int max)
+{
+    int idx = mc_modgraph_find(g, module);
+    if (idx < 0)
+        return 0;
+    return modgraph_copy_names(g, g->nodes[idx].deps_off, g->nodes[idx].deps_cnt, out, max);
+}
+
+static int modgraph_visit(const mc_modgraph_t *g, int idx, unsigned char *seen,
+                          char out[][MC_MODULE_NAME_MAX], int max, int n)
+{
+    if (seen[idx])
+        return n;
+    seen[idx] = 1;
+
+    const struct mc_modnode *node = &g->nodes[idx];
+    for (int k = 0; k < node->holders_cnt; k++)
+    {
+        n = modgraph_visit(g, g->edges[node->holders_off + k], seen, out, max, n);
+        if (n < 0)
+            return n;
+    }
+
+    if (n >= max)
+        return -1;
+    strcpy(out[n], node->name);
+    return n + 1;
+}
+
+/*
+ * UNLOAD ORDER
+ * Fills out[] with <module> and everything that (transitively) holds it,
+ * ordered so each module comes before the modules it depends on.
+ * Returns count, 0 if not loaded, -1 if out[] is too small.
+ */
+int mc_modgraph_unload_order(const mc_modgraph_t *g, const char *module,
+                             char out[][MC_MODULE_NAME_MAX], int max)
+{
+    int idx = mc_modgraph_find(g, module);
+    if (idx < 0)
+        return 0;
+
+    unsigned char *seen = calloc(g->count, 1);
+    if (!seen)
+        return -1;
+
+    int n = modgraph_visit(g, idx, seen, out, max, 0);
+    free(seen);
+    return n;
+}
+
 /*
  * Helper: Map module name to driver name
  * Some modules use different names in /sys/bus/.../drivers/
@@ -565,310 +1557,353 @@ static void get_driver_names(const char *module_name, char names[][128], int *co
     }
 }
 
+/* Returns 1 if a /sys/bus/<bus>/drivers/<name> directory has a device symlink */
+static int driver_dir_has_devices(const char *drv_path)
+{
+    DIR *dir = opendir(drv_path);
+    if (!dir)
+        return 0;
+
+    struct dirent *entry;
+    while ((entry = readdir(dir)) != NULL)
+    {
+        if (entry->d_name[0] == '.')
+            continue;
+
+        // Skip special files
+        if (strcmp(entry->d_name, "bind") == 0 ||
+            strcmp(entry->d_name, "unbind") == 0 ||
+            strcmp(entry->d_name, "uevent") == 0 ||
+            strcmp(entry->d_name, "module") == 0 ||
+            strcmp(entry->d_name, "new_id") == 0 ||
+            strcmp(entry->d_name, "remove_id") == 0)
+            continue;
+
+        // Check if it's a symlink (device binding)
+        char full_path[768];
+        snprintf(full_path, sizeof(full_path), "%s/%s", drv_path, entry->d_name);
+
+        struct stat sb;
+        if (lstat(full_path, &sb) == 0 && S_ISLNK(sb.st_mode))
+        {
+            closedir(dir);
+            return 1;
+        }
+    }
+    closedir(dir);
+    return 0;
+}
+
+/* Module names compare with '-' and '_' as the same character */
+static int same_module_name(const char *a, const char *b)
+{
+    for (; *a && *b; a++, b++)
+    {
+        char ca = *a == '-' ? '_' : *a;
+        char cb = *b == '-' ? '_' : *b;
+        if (ca != cb)
+            return 0;
+    }
+    return *a == *b;
+}
+
 /*
- * Check if a driver is currently in use by checking for device bindings.
- * Checks both PCI and USB buses, and tries multiple name variants.
- * Returns 1 if in use, 0 otherwise.
+ * Module owning a /sys/bus/<bus>/drivers/<name> directory: the basename of
+ * its `module` link, or the driver name for drivers without one.
  */
-int mc_driver_is_in_use(const char *driver_name)
+static const char *driver_dir_owner(const char *drv_path, const char *driver, char *buf, size_t len)
+{
+    char link[1100], target[1024];
+    snprintf(link, sizeof(link), "%s/module", drv_path);
+
+    ssize_t n = readlink(link, target, sizeof(target) - 1);
+    if (n == -1)
+        return driver;
+    target[n] = '\0';
+
+    const char *name = strrchr(target, '/');
+    snprintf(buf, len, "%s", name ? name + 1 : target);
+    return buf;
+}
+
+/*
+ * Check if a driver has devices bound to it on any bus (pci, usb, but also
+ * hdaudio, hid, i2c...). A driver directory counts when it is named after
+ * one of the name variants or its `module` link points at the module.
+ * Unlike mc_driver_is_in_use, module holders are not counted. Returns 1 if
+ * bound, 0 otherwise.
+ */
+int mc_ctx_driver_has_bindings(const mc_ctx_t *ctx, const char *driver_name)
 {
     if (!driver_name || driver_name[0] == '\0')
     {
         return 0;
     }
 
+    ctx = ctx_or_default(ctx);
+
     // Get all possible driver name variants
     char driver_names[4][128];
     int name_count = 0;
     get_driver_names(driver_name, driver_names, &name_count, 4);
 
-    // Try each name variant
-    for (int n = 0; n < name_count; n++)
-    {
-        const char *current_name = driver_names[n];
+    char bus_root[1024];
+    if (mc_path(ctx, bus_root, sizeof(bus_root), "/sys/bus") != 0)
+        return 0;
 
-        // Check PCI bus
-        char pci_path[512];
-        snprintf(pci_path, sizeof(pci_path), "/sys/bus/pci/drivers/%s", current_name);
+    DIR *buses = opendir(bus_root);
+    if (!buses)
+        return 0;
 
-        DIR *pci_dir = opendir(pci_path);
-        if (pci_dir)
-        {
-            struct dirent *entry;
-            while ((entry = readdir(pci_dir)) != NULL)
-            {
-                if (entry->d_name[0] == '.')
-                    continue;
-
-                // Skip special files
-                if (strcmp(entry->d_name, "bind") == 0 ||
-                    strcmp(entry->d_name, "unbind") == 0 ||
-                    strcmp(entry->d_name, "uevent") == 0 ||
-                    strcmp(entry->d_name, "module") == 0 ||
-                    strcmp(entry->d_name, "new_id") == 0 ||
-                    strcmp(entry->d_name, "remove_id") == 0)
-                    continue;
-
-                // Check if it's a symlink (device binding)
-                char full_path[768];
-                snprintf(full_path, sizeof(full_path), "%s/%s", pci_path, entry->d_name);
-
-                struct stat sb;
-                if (lstat(full_path, &sb) == 0 && S_ISLNK(sb.st_mode))
-                {
-                    closedir(pci_dir);
-                    return 1;
-                }
-            }
-            closedir(pci_dir);
-        }
+    int bound = 0;
+    struct dirent *bus;
+    while (!bound && (bus = readdir(buses)) != NULL)
+    {
+        if (bus->d_name[0] == '.')
+            continue;
 
-        // Check USB bus
-        char usb_path[512];
-        snprintf(usb_path, sizeof(usb_path), "/sys/bus/usb/drivers/%s", current_name);
+        char drivers_path[1300];
+        snprintf(drivers_path, sizeof(drivers_path), "%s/%s/drivers", bus_root, bus->d_name);
+        DIR *drivers = opendir(drivers_path);
+        if (!drivers)
+            continue;
 
-        DIR *usb_dir = opendir(usb_path);
-        if (usb_dir)
+        struct dirent *drv;
+        while (!bound && (drv = readdir(drivers)) != NULL)
         {
-            struct dirent *entry;
-            while ((entry = readdir(usb_dir)) != NULL)
-            {
-                if (entry->d_name[0] == '.')
-                    continue;
-
-                // Skip special files
-                if (strcmp(entry->d_name, "bind") == 0 ||
-                    strcmp(entry->d_name, "unbind") == 0 ||
-                    strcmp(entry->d_name, "uevent") == 0 ||
-                    strcmp(entry->d_name, "module") == 0 ||
-                    strcmp(entry->d_name, "new_id") == 0 ||
-                    strcmp(entry->d_name, "remove_id") == 0)
-                    continue;
-
-                // Check if it's a symlink (device binding)
-                char full_path[768];
-                snprintf(full_path, sizeof(full_path), "%s/%s", usb_path, entry->d_name);
-
-                struct stat sb;
-                if (lstat(full_path, &sb) == 0 && S_ISLNK(sb.st_mode))
-                {
-                    closedir(usb_dir);
-                    return 1;
-                }
-            }
-            closedir(usb_dir);
-        }
+            if (drv->d_name[0] == '.')
+                continue;
 
-        // Check PCMCIA bus
-        char pcmcia_path[512];
-        snprintf(pcmcia_path, sizeof(pcmcia_path), "/sys/bus/pcmcia/drivers/%s", current_name);
+            int match = 0;
+            for (int n = 0; n < name_count && !match; n++)
+                match = same_module_name(drv->d_name, driver_names[n]);
 
-        DIR *pcmcia_dir = opendir(pcmcia_path);
-        if (pcmcia_dir)
-        {
-            struct dirent *entry;
-            while ((entry = readdir(pcmcia_dir)) != NULL)
-            {
-                if (entry->d_name[0] == '.')
-                    continue;
-
-                // Skip special files
-                if (strcmp(entry->d_name, "bind") == 0 ||
-                    strcmp(entry->d_name, "unbind") == 0 ||
-                    strcmp(entry->d_name, "uevent") == 0 ||
-                    strcmp(entry->d_name, "module") == 0 ||
-                    strcmp(entry->d_name, "new_id") == 0 ||
-                    strcmp(entry->d_name, "remove_id") == 0)
-                    continue;
-
-                // Check if it's a symlink (device binding)
-                char full_path[768];
-                snprintf(full_path, sizeof(full_path), "%s/%s", pcmcia_path, entry->d_name);
-
-                struct stat sb;
-                if (lstat(full_path, &sb) == 0 && S_ISLNK(sb.st_mode))
-                {
-                    closedir(pcmcia_dir);
-                    return 1;
-                }
-            }
-            closedir(pcmcia_dir);
+            char drv_path[1600], owner[128];
+            snprintf(drv_path, sizeof(drv_path), "%s/%s", drivers_path, drv->d_name);
+            if (!match)
+                match = same_module_name(driver_dir_owner(drv_path, drv->d_name, owner, sizeof(owner)),
+                                         driver_name);
+
+            if (match && driver_dir_has_devices(drv_path))
+                bound = 1;
         }
+        closedir(drivers);
     }
+    closedir(buses);
 
-    // Check holders (module dependencies) - use original name
-    char holders_path[512];
-    snprintf(holders_path, sizeof(holders_path), "/sys/module/%s/holders", driver_name);
+    return bound;
+}
 
-    DIR *holders_dir = opendir(holders_path);
-    if (holders_dir)
+/*
+ * Check if a driver is currently in use by checking for device bindings
+ * and module holders. Returns 1 if in use, 0 otherwise.
+ */
+int mc_ctx_driver_is_in_use(const mc_ctx_t *ctx, const char *driver_name)
+{
+    if (!driver_name || driver_name[0] == '\0')
     {
-        struct dirent *entry;
-        int has_holders = 0;
+        return 0;
+    }
 
-        while ((entry = readdir(holders_dir)) != NULL)
-        {
-            if (entry->d_name[0] != '.')
-            {
-                has_holders = 1;
-                break;
-            }
-        }
-        closedir(holders_dir);
+    if (mc_ctx_driver_has_bindings(ctx, driver_name))
+        return 1;
 
-        if (has_holders)
-            return 1; // Has dependent modules
-        
-    }
+    // Check holders (module dependencies) - use original name
+    if (mc_ctx_module_has_holders(ctx, driver_name))
+        return 1; // Has dependent modules
 
     return 0;
 }
 
 /* CHECK IF DEVICE IS INFRASTRUCTURE (bridges, ports, hosts) */
-/* Returns 1 if device is infrastructure that should be hidden, 0 if real endpoint */
-int mc_is_infrastructure_device(const char *syspath, const char *subsystem)
+/* MC_REASON_* hiding an infrastructure device, 0 for a real endpoint */
+static int infrastructure_reason(const struct sysdev *d)
 {
-    if (!syspath || !subsystem)
-        return 0;
+    int reason;
 
-    struct udev *udev = udev_new();
-    if (!udev)
-        return 0;
-
-    struct udev_device *dev = udev_device_new_from_syspath(udev, syspath);
-    if (!dev)
+    /* PCI Infrastructure Filtering (rules.conf: pci-class, driver) */
+    if (strcmp(d->subsystem, "pci") == 0)
     {
-        udev_unref(udev);
-        return 0;
-    }
-
-    /* PCI Infrastructure Filtering */
-    if (strcmp(subsystem, "pci") == 0)
-    {
-        const char *class_str = udev_device_get_sysattr_value(dev, "class");
-        if (class_str)
-        {
-            unsigned int class_code = 0;
-            sscanf(class_str, "0x%x", &class_code);
-            unsigned int base_class = (class_code >> 16) & 0xFF;
-            unsigned int sub_class = (class_code >> 8) & 0xFF;
-
-            /* Filter PCI infrastructure devices */
-            if (base_class == 0x06) // Bridges
-                return 1;
-            if (base_class == 0x0c && sub_class == 0x05) // SMBus
-                return 1;
-            if (base_class == 0x08) // System Peripherals
-                return 1;
-        }
+        char class_str[32];
+        if (sysdev_attr(d, "class", class_str, sizeof(class_str)) &&
+            mc_ctx_rule_match(d->ctx, MC_RULE_PCI_CLASS, class_str, &reason) == 1)
+            return reason;
 
         /* Filter by driver name */
-        char driver_path[1024], driver_target[1024];
-        snprintf(driver_path, sizeof(driver_path), "%s/driver", syspath);
-        ssize_t len = readlink(driver_path, driver_target, sizeof(driver_target) - 1);
-        if (len != -1)
-        {
-            driver_target[len] = '\0';
-            const char *driver_name = strrchr(driver_target, '/');
-            if (!driver_name)
-                return 1;
-
-            driver_name++; // skip '/'
-
-            const char *infra_drivers[] = {
-                "pcieport", "pci_bridge", "pciehp", "pcie_aspm",
-                "pcie_pme", "pcie_edr", "shpchp", "piix4_smbus", NULL};
-            for (int i = 0; infra_drivers[i]; i++)
-            {
-                if (strcmp(driver_name, infra_drivers[i]) == 0)
-                    return 1;
-            }
-        }
+        char driver_name[64];
+        if (sysdev_link_name(d, "driver", driver_name, sizeof(driver_name)) &&
+            mc_ctx_rule_match(d->ctx, MC_RULE_DRIVER, driver_name, &reason) == 1)
+            return reason;
     }
 
-    /* SCSI Infrastructure Filtering */
-    if (strcmp(subsystem, "scsi") == 0)
+    /* SCSI Infrastructure Filtering (rules.conf: scsi-devtype) */
+    if (strcmp(d->subsystem, "scsi") == 0)
     {
-        const char *devtype = udev_device_get_devtype(dev);
-        if (!devtype)
-        {
-            udev_device_unref(dev);
-            udev_unref(udev);
-            return 1;
-        }
-
-        if (strcmp(devtype, "scsi_host") == 0 ||
-            strcmp(devtype, "scsi_target") == 0 ||
-            strcmp(devtype, "scsi_generic") == 0)
-        {
-            udev_device_unref(dev);
-            udev_unref(udev);
-            return 1;
-        }
-
-        const char *model = udev_device_get_sysattr_value(dev, "model");
-        const char *vendor = udev_device_get_sysattr_value(dev, "vendor");
+        if (mc_ctx_rule_match(d->ctx, MC_RULE_SCSI_DEVTYPE, d->devtype, &reason) == 1)
+            return reason;
 
-        if (!model && !vendor)
-        {
-            udev_device_unref(dev);
-            udev_unref(udev);
-            return 1;
-        }
+        char model[128], vendor[64];
+        if (!sysdev_attr(d, "model", model, sizeof(model)) &&
+            !sysdev_attr(d, "vendor", vendor, sizeof(vendor)))
+            return MC_REASON_SCSI_NO_IDENTITY;
     }
 
-    udev_device_unref(dev);
-    udev_unref(udev);
     return 0; // No infra detected
 }
 
-/* CHECK IF DEVICE SHOULD BE EXCLUDED (e.g. Mass Storage) */
-int mc_is_excluded_device(const char *syspath)
+/* Returns 1 if device is infrastructure that should be hidden, 0 if real endpoint */
+int mc_ctx_is_infrastructure_device(const mc_ctx_t *ctx, const char *syspath, const char *subsystem)
 {
-    struct udev *udev = udev_new();
-    if (!udev)
+    if (!syspath || !subsystem)
         return 0;
 
-    struct udev_device *dev = udev_device_new_from_syspath(udev, syspath);
+    ctx = ctx_or_default(ctx);
 
-    if (!dev)
-    {
-        udev_unref(udev);
+    char path[1024];
+    struct sysdev dev;
+    if (mc_rooted(ctx, path, sizeof(path), syspath) != 0 || sysdev_open(ctx, &dev, path) != 0)
         return 0;
-    }
 
+    /* Callers pass the subsystem they already know */
+    snprintf(dev.subsystem, sizeof(dev.subsystem), "%s", subsystem);
+    return infrastructure_reason(&dev) != 0;
+}
+
+/* USB mass storage (usb-class rule, 08) on the device, the interface or its parent */
+static bool is_mass_storage(const struct sysdev *dev)
+{
     /* Check 1: bDeviceClass on device itself (rare for USB devices, usually 00) */
-    const char *dclass = udev_device_get_sysattr_value(dev, "bDeviceClass");
-    if (dclass && strcmp(dclass, "08") == 0)
-    {
-        udev_device_unref(dev);
-        udev_unref(udev);
-        return 1;
-    }
+    if (usb_class_reason(dev, "bDeviceClass") == MC_REASON_MASS_STORAGE)
+        return true;
 
     /* Check 2: bInterfaceClass on the interface (syspath points to interface) */
-    const char *iclass = udev_device_get_sysattr_value(dev, "bInterfaceClass");
-    if (iclass && strcmp(iclass, "08") == 0)
-    {
-        udev_device_unref(dev);
-        udev_unref(udev);
-        return 1;
-    }
+    if (usb_class_reason(dev, "bInterfaceClass") == MC_REASON_MASS_STORAGE)
+        return true;
 
     /* Check 3: Walk up to parent to check device class if interface didn't match */
-    struct udev_device *parent = udev_device_get_parent_with_subsystem_devtype(dev, "usb", "usb_device");
-    if (parent)
+    struct sysdev parent;
+    if (sysdev_parent_with(dev, "usb", "usb_device", &parent) == 0)
     {
-        const char *pclass = udev_device_get_sysattr_value(parent, "bDeviceClass");
-        if (pclass && strcmp(pclass, "08") == 0)
-        {
-            udev_device_unref(dev);
-            udev_unref(udev);
-            return 1;
-        }
+        if (usb_class_reason(&parent, "bDeviceClass") == MC_REASON_MASS_STORAGE)
+            return true;
     }
 
-    udev_device_unref(dev);
-    udev_unref(udev);
-    return 0;
+    return false;
+}
+
+/* CHECK IF DEVICE SHOULD BE EXCLUDED (e.g. Mass Storage) */
+int mc_ctx_is_excluded_device(const mc_ctx_t *ctx, const char *syspath)
+{
+    if (!syspath)
+        return 0;
+
+    ctx = ctx_or_default(ctx);
+
+    char path[1024];
+    struct sysdev dev;
+    if (mc_rooted(ctx, path, sizeof(path), syspath) != 0 || sysdev_open(ctx, &dev, path) != 0)
+        return 0;
+
+    return is_mass_storage(&dev);
+}
+
+/*
+ * LEGACY API
+ * The original entry points, bound to the default context. Safe to call
+ * from several threads, even while mc_set_root() swaps the root: each call
+ * works against the context it picked up, old or new. A replaced default
+ * context is deliberately leaked (one small allocation per mc_set_root()),
+ * since a call still running may hold it and there is no reference count.
+ */
+void mc_get_ids(const char *syspath, char *vendor, char *product)
+{
+    mc_ctx_get_ids(NULL, syspath, vendor, product);
+}
+
+int mc_list_candidate_drivers(char out[][128], int max)
+{
+    return mc_ctx_list_candidate_drivers(NULL, out, max);
+}
+
+/* Result lives in a per-thread buffer, valid until the thread's next call */
+const char *mc_get_device_subsystem(const char *syspath)
+{
+    static __thread char subsystem[32];
+    mc_ctx_get_device_subsystem(NULL, syspath, subsystem, sizeof(subsystem));
+    return subsystem;
+}
+
+int mc_dev_has_driver(const char *syspath)
+{
+    return mc_ctx_dev_has_driver(NULL, syspath);
+}
+
+int mc_probe_bind(const char *syspath, const char *driver)
+{
+    return mc_ctx_probe_bind(NULL, syspath, driver);
+}
+
+int mc_unbind_device(const char *syspath)
+{
+    return mc_ctx_unbind_device(NULL, syspath);
+}
+
+int mc_foreach_device(mc_device_cb cb, void *user)
+{
+    return mc_ctx_foreach_device(NULL, cb, user);
+}
+
+int mc_foreach_device_explained(mc_explain_cb cb, void *user)
+{
+    return mc_ctx_foreach_device_explained(NULL, cb, user);
+}
+
+int mc_explain_devices(mc_device_explain_t *out, int max)
+{
+    return mc_ctx_explain_devices(NULL, out, max);
+}
+
+int mc_list_all_devices(mc_device_info_t *out, int max)
+{
+    return mc_ctx_list_all_devices(NULL, out, max);
+}
+
+int mc_module_has_holders(const char *module)
+{
+    return mc_ctx_module_has_holders(NULL, module);
+}
+
+int mc_get_module_refcount(const char *module)
+{
+    return mc_ctx_get_module_refcount(NULL, module);
+}
+
+int mc_list_loaded_modules(char *out_buf, int max_size)
+{
+    return mc_ctx_list_loaded_modules(NULL, out_buf, max_size);
+}
+
+mc_modgraph_t *mc_modgraph_new(void)
+{
+    return mc_ctx_modgraph_new(NULL);
+}
+
+int mc_driver_has_bindings(const char *driver_name)
+{
+    return mc_ctx_driver_has_bindings(NULL, driver_name);
+}
+
+int mc_driver_is_in_use(const char *driver_name)
+{
+    return mc_ctx_driver_is_in_use(NULL, driver_name);
+}
+
+int mc_is_infrastructure_device(const char *syspath, const char *subsystem)
+{
+    return mc_ctx_is_infrastructure_device(NULL, syspath, subsystem);
+}
+
+int mc_is_excluded_device(const char *syspath)
+{
+    return mc_ctx_is_excluded_device(NULL, syspath);
 }
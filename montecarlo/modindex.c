@@ -0,0 +1,965 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <stdint.h>
+#include <stdbool.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <fnmatch.h>
+#include <limits.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <sys/utsname.h>
+#include <dirent.h>
+
+#include "heads/libmontecarlo.h"
+#include "heads/modindex.h"
+
+/*
+ * MODULE INDEX
+ * Builds the binary index described in heads/modindex.h from the depmod
+ * output of one kernel (modules.dep, modules.builtin, modules.alias) and
+ * maps it read-only for lookups. Nothing is copied out of the mapping:
+ * names and patterns returned by the accessors point into it and stay
+ * valid until mc_modindex_close().
+ */
+
+#define MODINFO_BUF (64 * 1024)
+
+struct mc_modindex
+{
+    unsigned char *map;
+    size_t size;
+    const struct mc_modindex_header *hdr;
+    const struct mc_modindex_module *mods;
+    const struct mc_modindex_alias *aliases;
+    const uint32_t *deps;
+    const uint32_t *wild;
+    const char *strings;
+};
+
+/* Kernel release of the context's tree (proc/sys/kernel/osrelease, else uname) */
+int mc_ctx_kernel_release(const mc_ctx_t *ctx, char *buf, size_t len)
+{
+    const char *root = mc_ctx_root(ctx);
+    if (root[0])
+    {
+        char path[PATH_MAX + 64];
+        snprintf(path, sizeof(path), "%s/proc/sys/kernel/osrelease", root);
+        if (mc_read_sysattr(path, buf, len) && buf[0])
+            return 0;
+    }
+
+    struct utsname u;
+    if (uname(&u) != 0)
+        return -1;
+    return snprintf(buf, len, "%s", u.release) < (int)len ? 0 : -1;
+}
+
+/* Default index path for a kernel (NULL = the tree's kernel) */
+int mc_ctx_modindex_path(const mc_ctx_t *ctx, const char *kernel, char *buf, size_t len)
+{
+    char kver[64];
+    if (!kernel)
+    {
+        if (mc_ctx_kernel_release(ctx, kver, sizeof(kver)) != 0)
+            return -1;
+        kernel = kver;
+    }
+    int n = snprintf(buf, len, "%s%s/modindex-%s.bin", mc_ctx_root(ctx), MC_MODINDEX_DIR, kernel);
+    return (n < 0 || (size_t)n >= len) ? -1 : 0;
+}
+
+static int64_t file_mtime(const char *path)
+{
+    struct stat st;
+    return stat(path, &st) == 0 ? (int64_t)st.st_mtime : 0;
+}
+
+/* ---------------- BUILD ---------------- */
+
+/* mkdir -p */
+static int make_dirs(char *path)
+{
+    for (char *p = path + 1; *p; p++)
+    {
+        if (*p != '/')
+            continue;
+        *p = '\0';
+        int r = mkdir(path, 0755);
+        *p = '/';
+        if (r != 0 && errno != EEXIST)
+            return -1;
+    }
+    return (mkdir(path, 0755) == 0 || errno == EEXIST) ? 0 : -1;
+}
+
+struct strtab
+{
+    char *data;
+    size_t len;
+    size_t cap;
+    bool failed;
+};
+
+static uint32_t strtab_add(struct strtab *t, const char *s)
+{
+    if (!s || !s[0])
+        return 0;
+
+    size_t n = strlen(s) + 1;
+    if (t->len + n > t->cap)
+    {
+        size_t cap = t->cap ? t->cap * 2 : 65536;
+        while (cap < t->len + n)
+            cap *= 2;
+        char *data = realloc(t->data, cap);
+        if (!data)
+        {
+            t->failed = true;
+            return 0;
+        }
+        t->data = data;
+        t->cap = cap;
+    }
+    memcpy(t->data + t->len, s, n);
+    uint32_t off = (uint32_t)t->len;
+    t->len += n;
+    return off;
+}
+
+struct build_module
+{
+    char *name;
+    char *path;
+    char *description;
+    char **deps;            // module names
+    int dep_count;
+    uint32_t flags;
+    uint32_t final;         // position after sorting
+};
+
+struct build_alias
+{
+    char *pattern;
+    int module;             // build index
+};
+
+struct builder
+{
+    struct build_module *mods;
+    int mod_count, mod_cap;
+    struct build_alias *aliases;
+    int alias_count, alias_cap;
+    int *hash;              // open addressing: build index + 1, 0 = empty
+    unsigned int hash_size;
+};
+
+static unsigned int name_hash(const char *s)
+{
+    unsigned int h = 5381;
+    while (*s)
+        h = h * 33 + (unsigned char)*s++;
+    return h;
+}
+
+/* "kernel/drivers/usb/usb-storage.ko.zst" -> "usb_storage" */
+static void module_name_from_path(const char *path, char *buf, size_t len)
+{
+    const char *base = strrchr(path, '/');
+    base = base ? base + 1 : path;
+    snprintf(buf, len, "%s", base);
+
+    char *ko = strstr(buf, ".ko");
+    if (ko)
+        *ko = '\0';
+    for (char *c = buf; *c; c++)
+        if (*c == '-')
+            *c = '_';
+}
+
+static int builder_find(const struct builder *b, const char *name)
+{
+    if (!b->hash_size)
+        return -1;
+    unsigned int h = name_hash(name) & (b->hash_size - 1);
+    while (b->hash[h])
+    {
+        int idx = b->hash[h] - 1;
+        if (strcmp(b->mods[idx].name, name) == 0)
+            return idx;
+        h = (h + 1) & (b->hash_size - 1);
+    }
+    return -1;
+}
+
+static int builder_rehash(struct builder *b, unsigned int size)
+{
+    int *hash = calloc(size, sizeof(int));
+    if (!hash)
+        return -1;
+    free(b->hash);
+    b->hash = hash;
+    b->hash_size = size;
+    for (int i = 0; i < b->mod_count; i++)
+    {
+        unsigned int h = name_hash(b->mods[i].name) & (size - 1);
+        while (hash[h])
+            h = (h + 1) & (size - 1);
+        hash[h] = i + 1;
+    }
+    return 0;
+}
+
+/* Index of `name`, added (with no file) if new. -1 on allocation failure. */
+static int builder_module(struct builder *b, const char *name)
+{
+    int idx = builder_find(b, name);
+    if (idx >= 0)
+        return idx;
+
+    if (b->mod_count == b->mod_cap)
+    {
+        int cap = b->mod_cap ? b->mod_cap * 2 : 1024;
+        struct build_module *mods = realloc(b->mods, cap * sizeof(*mods));
+        if (!mods)
+            return -1;
+        b->mods = mods;
+        b->mod_cap = cap;
+    }
+    // Keep the table at most half full
+    if ((unsigned int)(b->mod_count + 1) * 2 > b->hash_size &&
+        builder_rehash(b, b->hash_size ? b->hash_size * 2 : 2048) != 0)
+        return -1;
+
+    idx = b->mod_count++;
+    memset(&b->mods[idx], 0, sizeof(b->mods[idx]));
+    b->mods[idx].name = strdup(name);
+
+    unsigned int h = name_hash(name) & (b->hash_size - 1);
+    while (b->hash[h])
+        h = (h + 1) & (b->hash_size - 1);
+    b->hash[h] = idx + 1;
+    return b->mods[idx].name ? idx : -1;
+}
+
+static void builder_free(struct builder *b)
+{
+    for (int i = 0; i < b->mod_count; i++)
+    {
+        free(b->mods[i].name);
+        free(b->mods[i].path);
+        free(b->mods[i].description);
+        for (int d = 0; d < b->mods[i].dep_count; d++)
+            free(b->mods[i].deps[d]);
+        free(b->mods[i].deps);
+    }
+    for (int i = 0; i < b->alias_count; i++)
+        free(b->aliases[i].pattern);
+    free(b->mods);
+    free(b->aliases);
+    free(b->hash);
+}
+
+/* modules.dep: "<path>: <dep path> <dep path>..." */
+static int read_modules_dep(struct builder *b, const char *path)
+{
+    FILE *f = fopen(path, "r");
+    if (!f)
+        return -1;
+
+    char *line = NULL;
+    size_t cap = 0;
+    while (getline(&line, &cap, f) > 0)
+    {
+        line[strcspn(line, "\n")] = '\0';
+        char *colon = strchr(line, ':');
+        if (!colon)
+            continue;
+        *colon = '\0';
+
+        char name[MC_MODULE_NAME_MAX];
+        module_name_from_path(line, name, sizeof(name));
+        int idx = builder_module(b, name);
+        if (idx < 0)
+            break;
+
+        struct build_module *m = &b->mods[idx];
+        free(m->path);
+        m->path = strdup(line);
+
+        char *save = NULL;
+        for (char *tok = strtok_r(colon + 1, " \t", &save); tok; tok = strtok_r(NULL, " \t", &save))
+        {
+            char **deps = realloc(m->deps, (m->dep_count + 1) * sizeof(char *));
+            if (!deps)
+                break;
+            m->deps = deps;
+            module_name_from_path(tok, name, sizeof(name));
+            m->deps[m->dep_count++] = strdup(name);
+        }
+    }
+    free(line);
+    fclose(f);
+    return 0;
+}
+
+/* modules.builtin: one path per line, no file on disk */
+static void read_modules_builtin(struct builder *b, const char *path)
+{
+    FILE *f = fopen(path, "r");
+    if (!f)
+        return;
+
+    char line[PATH_MAX];
+    while (fgets(line, sizeof(line), f))
+    {
+        line[strcspn(line, "\n")] = '\0';
+        if (!line[0])
+            continue;
+
+        char name[MC_MODULE_NAME_MAX];
+        module_name_from_path(line, name, sizeof(name));
+        int idx = builder_module(b, name);
+        if (idx < 0)
+            break;
+        b->mods[idx].flags |= MC_MODINDEX_BUILTIN;
+    }
+    fclose(f);
+}
+
+static int builder_alias(struct builder *b, const char *pattern, int module)
+{
+    if (b->alias_count == b->alias_cap)
+    {
+        int cap = b->alias_cap ? b->alias_cap * 2 : 4096;
+        struct build_alias *aliases = realloc(b->aliases, cap * sizeof(*aliases));
+        if (!aliases)
+            return -1;
+        b->aliases = aliases;
+        b->alias_cap = cap;
+    }
+    b->aliases[b->alias_count].pattern = strdup(pattern);
+    b->aliases[b->alias_count].module = module;
+    b->alias_count++;
+    return 0;
+}
+
+/* modules.alias: "alias <pattern> <module>" */
+static int read_modules_alias(struct builder *b, const char *path)
+{
+    FILE *f = fopen(path, "r");
+    if (!f)
+        return -1;
+
+    char line[1024];
+    while (fgets(line, sizeof(line), f))
+    {
+        char pattern[768], module[MC_MODULE_NAME_MAX];
+        if (sscanf(line, "alias %767s %63s", pattern, module) != 2)
+            continue;
+
+        for (char *c = module; *c; c++)
+            if (*c == '-')
+                *c = '_';
+
+        int idx = builder_module(b, module);
+        if (idx < 0 || builder_alias(b, pattern, idx) != 0)
+            break;
+    }
+    fclose(f);
+    return 0;
+}
+
+static bool is_module_file(const char *name)
+{
+    const char *ko = strstr(name, ".ko");
+    return ko && (strcmp(ko, ".ko") == 0 || strcmp(ko, ".ko.xz") == 0 || strcmp(ko, ".ko.zst") == 0);
+}
+
+/*
+ * Take description from the module's own .modinfo. Modules depmod has not
+ * seen yet (fresh DKMS or updates/ builds) also get their aliases and
+ * dependencies from there.
+ */
+static void apply_modinfo(struct builder *b, int idx, const char *file, char *info, size_t info_len)
+{
+    int len = mc_modinfo_read(file, info, info_len);
+    if (len < 0)
+        return;
+    if ((size_t)len > info_len)
+        len = info_len;
+
+    struct build_module *m = &b->mods[idx];
+    const char *desc = mc_modinfo_next(info, len, "description", NULL);
+    if (desc && !m->description)
+        m->description = strndup(desc, info + len - desc);
+
+    if (!(m->flags & MC_MODINDEX_UNLISTED))
+        return;
+
+    for (const char *a = mc_modinfo_next(info, len, "alias", NULL); a; a = mc_modinfo_next(info, len, "alias", a))
+        if (builder_alias(b, a, idx) != 0)
+            return;
+
+    const char *deps = mc_modinfo_next(info, len, "depends", NULL);
+    if (!deps || !deps[0])
+        return;
+
+    char list[1024];
+    snprintf(list, sizeof(list), "%.*s", (int)strnlen(deps, info + len - deps), deps);
+    char *save = NULL;
+    for (char *tok = strtok_r(list, ",", &save); tok; tok = strtok_r(NULL, ",", &save))
+    {
+        char **grown = realloc(m->deps, (m->dep_count + 1) * sizeof(char *));
+        if (!grown)
+            return;
+        m->deps = grown;
+        for (char *c = tok; *c; c++)
+            if (*c == '-')
+                *c = '_';
+        m->deps[m->dep_count++] = strdup(tok);
+    }
+}
+
+/* Walk /lib/modules/<kernel>/<rel> for module files */
+static void scan_module_files(struct builder *b, const char *base, const char *rel,
+                              char *info, size_t info_len, int depth)
+{
+    char dir[PATH_MAX];
+    snprintf(dir, sizeof(dir), "%s/%s", base, rel);
+    DIR *d = opendir(dir);
+    if (!d)
+        return;
+
+    struct dirent *e;
+    while ((e = readdir(d)))
+    {
+        if (e->d_name[0] == '.')
+            continue;
+
+        char sub[PATH_MAX];
+        if (snprintf(sub, sizeof(sub), "%s%s%s", rel, rel[0] ? "/" : "", e->d_name) >= (int)sizeof(sub))
+            continue;
+
+        bool is_dir = e->d_type == DT_DIR;
+        if (e->d_type == DT_UNKNOWN)
+        {
+            struct stat st;
+            char full[PATH_MAX * 2];
+            snprintf(full, sizeof(full), "%s/%s", base, sub);
+            is_dir = lstat(full, &st) == 0 && S_ISDIR(st.st_mode);
+        }
+
+        if (is_dir)
+        {
+            // "build" and "source" point back into kernel headers
+            if (depth < 16 && !(depth == 0 && (strcmp(e->d_name, "build") == 0 || strcmp(e->d_name, "source") == 0)))
+                scan_module_files(b, base, sub, info, info_len, depth + 1);
+            continue;
+        }
+        if (!is_module_file(e->d_name))
+            continue;
+
+        char name[MC_MODULE_NAME_MAX];
+        module_name_from_path(e->d_name, name, sizeof(name));
+        int idx = builder_find(b, name);
+        if (idx >= 0 && b->mods[idx].path && strcmp(b->mods[idx].path, sub) != 0)
+            continue;   // depmod picked another copy (updates/ over kernel/)
+
+        if (idx < 0)
+        {
+            idx = builder_module(b, name);
+            if (idx < 0)
+                break;
+            b->mods[idx].flags |= MC_MODINDEX_UNLISTED;
+        }
+        if (!b->mods[idx].path)
+            b->mods[idx].path = strdup(sub);
+
+        char full[PATH_MAX * 2];
+        snprintf(full, sizeof(full), "%s/%s", base, sub);
+        apply_modinfo(b, idx, full, info, info_len);
+    }
+    closedir(d);
+}
+
+static int cmp_module(const void *a, const void *b)
+{
+    return strcmp((*(struct build_module *const *)a)->name, (*(struct build_module *const *)b)->name);
+}
+
+static int cmp_alias(const void *a, const void *b)
+{
+    const struct build_alias *x = a, *y = b;
+    int c = strcmp(x->pattern, y->pattern);
+    return c ? c : x->module - y->module;
+}
+
+/* "acpi*:PNP0C0A:*", "char-major-10-*": no fixed bus prefix to search by */
+static bool wild_bus(const char *pattern)
+{
+    size_t bus = strcspn(pattern, ":");
+    return strcspn(pattern, "*?[") < bus;
+}
+
+static int write_all(FILE *f, const void *data, size_t len)
+{
+    return (len == 0 || fwrite(data, 1, len, f) == len) ? 0 : -1;
+}
+
+static int builder_write(struct builder *b, const char *kernel, int64_t dep_mtime,
+                         int64_t alias_mtime, const char *out_path)
+{
+    int n = b->mod_count;
+    struct build_module **order = malloc((n ? n : 1) * sizeof(*order));
+    struct mc_modindex_module *mods = calloc(n ? n : 1, sizeof(*mods));
+    uint32_t *deps = NULL;
+    uint32_t dep_count = 0;
+    uint32_t *wild = NULL;
+    uint32_t wild_count = 0;
+    struct strtab strings = {0};
+    int ret = -1;
+
+    if (!order || !mods)
+        goto out;
+
+    // Modules sorted by name; remember where each one went
+    for (int i = 0; i < n; i++)
+        order[i] = &b->mods[i];
+    qsort(order, n, sizeof(*order), cmp_module);
+    for (int i = 0; i < n; i++)
+        order[i]->final = i;
+
+    for (int i = 0; i < b->alias_count; i++)
+        b->aliases[i].module = b->mods[b->aliases[i].module].final;
+    qsort(b->aliases, b->alias_count, sizeof(*b->aliases), cmp_alias);
+
+    // Offset 0 is the empty string
+    strings.data = malloc(65536);
+    if (!strings.data)
+        goto out;
+    strings.data[0] = '\0';
+    strings.len = 1;
+    strings.cap = 65536;
+
+    for (int i = 0; i < n; i++)
+    {
+        struct build_module *m = order[i];
+        mods[i].name = strtab_add(&strings, m->name);
+        mods[i].path = strtab_add(&strings, m->path);
+        mods[i].description = strtab_add(&strings, m->description);
+        mods[i].flags = m->flags;
+        mods[i].deps_start = dep_count;
+
+        for (int d = 0; d < m->dep_count; d++)
+        {
+            int dep = builder_find(b, m->deps[d]);
+            if (dep < 0)
+                continue;
+            uint32_t *grown = realloc(deps, (dep_count + 1) * sizeof(uint32_t));
+            if (!grown)
+                goto out;
+            deps = grown;
+            deps[dep_count++] = b->mods[dep].final;
+        }
+        mods[i].deps_count = dep_count - mods[i].deps_start;
+    }
+
+    wild = malloc((b->alias_count ? b->alias_count : 1) * sizeof(*wild));
+    struct mc_modindex_alias *aliases = calloc(b->alias_count ? b->alias_count : 1, sizeof(*aliases));
+    if (!aliases || !wild)
+    {
+        free(aliases);
+        goto out;
+    }
+    for (int i = 0; i < b->alias_count; i++)
+    {
+        aliases[i].pattern = strtab_add(&strings, b->aliases[i].pattern);
+        aliases[i].module = b->aliases[i].module;
+        if (wild_bus(b->aliases[i].pattern))
+            wild[wild_count++] = i;
+    }
+
+    if (strings.failed)
+    {
+        free(aliases);
+        goto out;
+    }
+
+    struct mc_modindex_header hdr;
+    memset(&hdr, 0, sizeof(hdr));
+    memcpy(hdr.magic, MC_MODINDEX_MAGIC, sizeof(hdr.magic));
+    hdr.version = MC_MODINDEX_VERSION;
+    hdr.header_size = sizeof(hdr);
+    snprintf(hdr.kernel, sizeof(hdr.kernel), "%s", kernel);
+    hdr.dep_mtime = dep_mtime;
+    hdr.alias_mtime = alias_mtime;
+    hdr.module_count = n;
+    hdr.modules_off = sizeof(hdr);
+    hdr.alias_count = b->alias_count;
+    hdr.aliases_off = hdr.modules_off + n * sizeof(*mods);
+    hdr.dep_count = dep_count;
+    hdr.deps_off = hdr.aliases_off + b->alias_count * sizeof(*aliases);
+    hdr.wild_count = wild_count;
+    hdr.wild_off = hdr.deps_off + dep_count * sizeof(uint32_t);
+    hdr.strings_size = strings.len;
+    hdr.strings_off = hdr.wild_off + wild_count * sizeof(uint32_t);
+
+    // Write beside the target and rename: readers never see a partial file
+    char tmp[PATH_MAX];
+    snprintf(tmp, sizeof(tmp), "%s.%d.tmp", out_path, (int)getpid());
+    FILE *f = fopen(tmp, "wb");
+    if (!f)
+    {
+        free(aliases);
+        goto out;
+    }
+    int werr = write_all(f, &hdr, sizeof(hdr)) ||
+               write_all(f, mods, n * sizeof(*mods)) ||
+               write_all(f, aliases, b->alias_count * sizeof(*aliases)) ||
+               write_all(f, deps, dep_count * sizeof(uint32_t)) ||
+               write_all(f, wild, wild_count * sizeof(uint32_t)) ||
+               write_all(f, strings.data, strings.len);
+    free(aliases);
+    if (fclose(f) != 0 || werr || rename(tmp, out_path) != 0)
+    {
+        unlink(tmp);
+        goto out;
+    }
+    chmod(out_path, 0644);
+    ret = 0;
+
+out:
+    free(order);
+    free(mods);
+    free(deps);
+    free(wild);
+    free(strings.data);
+    return ret;
+}
+
+/*
+ * BUILD INDEX
+ * kernel NULL = the tree's running kernel, out_path NULL = default path
+ * (the cache directory is created). Returns the number of modules indexed,
+ * or -1 with errno set.
+ */
+int mc_ctx_modindex_build(const mc_ctx_t *ctx, const char *kernel, const char *out_path)
+{
+    char kver[64], base[PATH_MAX], path[PATH_MAX + 32], out[PATH_MAX];
+
+    if (!kernel)
+    {
+        if (mc_ctx_kernel_release(ctx, kver, sizeof(kver)) != 0)
+            return -1;
+        kernel = kver;
+    }
+    snprintf(base, sizeof(base), "%s/lib/modules/%s", mc_ctx_root(ctx), kernel);
+
+    if (!out_path)
+    {
+        char dir[PATH_MAX];
+        snprintf(dir, sizeof(dir), "%s%s", mc_ctx_root(ctx), MC_MODINDEX_DIR);
+        if (make_dirs(dir) != 0)
+            return -1;
+        if (mc_ctx_modindex_path(ctx, kernel, out, sizeof(out)) != 0)
+            return -1;
+        out_path = out;
+    }
+
+    struct builder b;
+    memset(&b, 0, sizeof(b));
+
+    snprintf(path, sizeof(path), "%s/modules.dep", base);
+    int64_t dep_mtime = file_mtime(path);
+    if (read_modules_dep(&b, path) != 0)
+    {
+        builder_free(&b);
+        return -1;
+    }
+
+    snprintf(path, sizeof(path), "%s/modules.builtin", base);
+    read_modules_builtin(&b, path);
+
+    snprintf(path, sizeof(path), "%s/modules.alias", base);
+    int64_t alias_mtime = file_mtime(path);
+    read_modules_alias(&b, path);
+
+    // Every module file on disk, including ones depmod has not indexed yet
+    char *info = malloc(MODINFO_BUF);
+    if (info)
+    {
+        scan_module_files(&b, base, "", info, MODINFO_BUF, 0);
+        free(info);
+    }
+
+    int count = b.mod_count;
+    int ret = builder_write(&b, kernel, dep_mtime, alias_mtime, out_path);
+    int saved = errno;
+    builder_free(&b);
+    errno = saved;
+    return ret == 0 ? count : -1;
+}
+
+/* ---------------- READ ---------------- */
+
+static bool section_ok(size_t size, uint32_t off, uint64_t count, size_t item)
+{
+    return off <= size && count * item <= size - off;
+}
+
+mc_modindex_t *mc_modindex_open(const char *path)
+{
+    int fd = open(path, O_RDONLY | O_CLOEXEC);
+    if (fd < 0)
+        return NULL;
+
+    struct stat st;
+    if (fstat(fd, &st) != 0 || (size_t)st.st_size < sizeof(struct mc_modindex_header))
+    {
+        close(fd);
+        errno = EINVAL;
+        return NULL;
+    }
+
+    void *map = mmap(NULL, st.st_size, PROT_READ, MAP_SHARED, fd, 0);
+    close(fd);
+    if (map == MAP_FAILED)
+        return NULL;
+
+    const struct mc_modindex_header *hdr = map;
+    size_t size = st.st_size;
+    bool ok = memcmp(hdr->magic, MC_MODINDEX_MAGIC, sizeof(hdr->magic)) == 0 &&
+              hdr->version == MC_MODINDEX_VERSION &&
+              hdr->header_size == sizeof(*hdr) &&
+              section_ok(size, hdr->modules_off, hdr->module_count, sizeof(struct mc_modindex_module)) &&
+              section_ok(size, hdr->aliases_off, hdr->alias_count, sizeof(struct mc_modindex_alias)) &&
+              section_ok(size, hdr->deps_off, hdr->dep_count, sizeof(uint32_t)) &&
+              section_ok(size, hdr->wild_off, hdr->wild_count, sizeof(uint32_t)) &&
+              section_ok(size, hdr->strings_off, hdr->strings_size, 1) &&
+              hdr->strings_size > 0 &&
+              ((const char *)map)[hdr->strings_off + hdr->strings_size - 1] == '\0';
+
+    mc_modindex_t *idx = ok ? calloc(1, sizeof(*idx)) : NULL;
+    if (!idx)
+    {
+        munmap(map, size);
+        errno = ok ? ENOMEM : EINVAL;
+        return NULL;
+    }
+
+    idx->map = map;
+    idx->size = size;
+    idx->hdr = hdr;
+    idx->mods = (const void *)(idx->map + hdr->modules_off);
+    idx->aliases = (const void *)(idx->map + hdr->aliases_off);
+    idx->deps = (const void *)(idx->map + hdr->deps_off);
+    idx->wild = (const void *)(idx->map + hdr->wild_off);
+    idx->strings = (const char *)idx->map + hdr->strings_off;
+
+    // String and module references must stay inside their tables
+    for (uint32_t i = 0; i < hdr->module_count && ok; i++)
+    {
+        const struct mc_modindex_module *m = &idx->mods[i];
+        ok = m->name < hdr->strings_size && m->path < hdr->strings_size &&
+             m->description < hdr->strings_size &&
+             (uint64_t)m->deps_start + m->deps_count <= hdr->dep_count;
+    }
+    for (uint32_t i = 0; i < hdr->alias_count && ok; i++)
+        ok = idx->aliases[i].pattern < hdr->strings_size && idx->aliases[i].module < hdr->module_count;
+    for (uint32_t i = 0; i < hdr->dep_count && ok; i++)
+        ok = idx->deps[i] < hdr->module_count;
+    for (uint32_t i = 0; i < hdr->wild_count && ok; i++)
+        ok = idx->wild[i] < hdr->alias_count;
+
+    if (!ok)
+    {
+        mc_modindex_close(idx);
+        errno = EINVAL;
+        return NULL;
+    }
+    return idx;
+}
+
+/* Default index of the tree's kernel; NULL with errno ESTALE if depmod ran since it was built */
+mc_modindex_t *mc_ctx_modindex_open(const mc_ctx_t *ctx)
+{
+    char kver[64], path[PATH_MAX], src[PATH_MAX + 32];
+    if (mc_ctx_kernel_release(ctx, kver, sizeof(kver)) != 0 ||
+        mc_ctx_modindex_path(ctx, kver, path, sizeof(path)) != 0)
+        return NULL;
+
+    mc_modindex_t *idx = mc_modindex_open(path);
+    if (!idx)
+        return NULL;
+
+    snprintf(src, sizeof(src), "%s/lib/modules/%s/modules.dep", mc_ctx_root(ctx), kver);
+    bool fresh = file_mtime(src) == idx->hdr->dep_mtime;
+    snprintf(src, sizeof(src), "%s/lib/modules/%s/modules.alias", mc_ctx_root(ctx), kver);
+    fresh = fresh && file_mtime(src) == idx->hdr->alias_mtime;
+
+    if (!fresh)
+    {
+        mc_modindex_close(idx);
+        errno = ESTALE;
+        return NULL;
+    }
+    return idx;
+}
+
+void mc_modindex_close(mc_modindex_t *idx)
+{
+    if (!idx)
+        return;
+    munmap(idx->map, idx->size);
+    free(idx);
+}
+
+const char *mc_modindex_kernel(const mc_modindex_t *idx)
+{
+    return idx->hdr->kernel;
+}
+
+int mc_modindex_count(const mc_modindex_t *idx)
+{
+    return (int)idx->hdr->module_count;
+}
+
+int mc_modindex_alias_count(const mc_modindex_t *idx)
+{
+    return (int)idx->hdr->alias_count;
+}
+
+static const struct mc_modindex_module *index_module(const mc_modindex_t *idx, int i)
+{
+    if (!idx || i < 0 || (uint32_t)i >= idx->hdr->module_count)
+        return NULL;
+    return &idx->mods[i];
+}
+
+const char *mc_modindex_name(const mc_modindex_t *idx, int i)
+{
+    const struct mc_modindex_module *m = index_module(idx, i);
+    return m ? idx->strings + m->name : NULL;
+}
+
+const char *mc_modindex_path(const mc_modindex_t *idx, int i)
+{
+    const struct mc_modindex_module *m = index_module(idx, i);
+    return m ? idx->strings + m->path : NULL;
+}
+
+const char *mc_modindex_description(const mc_modindex_t *idx, int i)
+{
+    const struct mc_modindex_module *m = index_module(idx, i);
+    return m ? idx->strings + m->description : NULL;
+}
+
+int mc_modindex_flags(const mc_modindex_t *idx, int i)
+{
+    const struct mc_modindex_module *m = index_module(idx, i);
+    return m ? (int)m->flags : -1;
+}
+
+/* Binary search by name ('-' and '_' are the same). Returns the index or -1. */
+int mc_modindex_find(const mc_modindex_t *idx, const char *module)
+{
+    char name[MC_MODULE_NAME_MAX];
+    if (!idx || !module)
+        return -1;
+    snprintf(name, sizeof(name), "%s", module);
+    for (char *c = name; *c; c++)
+        if (*c == '-')
+            *c = '_';
+
+    int lo = 0, hi = (int)idx->hdr->module_count - 1;
+    while (lo <= hi)
+    {
+        int mid = lo + (hi - lo) / 2;
+        int c = strcmp(idx->strings + idx->mods[mid].name, name);
+        if (c == 0)
+            return mid;
+        if (c < 0)
+            lo = mid + 1;
+        else
+            hi = mid - 1;
+    }
+    return -1;
+}
+
+/* Direct dependencies of module i (indices). Returns the total count. */
+int mc_modindex_depends(const mc_modindex_t *idx, int i, int *out, int max)
+{
+    const struct mc_modindex_module *m = index_module(idx, i);
+    if (!m)
+        return -1;
+    for (uint32_t d = 0; d < m->deps_count && (int)d < max; d++)
+        out[d] = (int)idx->deps[m->deps_start + d];
+    return (int)m->deps_count;
+}
+
+/* Add alias a's module to out if its pattern matches and it isn't there yet */
+static void match_alias(const mc_modindex_t *idx, uint32_t a, const char *modalias,
+                        int *out, int max, int *count)
+{
+    if (fnmatch(idx->strings + idx->aliases[a].pattern, modalias, 0) != 0)
+        return;
+
+    int mod = (int)idx->aliases[a].module;
+    for (int k = 0; k < *count && k < max; k++)
+        if (out[k] == mod)
+            return;
+    if (*count < max)
+        out[*count] = mod;
+    (*count)++;
+}
+
+/*
+ * Modules whose alias patterns match `modalias` (indices, no duplicates).
+ * Only the patterns sharing the bus prefix ("usb:", "pci:"...) are tried;
+ * they are contiguous in the sorted table. Patterns with a glob in the bus
+ * part ("acpi*:...") sort elsewhere and are tried from the wild list.
+ * Returns the number found.
+ */
+int mc_modindex_match(const mc_modindex_t *idx, const char *modalias, int *out, int max)
+{
+    if (!idx || !modalias)
+        return 0;
+
+    const char *colon = strchr(modalias, ':');
+    size_t plen = colon ? (size_t)(colon - modalias) + 1 : strlen(modalias);
+
+    // First pattern >= prefix
+    int lo = 0, hi = (int)idx->hdr->alias_count;
+    while (lo < hi)
+    {
+        int mid = lo + (hi - lo) / 2;
+        if (strncmp(idx->strings + idx->aliases[mid].pattern, modalias, plen) < 0)
+            lo = mid + 1;
+        else
+            hi = mid;
+    }
+
+    int count = 0;
+    for (uint32_t a = lo; a < idx->hdr->alias_count; a++)
+    {
+        if (strncmp(idx->strings + idx->aliases[a].pattern, modalias, plen) != 0)
+            break;
+        match_alias(idx, a, modalias, out, max, &count);
+    }
+    for (uint32_t w = 0; w < idx->hdr->wild_count; w++)
+        match_alias(idx, idx->wild[w], modalias, out, max, &count);
+    return count;
+}
+
+/* Pattern and module of alias a, for listing */
+const char *mc_modindex_alias(const mc_modindex_t *idx, int a, int *module)
+{
+    if (!idx || a < 0 || (uint32_t)a >= idx->hdr->alias_count)
+        return NULL;
+    if (module)
+        *module = (int)idx->aliases[a].module;
+    return idx->strings + idx->aliases[a].pattern;
+}
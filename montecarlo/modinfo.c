@@ -0,0 +1,379 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <stdint.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <elf.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+
+#ifdef HAVE_LZMA
+#include <lzma.h>
+#endif
+#ifdef HAVE_ZSTD
+#include <zstd.h>
+#endif
+
+#include "heads/libmontecarlo.h"
+
+/*
+ * MODINFO READER
+ * Extracts the .modinfo section ("key=value\0" strings: description,
+ * alias, depends, firmware, parm...) from a kernel module without
+ * running modinfo. Plain .ko files are mapped and only the ELF headers
+ * and the section itself are touched; .ko.xz and .ko.zst are decompressed
+ * in chunks until the section headers and the section are in the buffer.
+ * The linker puts the section headers at the end of the file, so that is
+ * in practice the whole image.
+ *
+ * Every offset and size comes from the file and is untrusted: spans are
+ * checked as off <= len && size <= len - off, which cannot wrap.
+ */
+
+#define MODINFO_CHUNK (64 * 1024)
+#define MODINFO_MAX_IMAGE (256 * 1024 * 1024)   // refuse anything larger once decompressed
+
+static const unsigned char XZ_MAGIC[] = { 0xFD, '7', 'z', 'X', 'Z', 0x00 };
+static const unsigned char ZSTD_MAGIC[] = { 0x28, 0xB5, 0x2F, 0xFD };
+
+/* Offset/size of section i, from either ELF class. 0 = ok, -1 = out of range */
+static int elf_section(const unsigned char *d, size_t len, int is64, uint64_t shoff,
+                       unsigned shentsize, unsigned i, uint32_t *name, uint64_t *off, uint64_t *size)
+{
+    uint64_t at = shoff + (uint64_t)i * shentsize;
+    if (is64)
+    {
+        Elf64_Shdr sh;
+        if (shentsize < sizeof(sh) || at + sizeof(sh) > len)
+            return -1;
+        memcpy(&sh, d + at, sizeof(sh));
+        *name = sh.sh_name;
+        *off = sh.sh_offset;
+        *size = sh.sh_size;
+    }
+    else
+    {
+        Elf32_Shdr sh;
+        if (shentsize < sizeof(sh) || at + sizeof(sh) > len)
+            return -1;
+        memcpy(&sh, d + at, sizeof(sh));
+        *name = sh.sh_name;
+        *off = sh.sh_offset;
+        *size = sh.sh_size;
+    }
+    return 0;
+}
+
+/* 1 = [off, off + size) lies in the first len bytes, 0 = not yet, -1 = never (past MODINFO_MAX_IMAGE) */
+static int span_in(uint64_t off, uint64_t size, size_t len)
+{
+    if (off <= len && size <= len - off)
+        return 1;
+    return (off > MODINFO_MAX_IMAGE || size > MODINFO_MAX_IMAGE - off) ? -1 : 0;
+}
+
+/*
+ * Find .modinfo in the first `len` bytes of an ELF image.
+ * 1 = found (*off, *size), 0 = need more bytes, -1 = not a module.
+ */
+static int locate_modinfo(const unsigned char *d, size_t len, size_t *off, size_t *size)
+{
+    if (len < EI_NIDENT)
+        return 0;
+    if (memcmp(d, ELFMAG, SELFMAG) != 0 ||
+        (d[EI_CLASS] != ELFCLASS64 && d[EI_CLASS] != ELFCLASS32))
+        return -1;
+
+    int is64 = d[EI_CLASS] == ELFCLASS64;
+    uint64_t shoff;
+    unsigned shnum, shentsize, shstrndx;
+    if (is64)
+    {
+        Elf64_Ehdr eh;
+        if (len < sizeof(eh))
+            return 0;
+        memcpy(&eh, d, sizeof(eh));
+        shoff = eh.e_shoff;
+        shnum = eh.e_shnum;
+        shentsize = eh.e_shentsize;
+        shstrndx = eh.e_shstrndx;
+    }
+    else
+    {
+        Elf32_Ehdr eh;
+        if (len < sizeof(eh))
+            return 0;
+        memcpy(&eh, d, sizeof(eh));
+        shoff = eh.e_shoff;
+        shnum = eh.e_shnum;
+        shentsize = eh.e_shentsize;
+        shstrndx = eh.e_shstrndx;
+    }
+
+    if (shnum == 0 || shstrndx >= shnum || shoff > MODINFO_MAX_IMAGE)
+        return -1;
+    if (shoff + (uint64_t)shnum * shentsize > len)
+        return 0;   // section headers usually come last
+
+    uint32_t name;
+    uint64_t str_off, str_size;
+    if (elf_section(d, len, is64, shoff, shentsize, shstrndx, &name, &str_off, &str_size) != 0)
+        return -1;
+    int fits = span_in(str_off, str_size, len);
+    if (fits != 1)
+        return fits;
+
+    for (unsigned i = 0; i < shnum; i++)
+    {
+        uint64_t s_off, s_size;
+        if (elf_section(d, len, is64, shoff, shentsize, i, &name, &s_off, &s_size) != 0)
+            return -1;
+        if (name >= str_size || sizeof(".modinfo") > str_size - name ||
+            memcmp(d + str_off + name, ".modinfo", sizeof(".modinfo")) != 0)
+            continue;
+        fits = span_in(s_off, s_size, len);
+        if (fits != 1)
+            return fits;
+        *off = s_off;
+        *size = s_size;
+        return 1;
+    }
+    return -1;
+}
+
+/* Copy the section out; returns its full length like snprintf */
+static int copy_section(const unsigned char *d, size_t off, size_t size, char *buf, size_t len)
+{
+    if (size > INT32_MAX)
+    {
+        errno = EFBIG;
+        return -1;
+    }
+    if (len > 0)
+        memcpy(buf, d + off, size < len ? size : len);
+    return (int)size;
+}
+
+struct image
+{
+    unsigned char *data;
+    size_t len;
+    size_t cap;
+};
+
+#if defined(HAVE_LZMA) || defined(HAVE_ZSTD)
+/* Room for one more chunk of output */
+static int image_reserve(struct image *img)
+{
+    if (img->len + MODINFO_CHUNK <= img->cap)
+        return 0;
+    size_t cap = img->cap ? img->cap * 2 : 4 * MODINFO_CHUNK;
+    if (cap > MODINFO_MAX_IMAGE)
+    {
+        errno = EFBIG;
+        return -1;
+    }
+    unsigned char *data = realloc(img->data, cap);
+    if (!data)
+        return -1;
+    img->data = data;
+    img->cap = cap;
+    return 0;
+}
+#endif
+
+#ifdef HAVE_LZMA
+static int inflate_xz(int fd, struct image *img, size_t *off, size_t *size)
+{
+    lzma_stream s = LZMA_STREAM_INIT;
+    if (lzma_stream_decoder(&s, UINT64_MAX, LZMA_CONCATENATED) != LZMA_OK)
+    {
+        errno = ENOMEM;
+        return -1;
+    }
+
+    unsigned char in[MODINFO_CHUNK];
+    lzma_action action = LZMA_RUN;
+    int found = 0;
+    while (found == 0)
+    {
+        if (s.avail_in == 0 && action == LZMA_RUN)
+        {
+            ssize_t n = read(fd, in, sizeof(in));
+            if (n < 0)
+            {
+                found = -1;
+                break;
+            }
+            s.next_in = in;
+            s.avail_in = n;
+            if (n == 0)
+                action = LZMA_FINISH;
+        }
+        if (image_reserve(img) != 0)
+        {
+            found = -1;
+            break;
+        }
+        s.next_out = img->data + img->len;
+        s.avail_out = MODINFO_CHUNK;
+
+        lzma_ret r = lzma_code(&s, action);
+        img->len += MODINFO_CHUNK - s.avail_out;
+        found = locate_modinfo(img->data, img->len, off, size);
+        if (found == 0 && r != LZMA_OK)
+        {
+            errno = r == LZMA_STREAM_END ? ENOEXEC : EINVAL;
+            found = -1;
+        }
+    }
+    lzma_end(&s);
+    return found;
+}
+#endif
+
+#ifdef HAVE_ZSTD
+static int inflate_zstd(int fd, struct image *img, size_t *off, size_t *size)
+{
+    ZSTD_DStream *ds = ZSTD_createDStream();
+    if (!ds)
+    {
+        errno = ENOMEM;
+        return -1;
+    }
+    ZSTD_initDStream(ds);
+
+    unsigned char in[MODINFO_CHUNK];
+    ZSTD_inBuffer ib = { in, 0, 0 };
+    int eof = 0;
+    int found = 0;
+    while (found == 0)
+    {
+        if (ib.pos == ib.size && !eof)
+        {
+            ssize_t n = read(fd, in, sizeof(in));
+            if (n < 0)
+            {
+                found = -1;
+                break;
+            }
+            ib.size = n;
+            ib.pos = 0;
+            eof = n == 0;
+        }
+        if (image_reserve(img) != 0)
+        {
+            found = -1;
+            break;
+        }
+        ZSTD_outBuffer ob = { img->data + img->len, MODINFO_CHUNK, 0 };
+        size_t r = ZSTD_decompressStream(ds, &ob, &ib);
+        img->len += ob.pos;
+        found = locate_modinfo(img->data, img->len, off, size);
+        if (found == 0 && (ZSTD_isError(r) || (eof && ob.pos == 0)))
+        {
+            errno = ZSTD_isError(r) ? EINVAL : ENOEXEC;
+            found = -1;
+        }
+    }
+    ZSTD_freeDStream(ds);
+    return found;
+}
+#endif
+
+/*
+ * .modinfo of the module file at `path` (absolute, not root-prefixed)
+ * copied into buf. Returns the section length (larger than len means
+ * truncated), or -1 with errno set: ENOEXEC not a module, EPROTONOSUPPORT
+ * compressed with a format this build cannot read.
+ */
+int mc_modinfo_read(const char *path, char *buf, size_t len)
+{
+    int fd = open(path, O_RDONLY | O_CLOEXEC);
+    if (fd < 0)
+        return -1;
+
+    unsigned char magic[6];
+    ssize_t n = pread(fd, magic, sizeof(magic), 0);
+    if (n < 0)
+    {
+        close(fd);
+        return -1;
+    }
+
+    int ret = -1;
+    size_t off, size;
+    if (n >= SELFMAG && memcmp(magic, ELFMAG, SELFMAG) == 0)
+    {
+        struct stat st;
+        void *map = MAP_FAILED;
+        if (fstat(fd, &st) == 0 && st.st_size > 0)
+            map = mmap(NULL, st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+        if (map != MAP_FAILED)
+        {
+            if (locate_modinfo(map, st.st_size, &off, &size) == 1)
+                ret = copy_section(map, off, size, buf, len);
+            else
+                errno = ENOEXEC;
+            munmap(map, st.st_size);
+        }
+    }
+    else if ((n == sizeof(XZ_MAGIC) && memcmp(magic, XZ_MAGIC, sizeof(XZ_MAGIC)) == 0) ||
+             (n >= (ssize_t)sizeof(ZSTD_MAGIC) && memcmp(magic, ZSTD_MAGIC, sizeof(ZSTD_MAGIC)) == 0))
+    {
+        struct image img = { NULL, 0, 0 };
+        int found = -1;
+        errno = EPROTONOSUPPORT;
+#ifdef HAVE_LZMA
+        if (magic[0] == XZ_MAGIC[0])
+            found = inflate_xz(fd, &img, &off, &size);
+#endif
+#ifdef HAVE_ZSTD
+        if (magic[0] == ZSTD_MAGIC[0])
+            found = inflate_zstd(fd, &img, &off, &size);
+#endif
+        if (found == 1)
+            ret = copy_section(img.data, off, size, buf, len);
+        else if (found == 0)
+            errno = ENOEXEC;
+        free(img.data);
+    }
+    else
+    {
+        errno = ENOEXEC;
+    }
+
+    int saved = errno;
+    close(fd);
+    errno = saved;
+    return ret;
+}
+
+/*
+ * Next value of `key` in a .modinfo section after `prev` (NULL for the
+ * first). Values are the NUL-terminated strings inside info, or NULL when
+ * there are no more.
+ */
+const char *mc_modinfo_next(const char *info, int len, const char *key, const char *prev)
+{
+    size_t klen = strlen(key);
+    const char *p = info;
+    const char *end = info + len;
+
+    if (prev)
+        p = prev + strnlen(prev, end - prev) + 1;
+    else
+        p = info;
+
+    // Entries can be padded with extra NULs between them
+    while (p < end)
+    {
+        size_t n = strnlen(p, end - p);
+        if (n > klen && p[klen] == '=' && strncmp(p, key, klen) == 0)
+            return p + klen + 1;
+        p += n + 1;
+    }
+    return NULL;
+}
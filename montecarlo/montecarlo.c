@@ -1,14 +1,491 @@
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <unistd.h>
+#include <errno.h>
+#include <limits.h>
+#include <sys/socket.h>
+#include <sys/un.h>
 
 #include "heads/libmontecarlo.h"
 
+#define USAGE "[list|load <driver>|unload <driver>|devices [--json|--ndjson] [--explain]|modules [--json|--ndjson]|watch|status|index [build [kernel]|show|match <modalias>]|rules [check [file]]|snapshot <dir> [--all-modules]|diff <before> [after] [--json|--ndjson]]"
+
+enum out_format
+{
+    OUT_JSON,
+    OUT_NDJSON
+};
+
+/* Write s as a JSON string literal (quotes included) */
+static void json_string(FILE *out, const char *s)
+{
+    fputc('"', out);
+    for (const unsigned char *c = (const unsigned char *)s; c && *c; c++)
+    {
+        switch (*c)
+        {
+        case '"':  fputs("\\\"", out); break;
+        case '\\': fputs("\\\\", out); break;
+        case '\n': fputs("\\n", out); break;
+        case '\r': fputs("\\r", out); break;
+        case '\t': fputs("\\t", out); break;
+        default:
+            if (*c < 0x20)
+                fprintf(out, "\\u%04x", *c);
+            else
+                fputc(*c, out);
+        }
+    }
+    fputc('"', out);
+}
+
+/* Rows are written as soon as they are produced; nothing is buffered here */
+struct row_writer
+{
+    enum out_format format;
+    int rows;
+};
+
+static void row_begin(struct row_writer *w)
+{
+    if (w->format == OUT_JSON)
+        fputs(w->rows == 0 ? "[\n  " : ",\n  ", stdout);
+    w->rows++;
+}
+
+static void row_end(struct row_writer *w)
+{
+    if (w->format == OUT_NDJSON)
+        fputc('\n', stdout);
+}
+
+static void rows_finish(struct row_writer *w)
+{
+    if (w->format == OUT_JSON)
+        fputs(w->rows == 0 ? "[]\n" : "\n]\n", stdout);
+    fflush(stdout);
+}
+
+/* explain NULL = the command has no --explain */
+static int parse_format(int argc, char *argv[], enum out_format *format, int *explain)
+{
+    *format = OUT_JSON;
+    if (explain)
+        *explain = 0;
+    for (int i = 2; i < argc; i++)
+    {
+        if (strcmp(argv[i], "--json") == 0)
+            *format = OUT_JSON;
+        else if (strcmp(argv[i], "--ndjson") == 0)
+            *format = OUT_NDJSON;
+        else if (explain && strcmp(argv[i], "--explain") == 0)
+            *explain = 1;
+        else
+        {
+            fprintf(stderr, "Opción desconocida: %s\n", argv[i]);
+            return -1;
+        }
+    }
+
+    /* NDJSON consumers read line by line; don't hold rows in a 4K buffer */
+    if (*format == OUT_NDJSON)
+        setvbuf(stdout, NULL, _IOLBF, 0);
+    return 0;
+}
+
+static void device_fields(const mc_device_info_t *info)
+{
+    int bound = strcmp(info->driver, "None") != 0;
+
+    fputs("{\"syspath\": ", stdout);
+    json_string(stdout, info->syspath);
+    fputs(", \"subsystem\": ", stdout);
+    json_string(stdout, info->subsystem);
+    fputs(", \"id\": ", stdout);
+    json_string(stdout, info->vidpid);
+    fputs(", \"product\": ", stdout);
+    json_string(stdout, info->product);
+    fputs(", \"driver\": ", stdout);
+    if (bound)
+        json_string(stdout, info->driver);
+    else
+        fputs("null", stdout);
+    fprintf(stdout, ", \"status\": \"%s\"", bound ? "in_use" : "no_driver");
+}
+
+static int device_row(const mc_device_info_t *info, void *user)
+{
+    struct row_writer *w = user;
+    row_begin(w);
+    device_fields(info);
+    fputc('}', stdout);
+    row_end(w);
+    return 0;
+}
+
+/* --explain: hidden devices too, each with the filter's reason code */
+static int explained_row(const mc_device_explain_t *e, void *user)
+{
+    struct row_writer *w = user;
+    row_begin(w);
+    device_fields(&e->info);
+    fprintf(stdout, ", \"shown\": %s, \"reason\": \"%s\"}",
+            MC_REASON_HIDDEN(e->reason) ? "false" : "true", mc_reason_name(e->reason));
+    row_end(w);
+    return 0;
+}
+
+static int cmd_devices(enum out_format format, int explain)
+{
+    struct row_writer w = { format, 0 };
+    if (explain)
+        mc_foreach_device_explained(explained_row, &w);
+    else
+        mc_foreach_device(device_row, &w);
+    rows_finish(&w);
+    return 0;
+}
+
+static void json_name_list(char names[][MC_MODULE_NAME_MAX], int n)
+{
+    fputc('[', stdout);
+    for (int i = 0; i < n; i++)
+    {
+        if (i)
+            fputs(", ", stdout);
+        json_string(stdout, names[i]);
+    }
+    fputc(']', stdout);
+}
+
+static int cmd_modules(enum out_format format)
+{
+    mc_modgraph_t *g = mc_modgraph_new();
+    if (!g)
+    {
+        fprintf(stderr, "No se pudo leer /proc/modules\n");
+        return 1;
+    }
+
+    int total = mc_modgraph_count(g);
+    char (*names)[MC_MODULE_NAME_MAX] = malloc((total > 0 ? total : 1) * sizeof(*names));
+    if (!names)
+    {
+        mc_modgraph_free(g);
+        return 1;
+    }
+
+    struct row_writer w = { format, 0 };
+    for (int i = 0; i < total; i++)
+    {
+        const char *mod = mc_modgraph_name(g, i);
+        int bound = mc_driver_has_bindings(mod);
+        int has_holders = mc_modgraph_has_holders(g, mod);
+
+        row_begin(&w);
+        fputs("{\"name\": ", stdout);
+        json_string(stdout, mod);
+        fprintf(stdout, ", \"size\": %ld, \"refcount\": %d", mc_modgraph_size(g, mod), mc_modgraph_refcount(g, mod));
+        fputs(", \"state\": ", stdout);
+        json_string(stdout, mc_modgraph_state(g, mod));
+        fputs(", \"taint\": ", stdout);
+        json_string(stdout, mc_modgraph_taint(g, mod));
+
+        fputs(", \"holders\": ", stdout);
+        json_name_list(names, mc_modgraph_holders(g, mod, names, total));
+        fputs(", \"depends\": ", stdout);
+        json_name_list(names, mc_modgraph_depends(g, mod, names, total));
+
+        fprintf(stdout, ", \"bound\": %s, \"status\": \"%s\"}",
+                bound ? "true" : "false",
+                (bound || has_holders) ? "in_use" : "idle");
+        row_end(&w);
+    }
+    rows_finish(&w);
+
+    free(names);
+    mc_modgraph_free(g);
+    return 0;
+}
+
+/* index build [kernel]: (re)write the module index, normally from the kernel postinst hook */
+/* index show: summary of the current index as JSON */
+/* index match <modalias>: modules whose aliases match, as a JSON list */
+static int cmd_index(int argc, char *argv[])
+{
+    const char *sub = argc >= 3 ? argv[2] : "show";
+    char path[PATH_MAX];
+
+    if (strcmp(sub, "build") == 0)
+    {
+        const char *kernel = argc >= 4 ? argv[3] : NULL;
+        int count = mc_ctx_modindex_build(NULL, kernel, NULL);
+        if (count < 0)
+        {
+            fprintf(stderr, "No se pudo generar el índice de módulos: %s\n", strerror(errno));
+            return 1;
+        }
+        mc_ctx_modindex_path(NULL, kernel, path, sizeof(path));
+        printf("Índice de módulos: %d módulos en %s\n", count, path);
+        return 0;
+    }
+
+    mc_modindex_t *idx = mc_ctx_modindex_open(NULL);
+    if (!idx)
+    {
+        if (errno == ESTALE)
+            fprintf(stderr, "El índice de módulos está desactualizado (ejecute: index build)\n");
+        else
+            fprintf(stderr, "No hay índice de módulos (ejecute: index build)\n");
+        return 1;
+    }
+
+    int ret = 0;
+    if (strcmp(sub, "show") == 0)
+    {
+        mc_ctx_modindex_path(NULL, NULL, path, sizeof(path));
+        fputs("{\"kernel\": ", stdout);
+        json_string(stdout, mc_modindex_kernel(idx));
+        fputs(", \"path\": ", stdout);
+        json_string(stdout, path);
+        printf(", \"modules\": %d, \"aliases\": %d}\n",
+               mc_modindex_count(idx), mc_modindex_alias_count(idx));
+    }
+    else if (strcmp(sub, "match") == 0 && argc >= 4)
+    {
+        int found[256];
+        int n = mc_modindex_match(idx, argv[3], found, 256);
+        if (n > 256)
+            n = 256;
+        fputc('[', stdout);
+        for (int i = 0; i < n; i++)
+        {
+            if (i)
+                fputs(", ", stdout);
+            json_string(stdout, mc_modindex_name(idx, found[i]));
+        }
+        fputs("]\n", stdout);
+    }
+    else
+    {
+        fprintf(stderr, "Uso: %s index [build [kernel]|show|match <modalias>]\n", argv[0]);
+        ret = 1;
+    }
+
+    mc_modindex_close(idx);
+    return ret;
+}
+
+/* rules [check [file]]: validate a rules file, the installed one by default */
+static int cmd_rules(int argc, char *argv[])
+{
+    const char *sub = argc >= 3 ? argv[2] : "check";
+    if (strcmp(sub, "check") != 0 || argc > 4)
+    {
+        fprintf(stderr, "Uso: %s rules [check [archivo]]\n", argv[0]);
+        return 1;
+    }
+
+    char installed[PATH_MAX];
+    const char *path = argc >= 4 ? argv[3] : NULL;
+    if (!path)
+    {
+        snprintf(installed, sizeof(installed), "%s%s", mc_ctx_root(NULL), MC_RULES_PATH);
+        if (access(installed, F_OK) == 0)
+            path = installed;
+    }
+
+    int counts[MC_RULE_KINDS];
+    char err[256];
+    int total = mc_rules_check(path, counts, err, sizeof(err));
+    if (total < 0)
+    {
+        fprintf(stderr, "%s: %s\n", path ? path : "reglas integradas", err);
+        return 1;
+    }
+
+    printf("%s: %d reglas (", path ? path : "reglas integradas", total);
+    for (int k = 0; k < MC_RULE_KINDS; k++)
+        printf("%s%s %d", k ? ", " : "", mc_rule_kind_name(k), counts[k]);
+    printf(")\n");
+    return 0;
+}
+
+/* snapshot <dir> [--all-modules]: capture this system for offline replay */
+static int cmd_snapshot(int argc, char *argv[])
+{
+    const char *dir = NULL;
+    int flags = 0;
+    for (int i = 2; i < argc; i++)
+    {
+        if (strcmp(argv[i], "--all-modules") == 0)
+            flags |= MC_SNAPSHOT_ALL_MODULES;
+        else if (!dir && argv[i][0] != '-')
+            dir = argv[i];
+        else
+            dir = NULL, i = argc;
+    }
+    if (!dir)
+    {
+        fprintf(stderr, "Uso: %s snapshot <directorio> [--all-modules]\n", argv[0]);
+        return 1;
+    }
+
+    int devices = mc_ctx_snapshot(NULL, dir, flags);
+    if (devices < 0)
+    {
+        if (errno == EEXIST)
+            fprintf(stderr, "El directorio %s no está vacío\n", dir);
+        else
+            fprintf(stderr, "No se pudo capturar el sistema en %s: %s\n", dir, strerror(errno));
+        return 1;
+    }
+    printf("Instantánea: %d dispositivos en %s (reproducir con MONTECARLO_ROOT=%s)\n", devices, dir, dir);
+    return 0;
+}
+
+static int diff_row(const mc_diff_entry_t *e, void *user)
+{
+    struct row_writer *w = user;
+    int module = e->kind >= MC_DIFF_MODULE_LOADED;
+
+    row_begin(w);
+    fprintf(stdout, "{\"change\": \"%s\", \"%s\": ", mc_diff_kind_name(e->kind), module ? "module" : "syspath");
+    json_string(stdout, e->key);
+    fputs(", \"before\": ", stdout);
+    if (e->before[0])
+        json_string(stdout, e->before);
+    else
+        fputs("null", stdout);
+    fputs(", \"after\": ", stdout);
+    if (e->after[0])
+        json_string(stdout, e->after);
+    else
+        fputs("null", stdout);
+    if (module)
+        fprintf(stdout, ", \"refcount_before\": %d, \"refcount_after\": %d", e->refcount_before, e->refcount_after);
+    fputc('}', stdout);
+    row_end(w);
+    return 0;
+}
+
+/* diff <before> [after]: changes between a snapshot and this system (or a second snapshot) */
+static int cmd_diff(int argc, char *argv[])
+{
+    const char *roots[2] = { NULL, NULL };
+    int nroots = 0;
+    enum out_format format = OUT_JSON;
+    for (int i = 2; i < argc; i++)
+    {
+        if (strcmp(argv[i], "--json") == 0)
+            format = OUT_JSON;
+        else if (strcmp(argv[i], "--ndjson") == 0)
+            format = OUT_NDJSON;
+        else if (argv[i][0] != '-' && nroots < 2)
+            roots[nroots++] = argv[i];
+        else
+            nroots = 0, i = argc;
+    }
+    if (nroots == 0)
+    {
+        fprintf(stderr, "Uso: %s diff <antes> [después] [--json|--ndjson]\n", argv[0]);
+        return 1;
+    }
+    if (format == OUT_NDJSON)
+        setvbuf(stdout, NULL, _IOLBF, 0);
+
+    // No second root: the current one ($MONTECARLO_ROOT or the live system)
+    mc_ctx_t *before = mc_ctx_new(roots[0]);
+    mc_ctx_t *after = roots[1] ? mc_ctx_new(roots[1]) : NULL;
+    if (!before || (roots[1] && !after))
+    {
+        mc_ctx_free(before);
+        mc_ctx_free(after);
+        return 1;
+    }
+
+    struct row_writer w = { format, 0 };
+    int changes = mc_ctx_foreach_diff(before, after, diff_row, &w);
+    int saved = errno;
+    mc_ctx_free(before);
+    mc_ctx_free(after);
+    if (changes < 0)
+    {
+        fprintf(stderr, "No se pudo comparar %s: %s\n", roots[0], strerror(saved));
+        return 1;
+    }
+    rows_finish(&w);
+    return 0;
+}
+
+/* Connect to the daemon socket. Returns the fd or -1. */
+static int daemon_connect(void)
+{
+    struct sockaddr_un addr;
+    memset(&addr, 0, sizeof(addr));
+    addr.sun_family = AF_UNIX;
+    mc_get_socket_path(addr.sun_path, sizeof(addr.sun_path));
+
+    int fd = socket(AF_UNIX, SOCK_STREAM, 0);
+    if (fd == -1)
+        return -1;
+
+    if (connect(fd, (struct sockaddr *)&addr, sizeof(addr)) == -1)
+    {
+        fprintf(stderr, "No se pudo conectar al daemon (%s)\n", addr.sun_path);
+        close(fd);
+        return -1;
+    }
+    return fd;
+}
+
+/* watch: print daemon events (NDJSON) until the daemon goes away */
+/* status: print the daemon counters and exit */
+static int cmd_daemon(int status_only)
+{
+    int fd = daemon_connect();
+    if (fd == -1)
+        return 1;
+
+    if (status_only)
+    {
+        const char *req = "{\"cmd\": \"status\"}\n";
+        if (send(fd, req, strlen(req), 0) == -1)
+        {
+            close(fd);
+            return 1;
+        }
+    }
+
+    FILE *in = fdopen(fd, "r");
+    if (!in)
+    {
+        close(fd);
+        return 1;
+    }
+
+    setvbuf(stdout, NULL, _IOLBF, 0);
+
+    char line[4096];
+    while (fgets(line, sizeof(line), in))
+    {
+        if (status_only && !strstr(line, "\"status\""))
+            continue;
+        fputs(line, stdout);
+        if (status_only)
+            break;
+    }
+
+    fclose(in);
+    return 0;
+}
+
 int main(int argc, char *argv[])
 {
     if (argc < 2)
     {
-        fprintf(stderr, "Uso: %s [list|load <driver>|unload <driver>]\n", argv[0]);
+        fprintf(stderr, "Uso: %s " USAGE "\n", argv[0]);
         return 1;
     }
 
@@ -29,6 +506,38 @@ int main(int argc, char *argv[])
 
         return 0;
     }
+    else if (strcmp(argv[1], "devices") == 0 || strcmp(argv[1], "modules") == 0)
+    {
+        enum out_format format;
+        int explain;
+        int is_devices = argv[1][0] == 'd';
+        if (parse_format(argc, argv, &format, is_devices ? &explain : NULL) != 0)
+        {
+            fprintf(stderr, "Uso: %s %s [--json|--ndjson]%s\n", argv[0], argv[1], is_devices ? " [--explain]" : "");
+            return 1;
+        }
+        return is_devices ? cmd_devices(format, explain) : cmd_modules(format);
+    }
+    else if (strcmp(argv[1], "watch") == 0 || strcmp(argv[1], "status") == 0)
+    {
+        return cmd_daemon(argv[1][0] == 's');
+    }
+    else if (strcmp(argv[1], "index") == 0)
+    {
+        return cmd_index(argc, argv);
+    }
+    else if (strcmp(argv[1], "rules") == 0)
+    {
+        return cmd_rules(argc, argv);
+    }
+    else if (strcmp(argv[1], "snapshot") == 0)
+    {
+        return cmd_snapshot(argc, argv);
+    }
+    else if (strcmp(argv[1], "diff") == 0)
+    {
+        return cmd_diff(argc, argv);
+    }
     else if (strcmp(argv[1], "load") == 0)
     {
         if (argc < 3)
@@ -50,6 +559,6 @@ int main(int argc, char *argv[])
     }
 
     fprintf(stderr, "Comando desconocido: %s\n", argv[1]);
-    fprintf(stderr, "Uso: %s [list|load <driver>|unload <driver>]\n", argv[0]);
+    fprintf(stderr, "Uso: %s " USAGE "\n", argv[0]);
     return 1;
 }
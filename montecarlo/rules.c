@@ -0,0 +1,621 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <stdint.h>
+#include <stdbool.h>
+#include <ctype.h>
+#include <errno.h>
+#include <limits.h>
+#include <pthread.h>
+#include <time.h>
+#include <sys/stat.h>
+
+#include "heads/libmontecarlo.h"
+
+/*
+ * SITE RULES
+ * The module and device exclusions, read from rules.conf (format in the
+ * file itself) and compiled into one hashed table of exact patterns and
+ * a prefix trie per kind, so a check costs O(length of the value) however
+ * many rules there are. Compiled sets are cached per rules path and the
+ * file is re-stat'ed at most once a second; a changed file is recompiled
+ * and swapped in under the write lock. When the file is missing the
+ * built-in copy (rules.conf as shipped) is used.
+ */
+
+#define RULES_RECHECK_NS 1000000000LL
+#define RULES_MAX_FILE (1024 * 1024)
+#define RULES_LINE_MAX 512
+
+static const char builtin_rules[] =
+#include "rules_default.h"
+    ;
+
+static const char *const kind_names[MC_RULE_KINDS] = {
+    [MC_RULE_MODULE] = "module",
+    [MC_RULE_HW_ALIAS] = "hw-alias",
+    [MC_RULE_DRIVER] = "driver",
+    [MC_RULE_PCI_CLASS] = "pci-class",
+    [MC_RULE_USB_CLASS] = "usb-class",
+    [MC_RULE_SCSI_DEVTYPE] = "scsi-devtype",
+};
+
+struct rule_entry          // exact pattern; value NULL = empty slot
+{
+    char *value;
+    int kind;
+    int reason;
+};
+
+struct rule_node           // trie node; children form a sibling list
+{
+    int child;
+    int sibling;
+    int reason;
+    char c;
+    bool end;              // a prefix pattern ends here
+};
+
+struct rules
+{
+    struct rules *next;
+    char path[PATH_MAX];
+    bool loaded;           // compiled at least once
+    bool present;          // compiled from the file (else the built-in copy)
+    dev_t dev;
+    ino_t ino;
+    struct timespec mtime;
+    off_t size;
+    long long checked;     // monotonic ns of the last stat
+
+    struct rule_entry *table;
+    size_t table_size;     // power of two
+    size_t table_used;
+    struct rule_node *nodes;
+    int node_count;
+    int node_cap;
+    int roots[MC_RULE_KINDS];
+    int counts[MC_RULE_KINDS];
+};
+
+static pthread_rwlock_t rules_lock = PTHREAD_RWLOCK_INITIALIZER;
+static struct rules *rules_list;   // one compiled set per rules path, never freed
+
+static long long now_ns(void)
+{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec * 1000000000LL + ts.tv_nsec;
+}
+
+static unsigned int rule_hash(int kind, const char *s)
+{
+    unsigned int h = 2166136261u ^ (unsigned int)kind;
+    while (*s)
+        h = (h ^ (unsigned char)*s++) * 16777619u;
+    return h;
+}
+
+/* EXACT PATTERNS */
+
+static int table_insert(struct rules *r, int kind, const char *value, int reason)
+{
+    if ((r->table_used + 1) * 2 > r->table_size)
+    {
+        size_t size = r->table_size ? r->table_size * 2 : 256;
+        struct rule_entry *table = calloc(size, sizeof(*table));
+        if (!table)
+            return -1;
+        for (size_t i = 0; i < r->table_size; i++)
+        {
+            struct rule_entry *e = &r->table[i];
+            if (!e->value)
+                continue;
+            size_t h = rule_hash(e->kind, e->value) & (size - 1);
+            while (table[h].value)
+                h = (h + 1) & (size - 1);
+            table[h] = *e;
+        }
+        free(r->table);
+        r->table = table;
+        r->table_size = size;
+    }
+
+    size_t h = rule_hash(kind, value) & (r->table_size - 1);
+    for (; r->table[h].value; h = (h + 1) & (r->table_size - 1))
+    {
+        if (r->table[h].kind == kind && strcmp(r->table[h].value, value) == 0)
+        {
+            r->table[h].reason = reason;   // later lines win
+            return 0;
+        }
+    }
+    if (!(r->table[h].value = strdup(value)))
+        return -1;
+    r->table[h].kind = kind;
+    r->table[h].reason = reason;
+    r->table_used++;
+    return 0;
+}
+
+static const struct rule_entry *table_find(const struct rules *r, int kind, const char *value)
+{
+    if (!r->table_size)
+        return NULL;
+    for (size_t h = rule_hash(kind, value) & (r->table_size - 1); r->table[h].value;
+         h = (h + 1) & (r->table_size - 1))
+    {
+        if (r->table[h].kind == kind && strcmp(r->table[h].value, value) == 0)
+            return &r->table[h];
+    }
+    return NULL;
+}
+
+/* PREFIX TRIE */
+
+static int node_new(struct rules *r, char c)
+{
+    if (r->node_count == r->node_cap)
+    {
+        int cap = r->node_cap ? r->node_cap * 2 : 256;
+        struct rule_node *nodes = realloc(r->nodes, cap * sizeof(*nodes));
+        if (!nodes)
+            return -1;
+        r->nodes = nodes;
+        r->node_cap = cap;
+    }
+    struct rule_node *n = &r->nodes[r->node_count];
+    n->child = n->sibling = -1;
+    n->reason = 0;
+    n->c = c;
+    n->end = false;
+    return r->node_count++;
+}
+
+static int trie_insert(struct rules *r, int kind, const char *prefix, size_t len, int reason)
+{
+    if (r->roots[kind] < 0 && (r->roots[kind] = node_new(r, '\0')) < 0)
+        return -1;
+
+    int node = r->roots[kind];
+    for (size_t i = 0; i < len; i++)
+    {
+        int next = r->nodes[node].child;
+        while (next >= 0 && r->nodes[next].c != prefix[i])
+            next = r->nodes[next].sibling;
+        if (next < 0)
+        {
+            if ((next = node_new(r, prefix[i])) < 0)
+                return -1;
+            r->nodes[next].sibling = r->nodes[node].child;
+            r->nodes[node].child = next;
+        }
+        node = next;
+    }
+    r->nodes[node].end = true;
+    r->nodes[node].reason = reason;
+    return 0;
+}
+
+/* Shortest prefix pattern of `kind` that value starts with, or NULL */
+static const struct rule_node *trie_find(const struct rules *r, int kind, const char *value)
+{
+    int node = r->roots[kind];
+    if (node < 0)
+        return NULL;
+    for (const char *p = value;; p++)
+    {
+        if (r->nodes[node].end)
+            return &r->nodes[node];
+        if (!*p)
+            return NULL;
+        int next = r->nodes[node].child;
+        while (next >= 0 && r->nodes[next].c != *p)
+            next = r->nodes[next].sibling;
+        if (next < 0)
+            return NULL;
+        node = next;
+    }
+}
+
+/* COMPILER */
+
+static void rules_free(struct rules *r)
+{
+    for (size_t i = 0; i < r->table_size; i++)
+        free(r->table[i].value);
+    free(r->table);
+    free(r->nodes);
+    r->table = NULL;
+    r->nodes = NULL;
+    r->table_size = r->table_used = 0;
+    r->node_count = r->node_cap = 0;
+}
+
+static int reason_code(const char *name)
+{
+    for (int i = MC_REASON_SHOWN; i <= MC_REASON_USB_NO_PARENT; i++)
+    {
+        if (strcmp(mc_reason_name(i), name) == 0)
+            return i;
+    }
+    return -1;
+}
+
+static bool is_hex(const char *s, size_t len)
+{
+    if (strlen(s) != len)
+        return false;
+    for (size_t i = 0; i < len; i++)
+    {
+        if (!isxdigit((unsigned char)s[i]))
+            return false;
+    }
+    return true;
+}
+
+/* Compile one line. 0 = ok or blank, -1 = invalid (message in err), -2 = out of memory */
+static int compile_line(struct rules *r, char *line, char *err, size_t errlen)
+{
+    char *hash = strchr(line, '#');
+    if (hash)
+        *hash = '\0';
+
+    char *save, *fields[4];
+    int n = 0;
+    for (char *tok = strtok_r(line, " \t\r\n", &save); tok; tok = strtok_r(NULL, " \t\r\n", &save))
+    {
+        if (n == 4)
+            break;
+        fields[n++] = tok;
+    }
+    if (n == 0)
+        return 0;
+    if (n < 2 || n > 3)
+    {
+        snprintf(err, errlen, "expected <kind> <pattern> [<reason>]");
+        return -1;
+    }
+
+    int kind = -1;
+    for (int k = 0; k < MC_RULE_KINDS; k++)
+    {
+        if (strcmp(fields[0], kind_names[k]) == 0)
+            kind = k;
+    }
+    if (kind < 0)
+    {
+        snprintf(err, errlen, "unknown kind '%s'", fields[0]);
+        return -1;
+    }
+
+    int reason = 0;
+    if (n == 3)
+    {
+        reason = reason_code(fields[2]);
+        bool allowed = reason >= 0 && kind != MC_RULE_MODULE && kind != MC_RULE_HW_ALIAS &&
+                       (MC_REASON_HIDDEN(reason) ||
+                        (kind == MC_RULE_USB_CLASS && reason == MC_REASON_MASS_STORAGE));
+        if (!allowed)
+        {
+            snprintf(err, errlen, "reason '%s' not valid for %s", fields[2], fields[0]);
+            return -1;
+        }
+    }
+    else if (kind == MC_RULE_DRIVER)
+        reason = MC_REASON_PCI_INFRA_DRIVER;
+    else if (kind == MC_RULE_SCSI_DEVTYPE)
+        reason = MC_REASON_SCSI_HOST;
+    else if (kind == MC_RULE_PCI_CLASS || kind == MC_RULE_USB_CLASS)
+    {
+        snprintf(err, errlen, "%s needs a reason", fields[0]);
+        return -1;
+    }
+
+    char *pattern = fields[1];
+    size_t len = strlen(pattern);
+    bool prefix = len > 0 && pattern[len - 1] == '*';
+    if (prefix)
+        pattern[--len] = '\0';
+    if (strchr(pattern, '*'))
+    {
+        snprintf(err, errlen, "'*' is only allowed at the end of a pattern");
+        return -1;
+    }
+
+    if (kind == MC_RULE_PCI_CLASS || kind == MC_RULE_USB_CLASS)
+    {
+        if (prefix || !(is_hex(pattern, 2) || (kind == MC_RULE_PCI_CLASS && is_hex(pattern, 4))))
+        {
+            snprintf(err, errlen, "bad class '%s'", fields[1]);
+            return -1;
+        }
+        for (char *p = pattern; *p; p++)
+            *p = tolower((unsigned char)*p);
+    }
+    else if (kind == MC_RULE_SCSI_DEVTYPE && strcmp(pattern, "-") == 0)
+        pattern[0] = '\0';
+
+    int ret = prefix ? trie_insert(r, kind, pattern, len, reason) : table_insert(r, kind, pattern, reason);
+    if (ret != 0)
+        return -2;
+    r->counts[kind]++;
+    return 0;
+}
+
+/*
+ * Compile rule text into r. strict: stop at the first invalid line
+ * (returns its number, message in err); otherwise invalid lines are
+ * skipped. Returns 0, or -1 when out of memory.
+ */
+static int rules_compile(struct rules *r, const char *text, size_t len, bool strict, char *err, size_t errlen)
+{
+    char line[RULES_LINE_MAX], msg[128];
+
+    for (int k = 0; k < MC_RULE_KINDS; k++)
+    {
+        r->roots[k] = -1;
+        r->counts[k] = 0;
+    }
+
+    int lineno = 0;
+    for (size_t pos = 0; pos < len;)
+    {
+        const char *nl = memchr(text + pos, '\n', len - pos);
+        size_t n = (nl ? (size_t)(nl - text) : len) - pos;
+        lineno++;
+
+        int ret;
+        if (n >= sizeof(line))
+        {
+            snprintf(msg, sizeof(msg), "line too long");
+            ret = -1;
+        }
+        else
+        {
+            memcpy(line, text + pos, n);
+            line[n] = '\0';
+            ret = compile_line(r, line, msg, sizeof(msg));
+        }
+        if (ret == -2)
+            return -1;
+        if (ret == -1 && strict)
+        {
+            if (err && errlen)
+                snprintf(err, errlen, "line %d: %s", lineno, msg);
+            return lineno;
+        }
+        pos += n + 1;
+    }
+    return 0;
+}
+
+/* Whole file into a NUL-terminated buffer, NULL with errno set */
+static char *read_file(const char *path, size_t *len)
+{
+    FILE *f = fopen(path, "re");
+    if (!f)
+        return NULL;
+
+    char *buf = malloc(RULES_MAX_FILE + 1);
+    if (!buf)
+    {
+        fclose(f);
+        return NULL;
+    }
+    *len = fread(buf, 1, RULES_MAX_FILE + 1, f);
+    int failed = ferror(f);
+    fclose(f);
+    if (failed || *len > RULES_MAX_FILE)
+    {
+        free(buf);
+        errno = failed ? EIO : EFBIG;
+        return NULL;
+    }
+    buf[*len] = '\0';
+    return buf;
+}
+
+/* Recompile r if its file appeared, changed or went away. Write lock held. */
+static void rules_refresh(struct rules *r)
+{
+    struct stat st;
+    bool present = stat(r->path, &st) == 0;
+    r->checked = now_ns();
+
+    if (r->loaded && present == r->present &&
+        (!present || (st.st_dev == r->dev && st.st_ino == r->ino && st.st_size == r->size &&
+                      st.st_mtim.tv_sec == r->mtime.tv_sec && st.st_mtim.tv_nsec == r->mtime.tv_nsec)))
+        return;
+
+    struct rules fresh = { 0 };
+    size_t len = 0;
+    char *text = present ? read_file(r->path, &len) : NULL;
+    int ret = text ? rules_compile(&fresh, text, len, false, NULL, 0)
+                   : rules_compile(&fresh, builtin_rules, sizeof(builtin_rules) - 1, false, NULL, 0);
+    free(text);
+    if (ret != 0)
+    {
+        rules_free(&fresh);
+        return;   // keep the previous set
+    }
+
+    rules_free(r);
+    r->table = fresh.table;
+    r->table_size = fresh.table_size;
+    r->table_used = fresh.table_used;
+    r->nodes = fresh.nodes;
+    r->node_count = fresh.node_count;
+    r->node_cap = fresh.node_cap;
+    memcpy(r->roots, fresh.roots, sizeof(r->roots));
+    memcpy(r->counts, fresh.counts, sizeof(r->counts));
+
+    r->loaded = true;
+    r->present = text != NULL;
+    if (r->present)
+    {
+        r->dev = st.st_dev;
+        r->ino = st.st_ino;
+        r->size = st.st_size;
+        r->mtime = st.st_mtim;
+    }
+}
+
+static struct rules *rules_find(const char *path)
+{
+    for (struct rules *r = rules_list; r; r = r->next)
+    {
+        if (strcmp(r->path, path) == 0)
+            return r;
+    }
+    return NULL;
+}
+
+/* Compiled rules for ctx with the read lock held, or NULL (lock not held) */
+static const struct rules *rules_acquire(const mc_ctx_t *ctx)
+{
+    char path[PATH_MAX];
+    if (snprintf(path, sizeof(path), "%s%s", mc_ctx_root(ctx), MC_RULES_PATH) >= (int)sizeof(path))
+        return NULL;
+
+    pthread_rwlock_rdlock(&rules_lock);
+    struct rules *r = rules_find(path);
+    if (r && r->loaded && now_ns() - r->checked < RULES_RECHECK_NS)
+        return r;
+    pthread_rwlock_unlock(&rules_lock);
+
+    pthread_rwlock_wrlock(&rules_lock);
+    r = rules_find(path);
+    if (!r && (r = calloc(1, sizeof(*r))))
+    {
+        snprintf(r->path, sizeof(r->path), "%s", path);
+        r->next = rules_list;
+        rules_list = r;
+    }
+    if (r)
+        rules_refresh(r);
+    pthread_rwlock_unlock(&rules_lock);
+
+    // Sets are never unlinked, so r is still valid under the read lock
+    pthread_rwlock_rdlock(&rules_lock);
+    if (r && r->loaded)
+        return r;
+    pthread_rwlock_unlock(&rules_lock);
+    return NULL;
+}
+
+/* MATCHING */
+
+static int match_one(const struct rules *r, int kind, const char *value, int *reason)
+{
+    const struct rule_entry *e = table_find(r, kind, value);
+    if (e)
+    {
+        *reason = e->reason;
+        return 1;
+    }
+    const struct rule_node *n = trie_find(r, kind, value);
+    if (n)
+    {
+        *reason = n->reason;
+        return 1;
+    }
+    return 0;
+}
+
+/*
+ * Does value match a rule of `kind` (MC_RULE_*)? Returns 1 and sets
+ * *reason (MC_REASON_*, 0 for module and hw-alias rules; reason may be
+ * NULL), 0 if no rule matches, -1 for an unknown kind.
+ */
+int mc_ctx_rule_match(const mc_ctx_t *ctx, int kind, const char *value, int *reason)
+{
+    int dummy;
+    if (kind < 0 || kind >= MC_RULE_KINDS)
+        return -1;
+    if (!value)
+        return 0;
+    if (!reason)
+        reason = &dummy;
+
+    char key[8], base[4];
+    const char *keys[2] = { value, NULL };
+    if (kind == MC_RULE_PCI_CLASS)
+    {
+        // Class and subclass first, then the base class
+        char *end;
+        unsigned long code = strtoul(value, &end, 16);
+        if (end == value || code > 0xffffff)
+            return 0;
+        snprintf(key, sizeof(key), "%02lx%02lx", (code >> 16) & 0xff, (code >> 8) & 0xff);
+        snprintf(base, sizeof(base), "%02lx", (code >> 16) & 0xff);
+        keys[0] = key;
+        keys[1] = base;
+    }
+    else if (kind == MC_RULE_USB_CLASS)
+    {
+        snprintf(key, sizeof(key), "%s", value);
+        for (char *p = key; *p; p++)
+            *p = tolower((unsigned char)*p);
+        keys[0] = key;
+    }
+
+    const struct rules *r = rules_acquire(ctx);
+    if (!r)
+        return 0;
+    int hit = match_one(r, kind, keys[0], reason) || (keys[1] && match_one(r, kind, keys[1], reason));
+    pthread_rwlock_unlock(&rules_lock);
+    return hit;
+}
+
+int mc_rule_match(int kind, const char *value, int *reason)
+{
+    return mc_ctx_rule_match(NULL, kind, value, reason);
+}
+
+const char *mc_rule_kind_name(int kind)
+{
+    return (kind >= 0 && kind < MC_RULE_KINDS) ? kind_names[kind] : NULL;
+}
+
+/*
+ * Validate a rules file (NULL = the built-in copy) without installing it.
+ * Returns the number of rules and fills counts[MC_RULE_KINDS] if given;
+ * -1 with errno set when unreadable, or with EINVAL and "line N: ..." in
+ * err at the first invalid line.
+ */
+int mc_rules_check(const char *path, int *counts, char *err, size_t errlen)
+{
+    size_t len = sizeof(builtin_rules) - 1;
+    char *text = NULL;
+    if (err && errlen)
+        err[0] = '\0';
+    if (path && !(text = read_file(path, &len)))
+    {
+        if (err && errlen)
+            snprintf(err, errlen, "%s", strerror(errno));
+        return -1;
+    }
+
+    struct rules r = { 0 };
+    int ret = rules_compile(&r, text ? text : builtin_rules, len, true, err, errlen);
+    free(text);
+
+    int total = 0;
+    for (int k = 0; k < MC_RULE_KINDS; k++)
+    {
+        total += r.counts[k];
+        if (counts)
+            counts[k] = r.counts[k];
+    }
+    rules_free(&r);
+
+    if (ret != 0)
+    {
+        if (ret < 0 && err && errlen)
+            snprintf(err, errlen, "%s", strerror(ENOMEM));
+        errno = ret < 0 ? ENOMEM : EINVAL;
+        return -1;
+    }
+    return total;
+}
@@ -0,0 +1,530 @@
+#include <stdio.h>
+#include <stdarg.h>
+#include <stdlib.h>
+#include <string.h>
+#include <stdint.h>
+#include <stdbool.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <elf.h>
+#include <limits.h>
+#include <time.h>
+#include <unistd.h>
+#include <dirent.h>
+#include <sys/stat.h>
+
+#include "heads/libmontecarlo.h"
+
+/*
+ * SNAPSHOTS
+ * Copies what libmontecarlo and the desktop package read from a live (or
+ * rooted) system into a directory laid out like the original, so that
+ * directory works as a root prefix: MONTECARLO_ROOT=<dir>, mc_ctx_new(dir).
+ * Only the attributes the device walk, the filter and Auto-Find look at are
+ * copied, sysfs symlinks are kept as they are (they are relative), and
+ * module files are replaced by stubs holding just their .modinfo section.
+ */
+
+#define SNAP_PATH (PATH_MAX + 256)
+#define SNAP_MODINFO_MAX (256 * 1024)
+
+/* Buses whose devices and drivers the library and Auto-Find enumerate */
+static const char *const snap_buses[] = {
+    "usb", "usb-serial", "pci", "hid", "scsi", "pcmcia", "i2c", "sdio", NULL
+};
+
+/* Device attributes read by the walk, the name lookups, the filter and Auto-Find */
+static const char *const snap_attrs[] = {
+    "uevent", "modalias", "vendor", "device", "class", "label",
+    "subsystem_vendor", "subsystem_device", "revision",
+    "idVendor", "idProduct", "bcdDevice", "product", "manufacturer",
+    "bDeviceClass", "bDeviceSubClass", "bDeviceProtocol", "bNumInterfaces",
+    "bInterfaceClass", "bInterfaceSubClass", "bInterfaceProtocol", "bInterfaceNumber",
+    "model", "type", "name", "prod_id", "manf_id", "card_id", "func_id", NULL
+};
+
+static const char *const snap_module_attrs[] = {
+    "refcnt", "initstate", "taint", "coresize", "initsize", NULL
+};
+
+static const char *const snap_depmod_files[] = {
+    "modules.dep", "modules.alias", "modules.builtin", "modules.builtin.modinfo",
+    "modules.order", "modules.softdep", "modules.devname", NULL
+};
+
+static const char *const snap_modprobe_dirs[] = {
+    "/etc/modprobe.d", "/run/modprobe.d", "/usr/local/lib/modprobe.d",
+    "/usr/lib/modprobe.d", "/lib/modprobe.d", NULL
+};
+
+struct snap
+{
+    const char *root;       // source prefix ("" = live system)
+    char out[PATH_MAX];     // snapshot directory
+    int devices;
+};
+
+/* snprintf for paths: -1 instead of a truncated path */
+static int spath(char *buf, size_t len, const char *fmt, ...)
+{
+    va_list ap;
+    va_start(ap, fmt);
+    int n = vsnprintf(buf, len, fmt, ap);
+    va_end(ap);
+    return (n < 0 || (size_t)n >= len) ? -1 : 0;
+}
+
+static int make_dirs(char *path)
+{
+    for (char *p = path + 1; *p; p++)
+    {
+        if (*p != '/')
+            continue;
+        *p = '\0';
+        int r = mkdir(path, 0755);
+        *p = '/';
+        if (r != 0 && errno != EEXIST)
+            return -1;
+    }
+    return (mkdir(path, 0755) == 0 || errno == EEXIST) ? 0 : -1;
+}
+
+/* Parent directories of a snapshot file */
+static int make_parent(const char *path)
+{
+    char dir[SNAP_PATH];
+    if (spath(dir, sizeof(dir), "%s", path) != 0)
+        return -1;
+    char *slash = strrchr(dir, '/');
+    if (!slash || slash == dir)
+        return 0;
+    *slash = '\0';
+    return make_dirs(dir);
+}
+
+/* Copy src to dst (both full paths). 0 = copied, -1 = unreadable or write error */
+static int copy_file(const char *src, const char *dst)
+{
+    int in = open(src, O_RDONLY | O_CLOEXEC);
+    if (in < 0)
+        return -1;
+    if (make_parent(dst) != 0)
+    {
+        close(in);
+        return -1;
+    }
+    int out = open(dst, O_WRONLY | O_CREAT | O_TRUNC | O_CLOEXEC, 0644);
+    if (out < 0)
+    {
+        close(in);
+        return -1;
+    }
+
+    char buf[64 * 1024];
+    ssize_t n;
+    int ret = 0;
+    while ((n = read(in, buf, sizeof(buf))) > 0)
+    {
+        if (write(out, buf, n) != n)
+        {
+            ret = -1;
+            break;
+        }
+    }
+    if (n < 0)
+        ret = -1;   // some sysfs attributes fail on read (EIO, EACCES)
+    close(in);
+    if (close(out) != 0 || ret != 0)
+    {
+        unlink(dst);
+        return -1;
+    }
+    return 0;
+}
+
+/* Copy path (absolute on the target) from the source tree into the snapshot */
+static int snap_copy(const struct snap *s, const char *path)
+{
+    char src[SNAP_PATH], dst[SNAP_PATH];
+    if (spath(src, sizeof(src), "%s%s", s->root, path) != 0 ||
+        spath(dst, sizeof(dst), "%s%s", s->out, path) != 0)
+        return -1;
+    return copy_file(src, dst);
+}
+
+/* Recreate the symlink at path with the same (relative) target */
+static int snap_link(const struct snap *s, const char *path)
+{
+    char src[SNAP_PATH], dst[SNAP_PATH], target[PATH_MAX];
+    if (spath(src, sizeof(src), "%s%s", s->root, path) != 0)
+        return -1;
+    ssize_t n = readlink(src, target, sizeof(target) - 1);
+    if (n < 0)
+        return -1;
+    target[n] = '\0';
+
+    if (spath(dst, sizeof(dst), "%s%s", s->out, path) != 0 || make_parent(dst) != 0)
+        return -1;
+    return (symlink(target, dst) == 0 || errno == EEXIST) ? 0 : -1;
+}
+
+/* Every symlink directly inside dir (driver bindings, holders...) */
+static void snap_links_in(const struct snap *s, const char *dir)
+{
+    char src[SNAP_PATH], path[SNAP_PATH];
+    if (spath(src, sizeof(src), "%s%s", s->root, dir) != 0)
+        return;
+    DIR *d = opendir(src);
+    if (!d)
+        return;
+
+    struct dirent *ent;
+    while ((ent = readdir(d)) != NULL)
+    {
+        if (ent->d_name[0] == '.' || ent->d_type != DT_LNK)
+            continue;
+        if (spath(path, sizeof(path), "%s/%s", dir, ent->d_name) == 0)
+            snap_link(s, path);
+    }
+    closedir(d);
+}
+
+/* A device directory (path under /sys/devices) and its ancestors */
+static void snap_device(struct snap *s, const char *devpath)
+{
+    char dir[SNAP_PATH], path[SNAP_PATH];
+    if (spath(dir, sizeof(dir), "%s", devpath) != 0)
+        return;
+
+    while (strncmp(dir, "/sys/devices/", 13) == 0)
+    {
+        // Ancestors shared with an earlier device are already there
+        if (spath(path, sizeof(path), "%s%s/uevent", s->out, dir) != 0 || access(path, F_OK) == 0)
+            break;
+
+        if (spath(path, sizeof(path), "%s%s", s->out, dir) != 0 || make_dirs(path) != 0)
+            return;
+        for (int i = 0; snap_attrs[i]; i++)
+        {
+            if (spath(path, sizeof(path), "%s/%s", dir, snap_attrs[i]) == 0)
+                snap_copy(s, path);
+        }
+        if (spath(path, sizeof(path), "%s/subsystem", dir) == 0)
+            snap_link(s, path);
+        if (spath(path, sizeof(path), "%s/driver", dir) == 0)
+            snap_link(s, path);
+
+        *strrchr(dir, '/') = '\0';
+    }
+}
+
+static void snap_bus(struct snap *s, const char *bus)
+{
+    char dir[SNAP_PATH], src[SNAP_PATH], path[SNAP_PATH], real[PATH_MAX];
+    size_t rlen = strlen(s->root);
+
+    if (spath(dir, sizeof(dir), "%s/sys/bus/%s/devices", s->root, bus) != 0)
+        return;
+    DIR *d = opendir(dir);
+    if (!d)
+        return;
+    if (spath(path, sizeof(path), "%s/sys/bus/%s/drivers", s->out, bus) == 0)
+        make_dirs(path);
+
+    struct dirent *ent;
+    while ((ent = readdir(d)) != NULL)
+    {
+        if (ent->d_name[0] == '.')
+            continue;
+        if (spath(path, sizeof(path), "/sys/bus/%s/devices/%s", bus, ent->d_name) != 0 ||
+            spath(src, sizeof(src), "%s%s", s->root, path) != 0 ||
+            snap_link(s, path) != 0 || !realpath(src, real) || strncmp(real, s->root, rlen) != 0)
+            continue;
+        snap_device(s, real + rlen);
+        s->devices++;
+    }
+    closedir(d);
+
+    if (spath(dir, sizeof(dir), "%s/sys/bus/%s/drivers", s->root, bus) != 0 || !(d = opendir(dir)))
+        return;
+    while ((ent = readdir(d)) != NULL)
+    {
+        if (ent->d_name[0] == '.')
+            continue;
+        if (spath(path, sizeof(path), "/sys/bus/%s/drivers/%s", bus, ent->d_name) != 0 ||
+            spath(src, sizeof(src), "%s%s", s->out, path) != 0 || make_dirs(src) != 0)
+            continue;
+        snap_links_in(s, path);   // bound devices and the module link
+    }
+    closedir(d);
+}
+
+static void snap_modules_sysfs(const struct snap *s)
+{
+    char dir[SNAP_PATH], path[SNAP_PATH];
+    if (spath(dir, sizeof(dir), "%s/sys/module", s->root) != 0)
+        return;
+    DIR *d = opendir(dir);
+    if (!d)
+        return;
+
+    struct dirent *ent;
+    while ((ent = readdir(d)) != NULL)
+    {
+        if (ent->d_name[0] == '.')
+            continue;
+        if (spath(path, sizeof(path), "%s/sys/module/%s/holders", s->out, ent->d_name) != 0 ||
+            make_dirs(path) != 0)
+            continue;
+        for (int i = 0; snap_module_attrs[i]; i++)
+        {
+            if (spath(path, sizeof(path), "/sys/module/%s/%s", ent->d_name, snap_module_attrs[i]) == 0)
+                snap_copy(s, path);
+        }
+        if (spath(path, sizeof(path), "/sys/module/%s/holders", ent->d_name) == 0)
+            snap_links_in(s, path);
+        if (spath(path, sizeof(path), "/sys/module/%s/drivers", ent->d_name) == 0)
+            snap_links_in(s, path);
+    }
+    closedir(d);
+}
+
+static void snap_modprobe_conf(const struct snap *s)
+{
+    char dir[SNAP_PATH], path[SNAP_PATH];
+    for (int i = 0; snap_modprobe_dirs[i]; i++)
+    {
+        if (spath(dir, sizeof(dir), "%s%s", s->root, snap_modprobe_dirs[i]) != 0)
+            continue;
+        DIR *d = opendir(dir);
+        if (!d)
+            continue;
+        struct dirent *ent;
+        while ((ent = readdir(d)) != NULL)
+        {
+            size_t len = strlen(ent->d_name);
+            if (ent->d_name[0] == '.' || len < 5 || strcmp(ent->d_name + len - 5, ".conf") != 0)
+                continue;
+            if (spath(path, sizeof(path), "%s/%s", snap_modprobe_dirs[i], ent->d_name) == 0)
+                snap_copy(s, path);
+        }
+        closedir(d);
+    }
+}
+
+/* Minimal ELF64 object whose only content is the .modinfo section */
+static int write_modinfo_stub(const char *path, const char *info, size_t len)
+{
+    static const char shstrtab[] = "\0.modinfo\0.shstrtab";
+    Elf64_Ehdr eh;
+    Elf64_Shdr sh[3];
+    size_t info_off = sizeof(eh);
+    size_t str_off = info_off + len;
+    size_t sh_off = (str_off + sizeof(shstrtab) + 7) & ~(size_t)7;
+
+    memset(&eh, 0, sizeof(eh));
+    memcpy(eh.e_ident, ELFMAG, SELFMAG);
+    eh.e_ident[EI_CLASS] = ELFCLASS64;
+    eh.e_ident[EI_DATA] = ELFDATA2LSB;
+    eh.e_ident[EI_VERSION] = EV_CURRENT;
+    eh.e_type = ET_REL;
+    eh.e_machine = EM_X86_64;
+    eh.e_version = EV_CURRENT;
+    eh.e_shoff = sh_off;
+    eh.e_ehsize = sizeof(eh);
+    eh.e_shentsize = sizeof(Elf64_Shdr);
+    eh.e_shnum = 3;
+    eh.e_shstrndx = 2;
+
+    memset(sh, 0, sizeof(sh));
+    sh[1].sh_name = 1;                  // .modinfo
+    sh[1].sh_type = SHT_PROGBITS;
+    sh[1].sh_offset = info_off;
+    sh[1].sh_size = len;
+    sh[1].sh_addralign = 1;
+    sh[2].sh_name = 10;                 // .shstrtab
+    sh[2].sh_type = SHT_STRTAB;
+    sh[2].sh_offset = str_off;
+    sh[2].sh_size = sizeof(shstrtab);
+    sh[2].sh_addralign = 1;
+
+    if (make_parent(path) != 0)
+        return -1;
+    FILE *f = fopen(path, "we");
+    if (!f)
+        return -1;
+    static const char pad[8];
+    fwrite(&eh, sizeof(eh), 1, f);
+    fwrite(info, 1, len, f);
+    fwrite(shstrtab, 1, sizeof(shstrtab), f);
+    fwrite(pad, 1, sh_off - (str_off + sizeof(shstrtab)), f);
+    fwrite(sh, sizeof(sh), 1, f);
+    return (ferror(f) | fclose(f)) ? -1 : 0;
+}
+
+static int name_cmp(const void *a, const void *b)
+{
+    return strcmp(*(const char *const *)a, *(const char *const *)b);
+}
+
+/* Sorted names from the snapshot's /proc/modules; NULL when empty */
+static char **loaded_names(const struct snap *s, int *count)
+{
+    char path[SNAP_PATH], line[1024];
+    char **names = NULL;
+    int n = 0, cap = 0;
+
+    *count = 0;
+    if (spath(path, sizeof(path), "%s/proc/modules", s->out) != 0)
+        return NULL;
+    FILE *f = fopen(path, "re");
+    if (!f)
+        return NULL;
+    while (fgets(line, sizeof(line), f))
+    {
+        char *sp = strchr(line, ' ');
+        if (!sp)
+            continue;
+        *sp = '\0';
+        if (n == cap)
+        {
+            cap = cap ? cap * 2 : 256;
+            char **grown = realloc(names, cap * sizeof(*names));
+            if (!grown)
+                break;
+            names = grown;
+        }
+        if (!(names[n] = strdup(line)))
+            break;
+        n++;
+    }
+    fclose(f);
+    if (n)
+        qsort(names, n, sizeof(*names), name_cmp);
+    *count = n;
+    return names;
+}
+
+/*
+ * Stub module files (same relative paths as modules.dep) carrying only
+ * .modinfo: loaded modules, or all of them with MC_SNAPSHOT_ALL_MODULES.
+ * Returns the number written.
+ */
+static int snap_module_files(const struct snap *s, const char *kver, int flags)
+{
+    char path[SNAP_PATH], src[SNAP_PATH], line[4096];
+    int loaded_count, written = 0;
+    char **loaded = (flags & MC_SNAPSHOT_ALL_MODULES) ? NULL : loaded_names(s, &loaded_count);
+    char *info = malloc(SNAP_MODINFO_MAX);
+
+    FILE *f = NULL;
+    if (info && spath(path, sizeof(path), "%s/lib/modules/%s/modules.dep", s->out, kver) == 0)
+        f = fopen(path, "re");
+    while (f && fgets(line, sizeof(line), f))
+    {
+        char *colon = strchr(line, ':');
+        if (!colon)
+            continue;
+        *colon = '\0';
+
+        if (!(flags & MC_SNAPSHOT_ALL_MODULES))
+        {
+            char name[MC_MODULE_NAME_MAX];
+            const char *base = strrchr(line, '/') ? strrchr(line, '/') + 1 : line;
+            snprintf(name, sizeof(name), "%.*s", (int)strcspn(base, "."), base);
+            for (char *p = name; *p; p++)
+                if (*p == '-')
+                    *p = '_';
+            const char *key = name;
+            if (!loaded || !bsearch(&key, loaded, loaded_count, sizeof(*loaded), name_cmp))
+                continue;
+        }
+
+        if (spath(src, sizeof(src), "%s/lib/modules/%s/%s", s->root, kver, line) != 0 ||
+            spath(path, sizeof(path), "%s/lib/modules/%s/%s", s->out, kver, line) != 0)
+            continue;
+        int len = mc_modinfo_read(src, info, SNAP_MODINFO_MAX);
+        if (len < 0 || len > SNAP_MODINFO_MAX)
+            continue;
+        if (write_modinfo_stub(path, info, len) == 0)
+            written++;
+    }
+    if (f)
+        fclose(f);
+
+    for (int i = 0; loaded && i < loaded_count; i++)
+        free(loaded[i]);
+    free(loaded);
+    free(info);
+    return written;
+}
+
+/*
+ * Capture the context's tree into out_dir, which must not exist or be
+ * empty. Returns the number of devices captured, or -1 with errno set
+ * (EEXIST: out_dir has files in it).
+ */
+int mc_ctx_snapshot(const mc_ctx_t *ctx, const char *out_dir, int flags)
+{
+    struct snap s = { mc_ctx_root(ctx), "", 0 };
+    char path[SNAP_PATH], kver[256];
+
+    if (!out_dir || !out_dir[0])
+    {
+        errno = EINVAL;
+        return -1;
+    }
+    if (spath(path, sizeof(path), "%s", out_dir) != 0 || make_dirs(path) != 0 || !realpath(path, s.out))
+        return -1;
+
+    DIR *d = opendir(s.out);
+    if (!d)
+        return -1;
+    struct dirent *ent;
+    while ((ent = readdir(d)) != NULL)
+    {
+        if (strcmp(ent->d_name, ".") != 0 && strcmp(ent->d_name, "..") != 0)
+        {
+            closedir(d);
+            errno = EEXIST;
+            return -1;
+        }
+    }
+    closedir(d);
+
+    if (mc_ctx_kernel_release(ctx, kver, sizeof(kver)) != 0)
+        return -1;
+
+    // Kernel release and loaded modules
+    FILE *f = NULL;
+    if (spath(path, sizeof(path), "%s/proc/sys/kernel/osrelease", s.out) == 0 && make_parent(path) == 0)
+        f = fopen(path, "we");
+    if (!f)
+        return -1;
+    fprintf(f, "%s\n", kver);
+    fclose(f);
+    snap_copy(&s, "/proc/modules");
+
+    // Devices, drivers and their bindings
+    for (int i = 0; snap_buses[i]; i++)
+        snap_bus(&s, snap_buses[i]);
+    snap_modules_sysfs(&s);
+
+    // depmod output, module metadata and policy
+    for (int i = 0; snap_depmod_files[i]; i++)
+    {
+        if (spath(path, sizeof(path), "/lib/modules/%s/%s", kver, snap_depmod_files[i]) == 0)
+            snap_copy(&s, path);
+    }
+    int stubs = snap_module_files(&s, kver, flags);
+    snap_modprobe_conf(&s);
+    snap_copy(&s, MC_RULES_PATH);
+
+    if (spath(path, sizeof(path), "%s%s", s.out, MC_SNAPSHOT_STAMP) != 0 || !(f = fopen(path, "we")))
+        return -1;
+    fprintf(f, "kernel=%s\ncaptured=%lld\nsource=%s\ndevices=%d\nmodule_files=%d\n",
+            kver, (long long)time(NULL), s.root[0] ? s.root : "/", s.devices, stubs);
+    if (fclose(f) != 0)
+        return -1;
+    return s.devices;
+}
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""
+Print the Auto-Find plan for a device without loading or binding anything.
+
+Usage: autofind_plan.py <syspath> [--all]
+"""
+import os
+import sys
+
+# Use the in-tree montecarlo package and library
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "desktop"))
+os.environ.setdefault("MONTECARLO_DEV", "1")
+
+from montecarlo import autofind
+
+if len(sys.argv) < 2:
+    print(__doc__.strip())
+    sys.exit(1)
+
+sim = autofind.simulate(sys.argv[1])
+print(sim.report(limit=None if "--all" in sys.argv else 20))
+for name, reason in sim.skipped:
+    print(f"  skipped {name}: {reason}")
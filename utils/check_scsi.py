@@ -2,40 +2,23 @@
 """
 Check specific device syspaths to verify they are real devices
 """
-import ctypes
-
-# Load library
 import os
+import sys
 
-# Load library
+# Use the in-tree montecarlo package and library
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-LIB_PATH = os.path.join(BASE_DIR, "libmontecarlo.so")
-lib = ctypes.CDLL(LIB_PATH)
-
-# Define device info struct
-class DeviceInfo(ctypes.Structure):
-    _fields_ = [
-        ("syspath", ctypes.c_char * 256),
-        ("vidpid", ctypes.c_char * 32),
-        ("product", ctypes.c_char * 128),
-        ("driver", ctypes.c_char * 64),
-        ("subsystem", ctypes.c_char * 16),
-    ]
+sys.path.insert(0, os.path.join(BASE_DIR, "desktop"))
+os.environ.setdefault("MONTECARLO_DEV", "1")
 
-# Test: List all devices
-devices = (DeviceInfo * 200)()
-count = lib.mc_list_all_devices(devices, 200)
+import montecarlo
 
 print(f"\n🔍 Checking SCSI device paths:\n")
 
-for i in range(count):
-    dev = devices[i]
-    subsystem = dev.subsystem.decode('utf-8')
-    
-    if subsystem == 'scsi':
-        syspath = dev.syspath.decode('utf-8')
-        product = dev.product.decode('utf-8')
-        driver = dev.driver.decode('utf-8')
+for dev in montecarlo.iter_devices():
+    if dev.subsystem == 'scsi':
+        syspath = dev.syspath
+        product = dev.product
+        driver = dev.driver
         
         print(f"Path: {syspath}")
         print(f"Product: {product}")
@@ -49,3 +32,8 @@ for i in range(count):
 
 print("✅ These are REAL storage devices (disks), not infrastructure!")
 print("   The 'target' in the path is part of the SCSI addressing scheme.")
+
+print(f"\n🚫 SCSI nodes hidden by the filter:\n")
+for dev in montecarlo.iter_explained():
+    if dev.subsystem == 'scsi' and not dev.shown:
+        print(f"   [{dev.reason_name}] {dev.syspath}")
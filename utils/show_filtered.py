@@ -1,53 +1,30 @@
 #!/usr/bin/env python3
 """
-Show what PCI devices were filtered out
+Show what devices were filtered out, and which rule hid each one
 """
-import subprocess
-
-# Get all PCI devices from lspci
-lspci_output = subprocess.check_output(['lspci', '-nn'], text=True)
-all_pci = []
-for line in lspci_output.strip().split('\n'):
-    if line:
-        bus_id = line.split()[0]
-        all_pci.append((bus_id, line))
-
-print(f"🔍 Total PCI devices in system: {len(all_pci)}")
-
-# Get devices shown by Montecarlo
-import ctypes
-
+from collections import Counter
 import os
+import sys
+
+# Use the in-tree montecarlo package and library
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-LIB_PATH = os.path.join(BASE_DIR, "libmontecarlo.so")
-lib = ctypes.CDLL(LIB_PATH)
+sys.path.insert(0, os.path.join(BASE_DIR, "desktop"))
+os.environ.setdefault("MONTECARLO_DEV", "1")
 
-class DeviceInfo(ctypes.Structure):
-    _fields_ = [
-        ("syspath", ctypes.c_char * 256),
-        ("vidpid", ctypes.c_char * 32),
-        ("product", ctypes.c_char * 128),
-        ("driver", ctypes.c_char * 64),
-        ("subsystem", ctypes.c_char * 16),
-    ]
+import montecarlo
 
-devices = (DeviceInfo * 200)()
-count = lib.mc_list_all_devices(devices, 200)
+# One walk gives every device with the filter's decision (no sysfs re-scan, no lspci)
+explained = list(montecarlo.iter_explained())
+hidden = [dev for dev in explained if not dev.shown]
 
-montecarlo_pci = set()
-for i in range(count):
-    dev = devices[i]
-    subsystem = dev.subsystem.decode('utf-8')
-    if subsystem == 'pci':
-        syspath = dev.syspath.decode('utf-8')
-        # Extract bus ID from syspath (e.g., /sys/.../0000:08:00.0)
-        bus_id = syspath.split('/')[-1]
-        montecarlo_pci.add(bus_id)
+print(f"🔍 Devices walked: {len(explained)}")
+print(f"✅ Shown by Montecarlo: {len(explained) - len(hidden)}")
+print(f"❌ Filtered out: {len(hidden)}\n")
 
-print(f"✅ PCI devices shown by Montecarlo: {len(montecarlo_pci)}")
-print(f"❌ PCI devices filtered out: {len(all_pci) - len(montecarlo_pci)}\n")
+for subsystem, n in sorted(Counter(dev.subsystem for dev in hidden).items()):
+    print(f"   {subsystem}: {n}")
 
-print("🚫 Filtered devices (NOT shown in Montecarlo):")
-for bus_id, desc in all_pci:
-    if bus_id not in montecarlo_pci:
-        print(f"   {desc}")
+print("\n🚫 Filtered devices (NOT shown in Montecarlo):")
+for dev in hidden:
+    name = montecarlo.device_name(dev.syspath) or dev.product
+    print(f"   [{dev.reason_name}] {os.path.basename(dev.syspath)} {name} [{dev.vidpid}]")
@@ -1,24 +1,23 @@
-import ctypes
 import os
 import sys
 
 try:
 
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    LIB_PATH = os.path.join(BASE_DIR, "libmontecarlo.so")
-    
-    lib = ctypes.CDLL(LIB_PATH)
+    sys.path.insert(0, os.path.join(BASE_DIR, "desktop"))
+    os.environ.setdefault("MONTECARLO_DEV", "1")
+
+    import montecarlo
+
+    montecarlo.lib()
     print("Library loaded successfully.")
     
     # Test mc_list_candidate_drivers
-    buffer = ctypes.create_string_buffer(256 * 128)
-    count = lib.mc_list_candidate_drivers(buffer, 256)
-    print(f"Candidates found: {count}")
+    candidates = list(montecarlo.iter_candidate_drivers())
+    print(f"Candidates found: {len(candidates)}")
     
-    for i in range(count):
-        offset = i * 128
-        name = buffer[offset:offset+128].split(b'\0', 1)[0]
-        print(f" - {name.decode()}")
+    for name in candidates:
+        print(f" - {name}")
 
 except Exception as e:
     print(f"Failed: {e}")
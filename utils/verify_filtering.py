@@ -2,30 +2,20 @@
 """
 Quick test to verify infrastructure device filtering is working
 """
-import ctypes
-import sys
-
-# Load library
 import os
+import sys
+from collections import Counter
 
-# Load library
+# Use the in-tree montecarlo package and library
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-LIB_PATH = os.path.join(BASE_DIR, "libmontecarlo.so")
-lib = ctypes.CDLL(LIB_PATH)
+sys.path.insert(0, os.path.join(BASE_DIR, "desktop"))
+os.environ.setdefault("MONTECARLO_DEV", "1")
 
-# Define device info struct
-class DeviceInfo(ctypes.Structure):
-    _fields_ = [
-        ("syspath", ctypes.c_char * 256),
-        ("vidpid", ctypes.c_char * 32),
-        ("product", ctypes.c_char * 128),
-        ("driver", ctypes.c_char * 64),
-        ("subsystem", ctypes.c_char * 16),
-    ]
+import montecarlo
 
 # Test: List all devices
-devices = (DeviceInfo * 200)()
-count = lib.mc_list_all_devices(devices, 200)
+devices = montecarlo.list_devices()
+count = len(devices)
 
 print(f"\n✅ Total devices found: {count}\n")
 
@@ -35,12 +25,11 @@ scsi_devices = []
 usb_devices = []
 hid_devices = []
 
-for i in range(count):
-    dev = devices[i]
-    subsystem = dev.subsystem.decode('utf-8')
-    syspath = dev.syspath.decode('utf-8')
-    product = dev.product.decode('utf-8')
-    driver = dev.driver.decode('utf-8')
+for dev in devices:
+    subsystem = dev.subsystem
+    syspath = dev.syspath
+    product = dev.product
+    driver = dev.driver
     
     if subsystem == 'pci':
         pci_devices.append((syspath, product, driver))
@@ -78,4 +67,17 @@ for path, prod, drv in hid_devices[:3]:  # Show first 3
 if len(hid_devices) > 3:
     print(f"   ... and {len(hid_devices) - 3} more")
 
+# Every decision has a reason code: no shown device may carry a hiding one
+explained = list(montecarlo.iter_explained())
+print(f"\n📊 Filter decisions ({len(explained)} devices walked):")
+for reason, n in Counter(dev.reason_name for dev in explained).most_common():
+    print(f"   {reason}: {n}")
+
+shown = {dev.syspath for dev in devices}
+leaked = [dev for dev in explained if not dev.shown and dev.syspath in shown]
+if leaked:
+    for dev in leaked:
+        print(f"   ⚠️  WARNING: {dev.syspath} is shown but was hidden as {dev.reason_name}")
+    sys.exit(1)
+
 print("\n✅ Test complete!")
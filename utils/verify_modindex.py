@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Check that the binary module index matches modaliases like modules.alias does:
+`montecarlo_cli index match` (C) and the Python index reader must find what
+trying every pattern does, for every device modalias and a few fixed cases.
+"""
+import json
+import os
+import subprocess
+import sys
+from fnmatch import fnmatchcase
+
+# Use the in-tree montecarlo package and library
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "desktop"))
+os.environ.setdefault("MONTECARLO_DEV", "1")
+
+import montecarlo
+from montecarlo import modalias, modindex
+
+CLI = os.path.join(BASE_DIR, "montecarlo_cli")
+
+# Patterns whose bus part holds a glob sort away from their bus in the index
+CASES = [
+    "acpi:PNP0C0A:",            # battery: "acpi*:PNP0C0A:*"
+    "acpi:LNXVIDEO:",
+    "char-major-10-229",        # fuse: "char-major-10-229", no bus prefix at all
+    "platform:i8042",
+]
+
+index = modindex.current()
+if index is None:
+    print("❌ No current module index (run: montecarlo_cli index build)")
+    sys.exit(1)
+
+aliases = set(CASES)
+for dev in montecarlo.iter_devices():
+    aliases.add(modalias.device_modalias(dev.syspath))
+aliases.discard(None)
+
+
+def brute_match(alias):
+    """Every modules.alias pattern tried, no bus shortcut: the reference."""
+    return {m.replace("-", "_") for entries in modalias.alias_table().values()
+            for p, m in entries if fnmatchcase(alias, p)}
+
+
+failures = 0
+for alias in sorted(aliases):
+    expected = brute_match(alias)
+    py = {m for m, _ in index.match(alias)}
+    c = set(json.loads(subprocess.run([CLI, "index", "match", alias], capture_output=True,
+                                      text=True).stdout or "[]"))
+    if py != expected or c != expected:
+        failures += 1
+        print(f"❌ {alias}\n   expected: {sorted(expected)}\n   python: {sorted(py)}\n   C: {sorted(c)}")
+    elif alias in CASES:
+        print(f"✅ {alias}: {', '.join(sorted(expected)) or '(none)'}")
+
+print(f"\n{len(aliases)} modaliases checked, {failures} mismatches")
+sys.exit(1 if failures else 0)
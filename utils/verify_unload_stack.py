@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Check the module-stack unload plan: a module bound to the selected device
+whose holders are idle must give a runnable plan (the module itself is a
+confirmation, not a block), while a holder that drives hardware blocks it.
+"""
+import os
+import sys
+
+# Use the in-tree montecarlo package and library
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "desktop"))
+os.environ.setdefault("MONTECARLO_DEV", "1")
+
+from montecarlo import dashboard
+
+
+class FakeGraph:
+    """snd_hda_intel bound to the sound card, held by two idle codec modules."""
+
+    holders_of = {"snd_hda_intel": ["snd_hda_codec_hdmi", "snd_hda_codec_realtek"]}
+    refs = {"snd_hda_intel": 3, "snd_hda_codec_hdmi": 0, "snd_hda_codec_realtek": 0}
+
+    def unload_order(self, module):
+        return self.holders_of.get(module, []) + [module]
+
+    def holders(self, module):
+        return self.holders_of.get(module, [])
+
+    def refcount(self, module):
+        return self.refs.get(module, -1)
+
+
+CARD = ("snd_hda_intel", "/sys/devices/pci0000:00/0000:00:1f.3")
+failures = 0
+
+
+def check(name, ok):
+    global failures
+    print(f"{'✅' if ok else '❌'} {name}")
+    failures += not ok
+
+
+# Bound target, idle holders: runnable, the target's binding comes back for the warning
+plan, blocked, bindings = dashboard.unload_stack_plan(
+    "snd_hda_intel", FakeGraph(), bound_devices=lambda mods: {"snd_hda_intel": [CARD]},
+    unloadable=lambda mod: True)
+check("bound target with idle holders is runnable", not blocked)
+check("plan ends with the target", plan[-1] == "snd_hda_intel" and len(plan) == 3)
+check("target bindings reported", bindings == [CARD])
+
+# A holder bound on another bus (hdaudio) blocks it
+codec = ("snd_hda_codec_realtek", "/sys/devices/pci0000:00/0000:00:1f.3/hdaudioC0D0")
+_, blocked, _ = dashboard.unload_stack_plan(
+    "snd_hda_intel", FakeGraph(),
+    bound_devices=lambda mods: {"snd_hda_intel": [CARD], "snd_hda_codec_realtek": [codec]},
+    unloadable=lambda mod: True)
+check("bound holder blocks the plan", [m for m, _ in blocked] == ["snd_hda_codec_realtek"])
+
+# A protected holder blocks it too
+_, blocked, _ = dashboard.unload_stack_plan(
+    "snd_hda_intel", FakeGraph(), bound_devices=lambda mods: {},
+    unloadable=lambda mod: mod != "snd_hda_codec_hdmi")
+check("protected holder blocks the plan", [m for m, _ in blocked] == ["snd_hda_codec_hdmi"])
+
+print(f"\n{failures} failures")
+sys.exit(1 if failures else 0)